@@ -0,0 +1,186 @@
+"""Benchmark harness for GeneticSchedule.
+
+Generates synthetic faculties at several scales, runs evolve() under fixed seeds and
+reports wall time, generations to convergence, final conflicts, utilization and peak
+memory as JSON, so fitness / operator changes can be compared against a baseline.
+
+Usage (from backend/):
+    python -m app.algorithms.schedule_benchmark --scales small medium --seeds 1 2 3 \
+        --output bench.json [--baseline previous.json]
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..schemas.schedule import ClassroomItem, CourseItem, TeacherItem
+from .schedule_genetic import GeneticSchedule
+
+# name -> (teachers, courses, classrooms)
+SCALES: Dict[str, Tuple[int, int, int]] = {
+    "department": (8, 40, 4),
+    "small": (20, 120, 8),
+    "medium": (60, 400, 20),
+    "university": (200, 1200, 48),
+}
+
+DEFAULT_SEEDS = (1, 2, 3)
+
+
+def generate_faculty(
+    n_teachers: int,
+    n_courses: int,
+    n_classrooms: int,
+    seed: int,
+    required_ratio: float = 0.4,
+    multimedia_ratio: float = 0.5,
+) -> Tuple[List[TeacherItem], List[CourseItem], List[ClassroomItem]]:
+    """Synthetic teachers / courses / classrooms; identical output for the same seed."""
+    rng = random.Random(seed)
+    teachers = [TeacherItem(id=f"T{i:04d}", name=f"教师{i}") for i in range(n_teachers)]
+    # Skewed teaching load: a few teachers carry many sessions, as in real departments
+    weights = [1.0 / (1 + i % 7) for i in range(n_teachers)]
+    courses = [
+        CourseItem(
+            id=i + 1,
+            name=f"课程{i + 1}",
+            teacher_id=rng.choices(teachers, weights=weights)[0].id,
+            is_required=rng.random() < required_ratio,
+        )
+        for i in range(n_courses)
+    ]
+    classrooms = [
+        ClassroomItem(
+            id=1000 + i,
+            name=f"教室{i}",
+            capacity=rng.choice([40, 60, 90, 120]),
+            is_multimedia=rng.random() < multimedia_ratio,
+        )
+        for i in range(n_classrooms)
+    ]
+    return teachers, courses, classrooms
+
+
+def run_case(scale: str, seed: int, delta_fitness: bool = True) -> Dict:
+    """One evolve() run; returns a flat metrics dict."""
+    n_teachers, n_courses, n_classrooms = SCALES[scale]
+    teachers, courses, classrooms = generate_faculty(n_teachers, n_courses, n_classrooms, seed)
+
+    random.seed(seed)
+    np.random.seed(seed)
+    ga = GeneticSchedule(teachers, courses, classrooms)
+    ga.DELTA_FITNESS = delta_fitness
+
+    # Generation at which the best fitness last improved = generations to convergence
+    progress = {"generations": 0, "converged_at": 0, "best": -1.0}
+
+    def on_progress(generation: int, best_stats: dict) -> None:
+        progress["generations"] = generation
+        if best_stats.get("fitness", -1.0) > progress["best"]:
+            progress["best"] = best_stats["fitness"]
+            progress["converged_at"] = generation
+
+    ga.progress_callback = on_progress
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    best, stats = ga.evolve()
+    wall_time = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    placed = int(np.count_nonzero(best)) if best is not None else 0
+    return {
+        "scale": scale,
+        "seed": seed,
+        "teachers": n_teachers,
+        "courses": n_courses,
+        "classrooms": n_classrooms,
+        "wall_time_s": round(wall_time, 4),
+        "generations": progress["generations"],
+        "generations_to_converge": progress["converged_at"],
+        "fitness": round(float(stats["fitness"]), 6),
+        "conflicts": int(stats["conflicts"]),
+        "utilization": round(float(stats["utilization"]), 6),
+        "placed_courses": placed,
+        "peak_memory_mb": round(peak / (1024 * 1024), 3),
+    }
+
+
+def summarize(runs: Sequence[Dict]) -> Dict[str, Dict]:
+    """Per-scale means over seeds."""
+    summary: Dict[str, Dict] = {}
+    keys = ("wall_time_s", "generations_to_converge", "fitness", "conflicts", "utilization", "peak_memory_mb")
+    for scale in dict.fromkeys(r["scale"] for r in runs):
+        rows = [r for r in runs if r["scale"] == scale]
+        summary[scale] = {k: round(float(np.mean([r[k] for r in rows])), 6) for k in keys}
+        summary[scale]["runs"] = len(rows)
+    return summary
+
+
+def run_benchmark(scales: Sequence[str], seeds: Sequence[int], delta_fitness: bool = True) -> Dict:
+    runs = [run_case(scale, seed, delta_fitness) for scale in scales for seed in seeds]
+    return {
+        "benchmark": "schedule_genetic",
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "delta_fitness": delta_fitness,
+        "runs": runs,
+        "summary": summarize(runs),
+    }
+
+
+def compare(baseline: Dict, current: Dict, time_tolerance: float = 0.2) -> List[str]:
+    """Regressions of `current` against `baseline` (matched per scale).
+
+    Quality regressions (more conflicts, lower fitness) are reported on any change; wall
+    time only when slower by more than `time_tolerance` (fractional), since timings are noisy.
+    """
+    regressions: List[str] = []
+    for scale, cur in current.get("summary", {}).items():
+        base = baseline.get("summary", {}).get(scale)
+        if base is None:
+            continue
+        if cur["conflicts"] > base["conflicts"]:
+            regressions.append(f"{scale}: conflicts {base['conflicts']} -> {cur['conflicts']}")
+        if cur["fitness"] < base["fitness"] - 1e-6:
+            regressions.append(f"{scale}: fitness {base['fitness']} -> {cur['fitness']}")
+        if base["wall_time_s"] > 0 and cur["wall_time_s"] > base["wall_time_s"] * (1 + time_tolerance):
+            regressions.append(f"{scale}: wall_time_s {base['wall_time_s']} -> {cur['wall_time_s']}")
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the genetic scheduler on synthetic faculties")
+    parser.add_argument("--scales", nargs="+", choices=sorted(SCALES), default=["department", "small", "medium"])
+    parser.add_argument("--seeds", nargs="+", type=int, default=list(DEFAULT_SEEDS))
+    parser.add_argument("--full-fitness", action="store_true", help="rescore every generation instead of delta fitness")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="previous JSON report; exit 1 if any scale regressed")
+    parser.add_argument("--time-tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.scales, args.seeds, delta_fitness=not args.full_fitness)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.time_tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
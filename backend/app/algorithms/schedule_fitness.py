@@ -0,0 +1,252 @@
+import numpy as np
+from typing import Dict, List, Tuple
+from ..schemas.schedule import CourseItem, ClassroomItem
+
+
+class PopulationFitness:
+    """Vectorized fitness engine for GeneticSchedule.
+
+    A population is scored as one (pop, days, periods, rooms) array of course ids
+    (0 = empty cell). Course -> teacher / is_required lookups are precomputed as
+    vectors indexed by course id so every statistic becomes a gather + bincount.
+    """
+
+    MAX_DAILY_CLASSES = 3
+    SPREAD_DAILY_CLASSES = 2
+
+    def __init__(
+        self,
+        courses: Dict[int, CourseItem],
+        classrooms: Dict[int, ClassroomItem],
+        teacher_ids: List[str],
+        classroom_ids: List[int],
+    ):
+        self.teacher_index = {tid: i for i, tid in enumerate(teacher_ids)}
+        self.n_teachers = len(teacher_ids)
+
+        size = max(courses) + 1 if courses else 1
+        # Empty cells (course id 0) map to a sentinel teacher column that is dropped after counting
+        self.course_teacher = np.full(size, self.n_teachers, dtype=np.int64)
+        self.course_required = np.zeros(size, dtype=bool)
+        for course_id, course in courses.items():
+            self.course_teacher[course_id] = self.teacher_index[course.teacher_id]
+            self.course_required[course_id] = bool(course.is_required)
+
+        self.room_multimedia = np.array(
+            [bool(classrooms[c_id].is_multimedia) for c_id in classroom_ids], dtype=bool
+        )
+        self.required_count = int(sum(1 for c in courses.values() if c.is_required))
+
+    def teacher_slot_counts(self, population: np.ndarray) -> np.ndarray:
+        """Number of classes per (individual, day, period, teacher)."""
+        n, days, periods, _ = population.shape
+        width = self.n_teachers + 1
+        teacher_cells = self.course_teacher[population]
+        offsets = (np.arange(n * days * periods, dtype=np.int64) * width).reshape(n, days, periods, 1)
+        counts = np.bincount((offsets + teacher_cells).ravel(), minlength=n * days * periods * width)
+        return counts.reshape(n, days, periods, width)[..., : self.n_teachers]
+
+    def evaluate(self, population: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return (fitness, conflicts, utilization) vectors, one entry per individual."""
+        population = np.asarray(population)
+        if population.ndim == 3:
+            population = population[np.newaxis]
+        n, days, periods, rooms = population.shape
+
+        total_slots = days * periods * rooms
+        used_slots = np.count_nonzero(population.reshape(n, -1), axis=1)
+        if total_slots > 0:
+            utilization = used_slots / total_slots
+        else:
+            utilization = np.zeros(n)
+
+        # Teacher double-bookings: every class beyond the first in the same (day, period)
+        counts = self.teacher_slot_counts(population)
+        conflicts = np.maximum(counts - 1, 0).sum(axis=(1, 2, 3))
+
+        # Per-day load: exceeding the daily cap is penalized, light days earn a spread bonus
+        daily = counts.sum(axis=2)
+        conflicts = conflicts + np.maximum(daily - self.MAX_DAILY_CLASSES, 0).sum(axis=(1, 2))
+        spread = np.count_nonzero(daily <= self.SPREAD_DAILY_CLASSES, axis=(1, 2))
+
+        multimedia_hits = np.count_nonzero(
+            (self.course_required[population] & self.room_multimedia).reshape(n, -1), axis=1
+        )
+        if self.required_count > 0:
+            multimedia_rate = multimedia_hits / self.required_count
+        else:
+            multimedia_rate = np.ones(n)
+
+        fitness = 1.0 / (conflicts + 1.0) + (utilization * 0.3) + (multimedia_rate * 0.2) + (spread * 0.05)
+        return fitness, conflicts, utilization
+
+
+class IncrementalFitness:
+    """Cached aggregates for one individual, updated in O(changed cells) per operator.
+
+    Keeps per-(teacher, day, period) occupancy, per-(teacher, day) load, and per-day
+    conflict / spread / multimedia / used-slot totals, so a cell swap (mutation) or a
+    day-range exchange (crossover) can be scored without rescanning the timetable.
+    Every statistic is separable by day, which is what makes crossover cheap.
+    """
+
+    def __init__(self, engine: PopulationFitness, individual: np.ndarray):
+        self.engine = engine
+        self.grid = individual
+        days, periods, rooms = individual.shape
+        self.total_slots = days * periods * rooms
+
+        self.slot_counts = engine.teacher_slot_counts(individual[np.newaxis])[0].transpose(2, 0, 1).copy()
+        self.daily = self.slot_counts.sum(axis=2)
+        self.day_conflicts = (
+            np.maximum(self.slot_counts - 1, 0).sum(axis=(0, 2))
+            + np.maximum(self.daily - engine.MAX_DAILY_CLASSES, 0).sum(axis=0)
+        ).tolist()
+        self.day_spread = np.count_nonzero(self.daily <= engine.SPREAD_DAILY_CLASSES, axis=0).tolist()
+        self.day_multimedia = np.count_nonzero(
+            engine.course_required[individual] & engine.room_multimedia, axis=(1, 2)
+        ).tolist()
+        self.day_used = np.count_nonzero(individual, axis=(1, 2)).tolist()
+        self._refresh_totals()
+        # Upper bound of the soft score, used to keep it strictly below one conflict in cost()
+        self.max_soft = 0.2 + self.daily.size * 0.05
+
+    def _refresh_totals(self) -> None:
+        self.conflicts = sum(self.day_conflicts)
+        self.spread = sum(self.day_spread)
+        self.multimedia_hits = sum(self.day_multimedia)
+        self.used_slots = sum(self.day_used)
+
+    def copy(self) -> "IncrementalFitness":
+        clone = object.__new__(IncrementalFitness)
+        clone.__dict__.update(self.__dict__)
+        clone.grid = self.grid.copy()
+        clone.slot_counts = self.slot_counts.copy()
+        clone.daily = self.daily.copy()
+        clone.day_conflicts = list(self.day_conflicts)
+        clone.day_spread = list(self.day_spread)
+        clone.day_multimedia = list(self.day_multimedia)
+        clone.day_used = list(self.day_used)
+        return clone
+
+    def crossover(self, other: "IncrementalFitness", day_start: int, day_end: int) -> "IncrementalFitness":
+        """Child taking days [day_start, day_end) from `other` and the rest from self."""
+        child = self.copy()
+        days = slice(day_start, day_end)
+        child.grid[days] = other.grid[days]
+        child.slot_counts[:, days] = other.slot_counts[:, days]
+        child.daily[:, days] = other.daily[:, days]
+        child.day_conflicts[days] = other.day_conflicts[days]
+        child.day_spread[days] = other.day_spread[days]
+        child.day_multimedia[days] = other.day_multimedia[days]
+        child.day_used[days] = other.day_used[days]
+        child._refresh_totals()
+        return child
+
+    def _shift(self, course_id: int, cell, delta: int) -> None:
+        d, p, r = cell
+        teacher = self.engine.course_teacher[course_id]
+        before = int(self.slot_counts[teacher, d, p])
+        self.slot_counts[teacher, d, p] = before + delta
+        change = max(before + delta - 1, 0) - max(before - 1, 0)
+
+        before = int(self.daily[teacher, d])
+        self.daily[teacher, d] = before + delta
+        cap = self.engine.MAX_DAILY_CLASSES
+        change += max(before + delta - cap, 0) - max(before - cap, 0)
+        self.day_conflicts[d] += change
+        self.conflicts += change
+
+        spread_cap = self.engine.SPREAD_DAILY_CLASSES
+        change = int(before + delta <= spread_cap) - int(before <= spread_cap)
+        self.day_spread[d] += change
+        self.spread += change
+
+        if self.engine.course_required[course_id] and self.engine.room_multimedia[r]:
+            self.day_multimedia[d] += delta
+            self.multimedia_hits += delta
+
+        self.day_used[d] += delta
+        self.used_slots += delta
+
+    def place(self, cell, course_id: int) -> None:
+        """Overwrite one cell (either side may be empty)."""
+        cell = tuple(int(x) for x in cell)
+        current = int(self.grid[cell])
+        if current == course_id:
+            return
+        if current:
+            self._shift(current, cell, -1)
+        if course_id:
+            self._shift(course_id, cell, 1)
+        self.grid[cell] = course_id
+
+    def swap(self, a, b) -> None:
+        a = tuple(int(x) for x in a)
+        b = tuple(int(x) for x in b)
+        course_a, course_b = int(self.grid[a]), int(self.grid[b])
+        if course_a == course_b:
+            return
+        self.place(a, 0)
+        self.place(b, course_a)
+        self.place(a, course_b)
+
+    def load(self, grid: np.ndarray) -> None:
+        """Bring the state to `grid`, touching only the cells that differ."""
+        for cell in np.argwhere(self.grid != grid):
+            self.place(cell, 0)
+        for cell in np.argwhere(self.grid != grid):
+            self.place(cell, int(grid[tuple(cell)]))
+
+    def soft_score(self) -> float:
+        if self.engine.required_count > 0:
+            multimedia_rate = self.multimedia_hits / self.engine.required_count
+        else:
+            multimedia_rate = 1.0
+        return multimedia_rate * 0.2 + self.spread * 0.05
+
+    def cost(self) -> float:
+        # Conflicts dominate; the soft score only breaks ties between equal conflict counts
+        return self.conflicts - self.soft_score() / (self.max_soft + 1.0)
+
+    def swap_delta(self, a, b) -> float:
+        """Cost change of swapping cells a and b, leaving the state untouched."""
+        before = self.cost()
+        self.swap(a, b)
+        after = self.cost()
+        self.swap(a, b)
+        return after - before
+
+    def fitness(self) -> Tuple[float, int, float]:
+        utilization = self.used_slots / self.total_slots if self.total_slots > 0 else 0.0
+        if self.engine.required_count > 0:
+            multimedia_rate = self.multimedia_hits / self.engine.required_count
+        else:
+            multimedia_rate = 1.0
+        fitness = 1.0 / (self.conflicts + 1.0) + utilization * 0.3 + multimedia_rate * 0.2 + self.spread * 0.05
+        return float(fitness), int(self.conflicts), float(utilization)
+
+    def feasible_targets(self, cell, movable: np.ndarray) -> np.ndarray:
+        """Movable cells whose (day, period) the class at `cell` could take without its
+        teacher being double-booked or exceeding the daily cap."""
+        d, p, _ = (int(x) for x in cell)
+        teacher = self.engine.course_teacher[self.grid[d, p, _]]
+        if teacher >= self.engine.n_teachers:
+            return np.argwhere(movable)
+        slot_free = self.slot_counts[teacher] == 0
+        slot_free[d, p] = True
+        day_ok = self.daily[teacher] < self.engine.MAX_DAILY_CLASSES
+        day_ok[d] = True
+        return np.argwhere(movable & (slot_free & day_ok[:, np.newaxis])[:, :, np.newaxis])
+
+    def conflict_cells(self) -> np.ndarray:
+        """Occupied cells whose teacher is double-booked or over the daily cap."""
+        occupied = self.grid > 0
+        if self.engine.n_teachers == 0 or not occupied.any():
+            return np.empty((0, 3), dtype=int)
+        teachers = self.engine.course_teacher[self.grid]
+        d_idx, p_idx, _ = np.indices(self.grid.shape)
+        t_idx = np.where(occupied, teachers, 0)
+        double_booked = self.slot_counts[t_idx, d_idx, p_idx] > 1
+        overloaded = self.daily[t_idx, d_idx] > self.engine.MAX_DAILY_CLASSES
+        return np.argwhere(occupied & (double_booked | overloaded))
@@ -3,6 +3,7 @@ import random
 import pandas as pd
 from typing import List, Dict, Tuple
 from ..schemas.schedule import TeacherItem, CourseItem, ClassroomItem
+from .schedule_fitness import IncrementalFitness, PopulationFitness
 
 class GeneticSchedule:
     def __init__(self, teachers: List[TeacherItem], courses: List[CourseItem], classrooms: List[ClassroomItem]):
@@ -28,17 +29,35 @@ class GeneticSchedule:
         self.MAX_GENERATIONS = 80
         self.STAGNATION_LIMIT = 15
         self.MUTATION_RATE = 0.03
+        # Score children incrementally from cached per-individual aggregates instead of a full pass
+        self.DELTA_FITNESS = True
         
         # Mappings for array indices
         self.c_id_to_idx = {cid: i for i, cid in enumerate(self.classroom_ids)}
         self.idx_to_c_id = {i: cid for cid, i in self.c_id_to_idx.items()}
 
+        # Optional hook called as progress_callback(generation, best_stats); may raise to abort
+        self.progress_callback = None
+
+        # Warm start (see apply_warm_start): seeded base timetable, cells the GA must not touch,
+        # and the courses that still need a slot
+        self.warm_start_entries = None
+        self.warm_base = None
+        self.pinned_mask = None
+        self.delta_course_ids = list(self.course_ids)
+
+        self.fitness_engine = PopulationFitness(self.courses, self.classrooms, self.teacher_ids, self.classroom_ids)
+
     def create_individual(self) -> np.ndarray:
         # Schedule: [day][period][classroom_idx] = course_id (0 if empty)
         # We need to place all courses. 
         # Assumption: Each item in self.courses is a single session to be scheduled.
         
-        schedule = np.zeros((self.DAYS, self.PERIODS, len(self.classrooms)), dtype=int)
+        # Warm start: begin from the seeded timetable and only place the delta courses
+        if self.warm_base is not None:
+            schedule = self.warm_base.copy()
+        else:
+            schedule = np.zeros((self.DAYS, self.PERIODS, len(self.classrooms)), dtype=int)
         
         # Randomly assign each course to a (day, period, classroom)
         # Try to respect hard constraints during initialization if possible, or just random
@@ -50,16 +69,20 @@ class GeneticSchedule:
         for d in range(self.DAYS):
             for p in range(self.PERIODS):
                 for c_idx in range(len(self.classrooms)):
-                    available_slots.append((d, p, c_idx))
+                    if schedule[d, p, c_idx] == 0:
+                        available_slots.append((d, p, c_idx))
         
         random.shuffle(available_slots)
         
         # Track teacher availability to avoid immediate conflicts if possible
         # teacher_schedule[teacher_id][day][period] = True
         teacher_availability = {tid: np.zeros((self.DAYS, self.PERIODS), dtype=bool) for tid in self.teacher_ids}
+        for d, p, c_idx in np.argwhere(schedule > 0):
+            teacher_availability[self.courses[schedule[d, p, c_idx]].teacher_id][d, p] = True
         
         slot_idx = 0
-        for course_id, course in self.courses.items():
+        for course_id in self.delta_course_ids:
+            course = self.courses[course_id]
             placed = False
             while slot_idx < len(available_slots):
                 d, p, c_idx = available_slots[slot_idx]
@@ -93,161 +116,193 @@ class GeneticSchedule:
                 
         return schedule
 
-    def calc_fitness(self, individual: np.ndarray) -> float:
-        conflicts = 0
-        utilization_score = 0
-        multimedia_score = 0
-        teacher_spread_score = 0
-        
-        # 1. Conflicts & Teacher Constraints
-        teacher_daily_counts = {tid: np.zeros(self.DAYS) for tid in self.teacher_ids}
-        teacher_schedule = {tid: set() for tid in self.teacher_ids} # Set of (day, period)
-        
-        total_slots = self.DAYS * self.PERIODS * len(self.classrooms)
-        used_slots = 0
-        
-        for d in range(self.DAYS):
-            for p in range(self.PERIODS):
-                for c_idx in range(len(self.classrooms)):
-                    course_id = individual[d, p, c_idx]
-                    if course_id == 0:
-                        continue
-                    
-                    used_slots += 1
-                    course = self.courses[course_id]
-                    tid = course.teacher_id
-                    
-                    # Teacher Conflict
-                    if (d, p) in teacher_schedule[tid]:
-                        conflicts += 1
-                    else:
-                        teacher_schedule[tid].add((d, p))
-                    
-                    teacher_daily_counts[tid][d] += 1
-                    
-                    # Multimedia Constraint
-                    c_id = self.idx_to_c_id[c_idx]
-                    classroom = self.classrooms[c_id]
-                    if course.is_required:
-                        if classroom.is_multimedia:
-                            multimedia_score += 1
-                        else:
-                            # Penalty or just lack of reward?
-                            pass
-        
-        # Teacher Max Classes per Day (>3 is hard constraint violation?)
-        # Prompt: "8 teachers (max 3 classes/day)"
-        for tid, counts in teacher_daily_counts.items():
-            for d in range(self.DAYS):
-                if counts[d] > 3:
-                    conflicts += (counts[d] - 3) # Penalty for exceeding
-                elif counts[d] <= 2:
-                    teacher_spread_score += 1 # Bonus for spread
-        
-        # Utilization
-        utilization = used_slots / total_slots if total_slots > 0 else 0
-        
-        # Multimedia Rate
-        required_courses_count = sum(1 for c in self.courses.values() if c.is_required)
-        multimedia_rate = multimedia_score / required_courses_count if required_courses_count > 0 else 1.0
-        
-        # Fitness Function
-        # fitness = 1/(conflicts + 1) + utilization*0.3 + multimedia_rate*0.2
-        # We can add teacher spread to this
-        
-        fitness = 1.0 / (conflicts + 1.0) + (utilization * 0.3) + (multimedia_rate * 0.2) + (teacher_spread_score * 0.05)
-        
-        return fitness, conflicts, utilization
+    def apply_warm_start(self, entries: List[Dict]):
+        # Seed every individual from an existing timetable.
+        # entries: dicts with course_id / classroom_id / day / period / pinned. Pinned cells are never
+        # moved by mutation; entries that no longer fit (removed course, unavailable classroom,
+        # occupied cell, teacher clash) are dropped so their course joins the delta to re-place.
+        base = np.zeros((self.DAYS, self.PERIODS, len(self.classrooms)), dtype=int)
+        pinned = np.zeros(base.shape, dtype=bool)
+        teacher_busy = set()
+        placed = set()
+        for entry in entries:
+            course_id = int(entry["course_id"])
+            c_idx = self.c_id_to_idx.get(int(entry["classroom_id"]))
+            d, p = int(entry["day"]), int(entry["period"])
+            course = self.courses.get(course_id)
+            if course is None or c_idx is None or course_id in placed:
+                continue
+            if not (0 <= d < self.DAYS and 0 <= p < self.PERIODS) or base[d, p, c_idx] != 0:
+                continue
+            if (course.teacher_id, d, p) in teacher_busy:
+                continue
+            base[d, p, c_idx] = course_id
+            pinned[d, p, c_idx] = bool(entry.get("pinned", True))
+            teacher_busy.add((course.teacher_id, d, p))
+            placed.add(course_id)
 
-    def crossover(self, parent1: np.ndarray, parent2: np.ndarray) -> np.ndarray:
+        self.warm_start_entries = list(entries)
+        self.warm_base = base
+        self.pinned_mask = pinned
+        self.delta_course_ids = [cid for cid in self.course_ids if cid not in placed]
+
+    def calc_fitness(self, individual: np.ndarray) -> Tuple[float, int, float]:
+        fitness, conflicts, utilization = self.fitness_engine.evaluate(individual[np.newaxis])
+        return float(fitness[0]), int(conflicts[0]), float(utilization[0])
+
+    def calc_population_fitness(self, population: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Score the whole (pop, days, periods, rooms) stack in one vectorized pass
+        return self.fitness_engine.evaluate(population)
+
+    def crossover_points(self) -> Tuple[int, int]:
         # Two-point crossover on Days
-        # Swap days between parents
         point1 = random.randint(0, self.DAYS - 2)
         point2 = random.randint(point1 + 1, self.DAYS - 1)
+        return point1, point2
+
+    def crossover(self, parent1: np.ndarray, parent2: np.ndarray) -> np.ndarray:
+        # Swap days between parents
+        point1, point2 = self.crossover_points()
         
         child = parent1.copy()
         child[point1:point2, :, :] = parent2[point1:point2, :, :]
         
         return child
 
-    def mutation(self, individual: np.ndarray) -> np.ndarray:
-        # Randomly move a course to another slot
+    def mutation_move(self, individual: np.ndarray):
+        # Pick the (from, to) cells of a mutation swap, or None when this child is not mutated
         if random.random() < self.MUTATION_RATE:
             # Pick a random course instance from the schedule
             # Find all non-zero slots
-            occupied_indices = np.argwhere(individual > 0)
+            # Pinned (warm-start) cells are neither moved nor used as swap targets
+            movable = individual > 0
+            if self.pinned_mask is not None:
+                movable &= ~self.pinned_mask
+            occupied_indices = np.argwhere(movable)
             if len(occupied_indices) > 0:
                 idx = random.choice(occupied_indices)
                 d_from, p_from, c_from = idx
-                course_id = individual[d_from, p_from, c_from]
                 
                 # Pick a random target slot
-                d_to = random.randint(0, self.DAYS - 1)
-                p_to = random.randint(0, self.PERIODS - 1)
-                c_to = random.randint(0, len(self.classrooms) - 1)
-                
-                # Swap or Move
-                target_course_id = individual[d_to, p_to, c_to]
-                
-                individual[d_to, p_to, c_to] = course_id
-                individual[d_from, p_from, c_from] = target_course_id
-                
+                if self.pinned_mask is not None:
+                    d_to, p_to, c_to = random.choice(np.argwhere(~self.pinned_mask))
+                else:
+                    d_to = random.randint(0, self.DAYS - 1)
+                    p_to = random.randint(0, self.PERIODS - 1)
+                    c_to = random.randint(0, len(self.classrooms) - 1)
+                return (d_from, p_from, c_from), (d_to, p_to, c_to)
+        return None
+
+    def mutation(self, individual: np.ndarray) -> np.ndarray:
+        # Randomly move a course to another slot (swap or move)
+        move = self.mutation_move(individual)
+        if move:
+            cell_from, cell_to = move
+            individual[cell_from], individual[cell_to] = individual[cell_to], individual[cell_from]
         return individual
 
-    def evolve(self):
-        population = [self.create_individual() for _ in range(self.POPULATION_SIZE)]
-        best_fitness = -1
-        stagnation_counter = 0
-        best_individual = None
-        best_stats = {}
+    def breed(self, population: np.ndarray, fitness_values: np.ndarray, elite: np.ndarray) -> np.ndarray:
+        # Selection (Roulette Wheel)
+        probs = fitness_values / fitness_values.sum()
         
-        for generation in range(self.MAX_GENERATIONS):
-            # Calculate fitness
-            fitness_results = [self.calc_fitness(ind) for ind in population]
-            # fitness_results is list of (fitness, conflicts, utilization)
+        # Create next generation
+        new_population = []
+        
+        # Elitism: Keep best
+        new_population.append(elite.copy())
+        
+        while len(new_population) < len(population):
+            # Select 2 parents
+            parents_indices = np.random.choice(len(population), size=2, p=probs)
+            parent1 = population[parents_indices[0]]
+            parent2 = population[parents_indices[1]]
             
-            current_best_idx = np.argmax([f[0] for f in fitness_results])
-            current_best_fitness = fitness_results[current_best_idx][0]
-            current_best_ind = population[current_best_idx]
+            child = self.crossover(parent1, parent2)
+            child = self.mutation(child)
+            new_population.append(child)
+        
+        return np.stack(new_population)
+
+    def breed_states(self, states: List[IncrementalFitness], fitness_values: np.ndarray, elite: IncrementalFitness) -> List[IncrementalFitness]:
+        # Same operators as breed(), applied to cached aggregates so children are scored
+        # in O(changed cells): crossover copies per-day aggregates, mutation is one swap
+        probs = fitness_values / fitness_values.sum()
+        new_states = [elite.copy()]
+        while len(new_states) < len(states):
+            parents_indices = np.random.choice(len(states), size=2, p=probs)
+            point1, point2 = self.crossover_points()
+            child = states[parents_indices[0]].crossover(states[parents_indices[1]], point1, point2)
+            move = self.mutation_move(child.grid)
+            if move:
+                child.swap(*move)
+            new_states.append(child)
+        return new_states
+
+    def run_generations(self, population: np.ndarray, generations: int, best_individual=None, best_stats=None, stagnation_counter: int = 0):
+        # Evolve `population` for up to `generations` steps, carrying the running best and
+        # stagnation state so callers (e.g. island epochs) can resume where they left off.
+        # Returns (population, best_individual, best_stats, stagnation_counter).
+        best_stats = dict(best_stats or {})
+        best_fitness = best_stats.get("fitness", -1)
+        
+        # Delta mode: score each generation from per-individual cached aggregates
+        states = None
+        best_state = None
+        if self.DELTA_FITNESS:
+            states = [IncrementalFitness(self.fitness_engine, ind.copy()) for ind in population]
+            if best_individual is not None:
+                best_state = IncrementalFitness(self.fitness_engine, best_individual.copy())
+        
+        for generation in range(generations):
+            # Calculate fitness for the whole population at once
+            if states is not None:
+                scores = [state.fitness() for state in states]
+                fitness_values = np.array([f[0] for f in scores])
+                conflict_values = [f[1] for f in scores]
+                utilization_values = [f[2] for f in scores]
+            else:
+                fitness_values, conflict_values, utilization_values = self.calc_population_fitness(population)
+            
+            current_best_idx = int(np.argmax(fitness_values))
+            current_best_fitness = float(fitness_values[current_best_idx])
             
             if current_best_fitness > best_fitness:
                 best_fitness = current_best_fitness
-                best_individual = current_best_ind.copy()
+                if states is not None:
+                    best_state = states[current_best_idx].copy()
+                    best_individual = best_state.grid.copy()
+                else:
+                    best_individual = population[current_best_idx].copy()
                 best_stats = {
-                    "fitness": fitness_results[current_best_idx][0],
-                    "conflicts": fitness_results[current_best_idx][1],
-                    "utilization": fitness_results[current_best_idx][2]
+                    "fitness": current_best_fitness,
+                    "conflicts": int(conflict_values[current_best_idx]),
+                    "utilization": float(utilization_values[current_best_idx])
                 }
                 stagnation_counter = 0
             else:
                 stagnation_counter += 1
             
+            if self.progress_callback:
+                self.progress_callback(generation + 1, best_stats)
+            
             if stagnation_counter >= self.STAGNATION_LIMIT:
                 break
             
-            # Selection (Roulette Wheel)
-            fitness_values = [f[0] for f in fitness_results]
-            total_fitness = sum(fitness_values)
-            probs = [f/total_fitness for f in fitness_values]
-            
-            # Create next generation
-            new_population = []
-            
-            # Elitism: Keep best
-            new_population.append(best_individual.copy())
-            
-            while len(new_population) < self.POPULATION_SIZE:
-                # Select 2 parents
-                parents_indices = np.random.choice(len(population), size=2, p=probs)
-                parent1 = population[parents_indices[0]]
-                parent2 = population[parents_indices[1]]
-                
-                child = self.crossover(parent1, parent2)
-                child = self.mutation(child)
-                new_population.append(child)
-            
-            population = new_population
-            
+            if states is not None:
+                states = self.breed_states(states, fitness_values, best_state)
+            else:
+                population = self.breed(population, fitness_values, best_individual)
+        
+        if states is not None:
+            population = np.stack([state.grid for state in states])
+        return population, best_individual, best_stats, stagnation_counter
+
+    def create_population(self, size: int | None = None) -> np.ndarray:
+        return np.stack([self.create_individual() for _ in range(size or self.POPULATION_SIZE)])
+
+    def evolve(self):
+        population = self.create_population()
+        _, best_individual, best_stats, _ = self.run_generations(population, self.MAX_GENERATIONS)
         return best_individual, best_stats
 
     def format_result(self, schedule: np.ndarray):
@@ -0,0 +1,110 @@
+import os
+import random
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from .schedule_genetic import GeneticSchedule
+
+# GA settings copied onto every worker's GeneticSchedule so islands evolve with the caller's tuning
+_GA_SETTINGS = ("DAYS", "PERIODS", "POPULATION_SIZE", "MAX_GENERATIONS", "STAGNATION_LIMIT", "MUTATION_RATE", "DELTA_FITNESS")
+
+_worker_ga: Optional[GeneticSchedule] = None
+
+
+def _init_worker(teachers, courses, classrooms, settings: Dict[str, float], warm_start_entries=None):
+    # Runs once per pool process; islands are then shipped as plain arrays
+    global _worker_ga
+    _worker_ga = GeneticSchedule(teachers, courses, classrooms)
+    for name, value in settings.items():
+        setattr(_worker_ga, name, value)
+    if warm_start_entries is not None:
+        _worker_ga.apply_warm_start(warm_start_entries)
+
+
+def _run_island_epoch(population, generations, best_individual, best_stats, stagnation_counter, seed):
+    # Forked workers inherit identical RNG state, so every epoch is reseeded explicitly
+    random.seed(seed)
+    np.random.seed(seed % (2 ** 32))
+    if population is None:
+        population = _worker_ga.create_population()
+    return _worker_ga.run_generations(population, generations, best_individual, best_stats, stagnation_counter)
+
+
+class IslandSchedule:
+    """Island-model wrapper around GeneticSchedule.
+
+    Each island is an independent sub-population evolved in a process pool. Every
+    MIGRATION_INTERVAL generations the best MIGRATION_SIZE individuals of island i
+    replace the worst ones of island i+1 (ring topology). The global best is returned
+    in the same (best_individual, stats) shape as GeneticSchedule.evolve().
+    """
+
+    MIGRATION_INTERVAL = 10
+    MIGRATION_SIZE = 2
+
+    def __init__(self, ga: GeneticSchedule, island_count: int, max_workers: Optional[int] = None, seed: Optional[int] = None):
+        self.ga = ga
+        self.island_count = max(1, int(island_count))
+        self.max_workers = max_workers or min(self.island_count, os.cpu_count() or 1)
+        self.seed = seed if seed is not None else random.randrange(2 ** 31)
+
+    def migrate(self, populations: List[np.ndarray]) -> List[np.ndarray]:
+        if len(populations) < 2:
+            return populations
+        size = min(self.MIGRATION_SIZE, len(populations[0]) - 1)
+        if size <= 0:
+            return populations
+        fitness = [self.ga.calc_population_fitness(pop)[0] for pop in populations]
+        emigrants = [pop[np.argsort(f)[-size:]].copy() for pop, f in zip(populations, fitness)]
+        migrated = []
+        for i, pop in enumerate(populations):
+            pop = pop.copy()
+            worst = np.argsort(fitness[i])[:size]
+            pop[worst] = emigrants[i - 1]
+            migrated.append(pop)
+        return migrated
+
+    def evolve(self) -> Tuple[Optional[np.ndarray], Dict[str, float]]:
+        if self.island_count == 1:
+            return self.ga.evolve()
+
+        ga = self.ga
+        settings = {name: getattr(ga, name) for name in _GA_SETTINGS}
+        init_args = (
+            list(ga.teachers.values()),
+            list(ga.courses.values()),
+            list(ga.classrooms.values()),
+            settings,
+            ga.warm_start_entries,
+        )
+        rng = random.Random(self.seed)
+
+        populations: List[Optional[np.ndarray]] = [None] * self.island_count
+        bests: List[Optional[np.ndarray]] = [None] * self.island_count
+        stats: List[Dict[str, float]] = [{} for _ in range(self.island_count)]
+        stagnation = [0] * self.island_count
+
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker, initargs=init_args) as pool:
+            generation = 0
+            while generation < ga.MAX_GENERATIONS:
+                epoch = min(self.MIGRATION_INTERVAL, ga.MAX_GENERATIONS - generation)
+                futures = [
+                    pool.submit(_run_island_epoch, populations[i], epoch, bests[i], stats[i], stagnation[i], rng.randrange(2 ** 31))
+                    for i in range(self.island_count)
+                ]
+                for i, future in enumerate(futures):
+                    populations[i], bests[i], stats[i], stagnation[i] = future.result()
+                generation += epoch
+                if ga.progress_callback:
+                    leader = max(range(self.island_count), key=lambda i: stats[i].get("fitness", -1))
+                    ga.progress_callback(generation, stats[leader])
+
+                # Stop once every island has stagnated; migration would only reshuffle converged pools
+                if all(s >= ga.STAGNATION_LIMIT for s in stagnation):
+                    break
+                populations = self.migrate(populations)
+                # Migrants can lift an island's best, so its stagnation clock restarts
+                stagnation = [0 if s >= ga.STAGNATION_LIMIT else s for s in stagnation]
+
+        best_idx = max(range(self.island_count), key=lambda i: stats[i].get("fitness", -1))
+        return bests[best_idx], stats[best_idx]
@@ -0,0 +1,175 @@
+import math
+import random
+from abc import ABC, abstractmethod
+import numpy as np
+from typing import Dict, Optional, Sequence, Tuple
+from .schedule_fitness import IncrementalFitness
+
+
+class PostOptimizer(ABC):
+    """A post-GA stage that improves one timetable in place.
+
+    Stages work on an IncrementalFitness state, so every candidate swap is scored
+    with an O(1) delta instead of a full fitness pass. Pinned (warm-start) cells
+    are never moved.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def optimize(self, state: IncrementalFitness, movable: np.ndarray) -> None:
+        """Improve the timetable held by ``state``; only cells where ``movable`` is True may change."""
+
+
+def _candidate_targets(state: IncrementalFitness, cell, movable: np.ndarray, sample_size: int) -> np.ndarray:
+    # Prefer cells where the class's teacher is free; fall back to any movable cell
+    targets = state.feasible_targets(cell, movable)
+    if len(targets) == 0:
+        targets = np.argwhere(movable)
+    if len(targets) > sample_size:
+        targets = targets[np.random.choice(len(targets), sample_size, replace=False)]
+    return targets
+
+
+def _best_swap(state: IncrementalFitness, cell, candidates: np.ndarray, tabu: Optional[Dict] = None, iteration: int = 0, aspiration: float = math.inf) -> Tuple[Optional[tuple], float]:
+    best_target, best_delta = None, math.inf
+    course_id = int(state.grid[tuple(cell)])
+    current_cost = state.cost()
+    for target in candidates:
+        target = tuple(int(x) for x in target)
+        if target == tuple(cell):
+            continue
+        delta = state.swap_delta(cell, target)
+        if tabu is not None and tabu.get((course_id, target), -1) >= iteration and current_cost + delta >= aspiration:
+            continue
+        if delta < best_delta:
+            best_target, best_delta = target, delta
+    return best_target, best_delta
+
+
+class GreedyRepair(PostOptimizer):
+    """Move each conflicting class to the free-or-swappable cell that lowers cost most."""
+
+    name = "repair"
+
+    def __init__(self, max_passes: int = 5, sample_size: int = 64):
+        self.max_passes = max_passes
+        self.sample_size = sample_size
+
+    def optimize(self, state: IncrementalFitness, movable: np.ndarray) -> None:
+        for _ in range(self.max_passes):
+            improved = False
+            cells = [c for c in state.conflict_cells() if movable[tuple(c)]]
+            random.shuffle(cells)
+            for cell in cells:
+                if state.conflicts == 0:
+                    return
+                # An earlier move in this pass may already have resolved this cell
+                if not state.grid[tuple(cell)]:
+                    continue
+                target, delta = _best_swap(state, cell, _candidate_targets(state, cell, movable, self.sample_size))
+                if target is not None and delta < -1e-12:
+                    state.swap(cell, target)
+                    improved = True
+            if not improved:
+                return
+
+
+class TabuSearch(PostOptimizer):
+    """Tabu search over the conflict set: the best non-tabu swap is always taken,
+    and a class may not return to a cell it just left for `tenure` iterations."""
+
+    name = "tabu"
+
+    def __init__(self, iterations: int = 300, tenure: int = 12, sample_size: int = 48):
+        self.iterations = iterations
+        self.tenure = tenure
+        self.sample_size = sample_size
+
+    def optimize(self, state: IncrementalFitness, movable: np.ndarray) -> None:
+        candidates = np.argwhere(movable)
+        if len(candidates) < 2:
+            return
+        best_cost = state.cost()
+        best_grid = state.grid.copy()
+        tabu: Dict[Tuple[int, tuple], int] = {}
+        for iteration in range(self.iterations):
+            cells = [c for c in state.conflict_cells() if movable[tuple(c)]]
+            if not cells:
+                break
+            cell = tuple(int(x) for x in random.choice(cells))
+            sample = _candidate_targets(state, cell, movable, self.sample_size)
+            target, _ = _best_swap(state, cell, sample, tabu, iteration, best_cost)
+            if target is None:
+                continue
+            course_id = int(state.grid[cell])
+            displaced = int(state.grid[target])
+            state.swap(cell, target)
+            tabu[(course_id, cell)] = iteration + self.tenure
+            if displaced:
+                tabu[(displaced, target)] = iteration + self.tenure
+            if state.cost() < best_cost - 1e-12:
+                best_cost = state.cost()
+                best_grid = state.grid.copy()
+
+        # Restore the best timetable seen (tabu moves may end on a worse one)
+        state.load(best_grid)
+
+
+class SimulatedAnnealing(PostOptimizer):
+    """Random swaps from conflicting cells, accepting uphill moves with exp(-delta / T)."""
+
+    name = "anneal"
+
+    def __init__(self, iterations: int = 3000, start_temperature: float = 2.0, cooling: float = 0.998):
+        self.iterations = iterations
+        self.start_temperature = start_temperature
+        self.cooling = cooling
+
+    def optimize(self, state: IncrementalFitness, movable: np.ndarray) -> None:
+        candidates = np.argwhere(movable)
+        if len(candidates) < 2:
+            return
+        temperature = self.start_temperature
+        best_cost = state.cost()
+        best_grid = state.grid.copy()
+        for _ in range(self.iterations):
+            cells = [c for c in state.conflict_cells() if movable[tuple(c)]]
+            if not cells:
+                break
+            cell = random.choice(cells)
+            target = candidates[random.randrange(len(candidates))]
+            delta = state.swap_delta(cell, target)
+            if delta <= 0 or random.random() < math.exp(-delta / max(temperature, 1e-9)):
+                state.swap(cell, target)
+                if state.cost() < best_cost - 1e-12:
+                    best_cost = state.cost()
+                    best_grid = state.grid.copy()
+            temperature *= self.cooling
+
+        state.load(best_grid)
+
+
+POST_OPTIMIZERS = {
+    GreedyRepair.name: GreedyRepair,
+    TabuSearch.name: TabuSearch,
+    SimulatedAnnealing.name: SimulatedAnnealing,
+}
+
+
+def run_post_optimizers(ga, individual: np.ndarray, stages: Sequence[str]) -> Tuple[np.ndarray, Dict[str, float]]:
+    """Run the named stages in order on a copy of `individual`.
+
+    Returns the improved timetable and refreshed stats in GeneticSchedule.evolve()'s shape.
+    """
+    state = IncrementalFitness(ga.fitness_engine, individual.copy())
+    movable = np.ones(individual.shape, dtype=bool)
+    if ga.pinned_mask is not None:
+        movable &= ~ga.pinned_mask
+    for name in stages:
+        optimizer_cls = POST_OPTIMIZERS.get(name)
+        if optimizer_cls is None:
+            raise ValueError(f"Unknown post optimizer: {name}")
+        optimizer_cls().optimize(state, movable)
+    fitness, conflicts, utilization = state.fitness()
+    return state.grid, {"fitness": fitness, "conflicts": conflicts, "utilization": utilization}
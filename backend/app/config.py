@@ -12,5 +12,16 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-should-be-in-env")
     # 默认设置为超长有效期，避免前端被动退出（可通过环境变量覆盖）
     ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 5256000))
+    # 知识库语义向量索引文件目录（内存映射读取）
+    AI_VECTOR_INDEX_DIR = os.getenv(
+        "AI_VECTOR_INDEX_DIR",
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "kb_vectors"),
+    )
+    # 上传去重数据与写入中的临时文件目录：不能位于 /static 之下，否则可按哈希直接下载
+    # 需与 static/uploads 在同一文件系统，硬链接去重才会生效
+    UPLOAD_STORE_DIR = os.getenv(
+        "UPLOAD_STORE_DIR",
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "upload_store"),
+    )
 
 settings = Config()
@@ -27,14 +27,16 @@ from .routers import (
     ai_portal,
     teacher_grade,
 )
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
+import asyncio
 import os
 import shutil
 from .database import engine, Base
 from .logging_config import configure_logging
 import logging
 from sqlalchemy.future import select
-from sqlalchemy import text, func
+from sqlalchemy import text, func, update
 from .database import AsyncSessionLocal
 from .models.user import User, UserProfile
 from .models.admin import Admin
@@ -44,6 +46,7 @@ from .models import admin_user
 from .dependencies.auth import get_password_hash
 from .models.academic import AcademicCollege, AcademicMajor, AcademicClass, AcademicStudent, AcademicClassHeadTeacher
 from .models import ai_config  # noqa: F401
+from .services.upload_storage import upload_storage
 
 # Configure logging at startup
 configure_logging()
@@ -68,6 +71,16 @@ async def log_admin_user_list_auth(request: Request, call_next):
         logging.getLogger("auth").info(f"Auth header: {request.headers.get('authorization')}")
     response = await call_next(request)
     return response
+
+
+@app.middleware("http")
+async def reject_oversized_body(request: Request, call_next):
+    # 上传表单在进入路由前就会被完整缓存到临时文件，这里按 Content-Length 提前拒绝超大的请求体
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > upload_storage.max_request_bytes():
+        limit_mb = max(upload_storage.limits_mb.values())
+        return JSONResponse(status_code=413, content={"detail": f"文件过大，最大允许 {limit_mb} MB"})
+    return await call_next(request)
 # CORS 配置
 app.add_middleware(
     CORSMiddleware,
@@ -168,6 +181,11 @@ async def startup():
                 await conn.execute(text("UPDATE ai_kb_documents SET updated_at = created_at WHERE updated_at IS NULL"))
             if "knowledge_base_id" not in cols:
                 await conn.execute(text("ALTER TABLE ai_kb_documents ADD COLUMN knowledge_base_id INTEGER"))
+            if "ingest_status" not in cols:
+                await conn.execute(text("ALTER TABLE ai_kb_documents ADD COLUMN ingest_status VARCHAR(20) DEFAULT 'ready'"))
+                await conn.execute(text("UPDATE ai_kb_documents SET ingest_status = 'ready' WHERE ingest_status IS NULL"))
+            if "ingest_error" not in cols:
+                await conn.execute(text("ALTER TABLE ai_kb_documents ADD COLUMN ingest_error TEXT"))
 
         # Ensure new columns for ai_model_kb_links
         pragma_cols = await conn.execute(text("PRAGMA table_info('ai_model_kb_links')"))
@@ -191,6 +209,45 @@ async def startup():
                 await conn.execute(text("ALTER TABLE ai_model_apis ADD COLUMN temperature FLOAT"))
             if "max_output_tokens" not in cols:
                 await conn.execute(text("ALTER TABLE ai_model_apis ADD COLUMN max_output_tokens INTEGER"))
+            if "max_concurrency" not in cols:
+                await conn.execute(text("ALTER TABLE ai_model_apis ADD COLUMN max_concurrency INTEGER DEFAULT 0"))
+                await conn.execute(text("UPDATE ai_model_apis SET max_concurrency = 0 WHERE max_concurrency IS NULL"))
+            if "rate_limit_per_minute" not in cols:
+                await conn.execute(text("ALTER TABLE ai_model_apis ADD COLUMN rate_limit_per_minute INTEGER DEFAULT 0"))
+                await conn.execute(text("UPDATE ai_model_apis SET rate_limit_per_minute = 0 WHERE rate_limit_per_minute IS NULL"))
+            if "priority" not in cols:
+                await conn.execute(text("ALTER TABLE ai_model_apis ADD COLUMN priority INTEGER DEFAULT 0"))
+                await conn.execute(text("UPDATE ai_model_apis SET priority = 0 WHERE priority IS NULL"))
+            if "context_window" not in cols:
+                await conn.execute(text("ALTER TABLE ai_model_apis ADD COLUMN context_window INTEGER DEFAULT 0"))
+                await conn.execute(text("UPDATE ai_model_apis SET context_window = 0 WHERE context_window IS NULL"))
+
+        # Ensure new columns for ai_knowledge_bases
+        pragma_cols = await conn.execute(text("PRAGMA table_info('ai_knowledge_bases')"))
+        cols = [row[1] for row in pragma_cols]
+        if cols:
+            if "content_version" not in cols:
+                await conn.execute(text("ALTER TABLE ai_knowledge_bases ADD COLUMN content_version INTEGER DEFAULT 0"))
+                await conn.execute(text("UPDATE ai_knowledge_bases SET content_version = 0 WHERE content_version IS NULL"))
+
+        # Ensure new columns for ai_lesson_plan_tasks
+        pragma_cols = await conn.execute(text("PRAGMA table_info('ai_lesson_plan_tasks')"))
+        cols = [row[1] for row in pragma_cols]
+        if cols:
+            if "prompt" not in cols:
+                await conn.execute(text("ALTER TABLE ai_lesson_plan_tasks ADD COLUMN prompt TEXT"))
+            if "attempts" not in cols:
+                await conn.execute(text("ALTER TABLE ai_lesson_plan_tasks ADD COLUMN attempts INTEGER DEFAULT 0"))
+                await conn.execute(text("UPDATE ai_lesson_plan_tasks SET attempts = 0 WHERE attempts IS NULL"))
+            if "lease_until" not in cols:
+                await conn.execute(text("ALTER TABLE ai_lesson_plan_tasks ADD COLUMN lease_until DATETIME"))
+
+        # Ensure new columns for ai_kb_index_stats
+        pragma_cols = await conn.execute(text("PRAGMA table_info('ai_kb_index_stats')"))
+        cols = [row[1] for row in pragma_cols]
+        if cols:
+            if "tokenizer" not in cols:
+                await conn.execute(text("ALTER TABLE ai_kb_index_stats ADD COLUMN tokenizer VARCHAR(32)"))
 
         # Ensure new columns for student_course_ai_selections
         pragma_cols = await conn.execute(text("PRAGMA table_info('student_course_ai_selections')"))
@@ -443,6 +500,25 @@ async def startup():
 
         await db.commit()
 
+        # 为尚未建立倒排索引（或分词规则已变化）的知识库补建一次（之后随文档增删增量维护，检索路径只读索引）
+        from .services.ai_workflow import repair_knowledge_base_indexes  # noqa: WPS433
+        from .services.text_tokenizer import text_tokenizer  # noqa: WPS433
+
+        # jieba 词典首次加载需要数秒：启动时在线程中加载，不留给第一个问题
+        await asyncio.to_thread(text_tokenizer.warm)
+        await repair_knowledge_base_indexes(db)
+        await db.commit()
+
+        # 上次进程退出时仍在后台入库的文档无法继续，标记为失败以便重新上传
+        from .models.ai_config import AiKnowledgeBaseDocument  # noqa: WPS433
+
+        await db.execute(
+            update(AiKnowledgeBaseDocument)
+            .where(AiKnowledgeBaseDocument.ingest_status == "processing")
+            .values(ingest_status="failed", ingest_error="服务重启导致入库中断，请重新上传或替换文件")
+        )
+        await db.commit()
+
         # Demo seed (disabled by default):
         # Only generate colleges/majors/classes/students when explicitly enabled.
         if os.getenv("ENABLE_DEMO_SEED") != "1":
@@ -592,6 +668,13 @@ async def startup():
 
         await db.commit()
 
+
+# 智能教案后台生成：接手未完成的任务。单独注册，避免被上面演示数据开关的提前 return 跳过
+@app.on_event("startup")
+async def start_lesson_plan_worker():
+    from .services.lesson_plan_worker import lesson_plan_worker
+    lesson_plan_worker.start()
+
 _routers = [
     admin_teacher.router,
     admin_student.router,
@@ -654,6 +737,13 @@ _sync_legacy_uploads()
 if os.path.isdir(STATIC_ROOT):
     app.mount("/static", StaticFiles(directory=STATIC_ROOT), name="static")
 
+@app.on_event("shutdown")
+async def shutdown():
+    from .services.ai_http_clients import provider_clients
+    from .services.lesson_plan_worker import lesson_plan_worker
+    await lesson_plan_worker.stop()
+    await provider_clients.aclose()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Smart University Academic Affairs System API"}
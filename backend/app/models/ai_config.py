@@ -8,6 +8,7 @@ from sqlalchemy import (
     DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
     String,
     Text,
@@ -35,8 +36,12 @@ class AiModelApi(Base):
 
     timeout_seconds = Column(Integer, nullable=False, default=30)
     quota_per_hour = Column(Integer, nullable=False, default=0)  # 0 表示不限制（仅配置位）
+    max_concurrency = Column(Integer, nullable=False, default=0)  # 同时进行的上游请求数，0 使用默认值
+    rate_limit_per_minute = Column(Integer, nullable=False, default=0)  # 每分钟请求数，0 表示不限速
+    priority = Column(Integer, nullable=False, default=0)  # 兜底顺序，越大越靠前；负数表示不参与兜底
     temperature = Column(Float, nullable=True)
     max_output_tokens = Column(Integer, nullable=True)
+    context_window = Column(Integer, nullable=False, default=0)  # 模型上下文长度（token），0 使用默认值
 
     enabled = Column(Boolean, nullable=False, default=True)
     is_default = Column(Boolean, nullable=False, default=False)
@@ -62,6 +67,8 @@ class AiKnowledgeBase(Base):
     course_id = Column(Integer, nullable=True, index=True)
     feature = Column(String(50), nullable=True)
     is_default = Column(Boolean, nullable=False, default=False)
+    # 片段增删时递增，问答答案缓存以此判断知识库内容是否变化
+    content_version = Column(Integer, nullable=False, default=0)
 
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -105,6 +112,9 @@ class AiKnowledgeBaseDocument(Base):
     enabled = Column(Boolean, nullable=False, default=True)
 
     uploaded_by_admin = Column(String(50), nullable=True)
+    # 入库状态：processing（后台抽取/切分/索引中）/ ready / failed
+    ingest_status = Column(String(20), nullable=False, default="ready")
+    ingest_error = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -131,6 +141,32 @@ class AiKnowledgeBaseChunk(Base):
     document = relationship("AiKnowledgeBaseDocument", back_populates="chunks")
 
 
+class AiKnowledgeBasePosting(Base):
+    """知识库倒排索引：每个 (词项, 片段) 一行，检索时只读取问题词项对应的倒排记录"""
+
+    __tablename__ = "ai_kb_postings"
+    __table_args__ = (Index("ix_ai_kb_postings_kb_term", "knowledge_base_id", "term"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    knowledge_base_id = Column(Integer, ForeignKey("ai_knowledge_bases.id"), nullable=False)
+    term = Column(String(64), nullable=False)
+    chunk_id = Column(Integer, ForeignKey("ai_kb_chunks.id"), nullable=False, index=True)
+    tf = Column(Integer, nullable=False, default=1)  # 词项在片段中的出现次数
+    doc_len = Column(Integer, nullable=False, default=0)  # 片段词项总数（BM25 长度归一化）
+
+
+class AiKnowledgeBaseIndexStat(Base):
+    """知识库倒排索引的全局统计（片段数、词项总数），随文档增删增量维护"""
+
+    __tablename__ = "ai_kb_index_stats"
+
+    knowledge_base_id = Column(Integer, ForeignKey("ai_knowledge_bases.id"), primary_key=True)
+    chunk_count = Column(Integer, nullable=False, default=0)
+    token_total = Column(Integer, nullable=False, default=0)
+    tokenizer = Column(String(32), nullable=True)  # 建索引时的分词规则版本，不一致时重建
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 class AiModelKnowledgeBaseLink(Base):
     __tablename__ = "ai_model_kb_links"
     __table_args__ = (UniqueConstraint("model_api_id", "kb_document_id", name="uq_ai_model_kb"),)
@@ -309,8 +345,12 @@ class AiLessonPlanTask(Base):
     title = Column(String(200), nullable=False)
     outline = Column(Text, nullable=True)
     status = Column(String(30), nullable=False, default="pending")  # pending / streaming / completed / failed
-    result = Column(Text, nullable=True)
+    prompt = Column(Text, nullable=True)  # 前端组装好的完整提示词；为空时按标题与大纲生成
+    result = Column(Text, nullable=True)  # 生成中定期写入已生成部分，中断后从此处续写
     error_message = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    # streaming：租约到期仍未续约视为执行进程已退出，任务重新排队；pending：重试退避，到期前不领取
+    lease_until = Column(DateTime, nullable=True)
 
     knowledge_base_id = Column(Integer, ForeignKey("ai_knowledge_bases.id"), nullable=True, index=True)
     model_api_id = Column(Integer, ForeignKey("ai_model_apis.id"), nullable=True, index=True)
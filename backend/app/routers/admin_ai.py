@@ -8,7 +8,7 @@ from datetime import datetime
 from typing import List, Optional
 
 import httpx
-from fastapi import APIRouter, Body, Depends, File, Form, HTTPException, UploadFile
+from fastapi import APIRouter, Body, Depends, File, Form, HTTPException, Request, UploadFile
 from sqlalchemy import delete, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -48,6 +48,8 @@ from ..schemas.admin_ai import (
     AiFeatureBindingUpdate,
     AiCustomerServiceSettingsOut,
     AiCustomerServiceSettingsUpdate,
+    AiSensitiveWordsOut,
+    AiSensitiveWordsUpdate,
     AiModelApiCreate,
     AiModelApiOut,
     AiModelApiTestRequest,
@@ -61,9 +63,30 @@ from ..schemas.admin_ai import (
     StudentCourseAiSelectOut,
     StudentCourseAiSelectRequest,
 ) 
-from ..services.ai_workflow import delete_document_chunks, extract_text_from_file, rebuild_document_chunks
+from ..services.ai_config_cache import ai_config_cache
+from ..services.ai_http_clients import model_client_key, provider_clients
+from ..services.ai_model_router import model_router
+from ..services.ai_model_scheduler import model_schedulers
+from ..services.ai_workflow import (
+    delete_document_chunks,
+    drop_knowledge_base_index,
+    extract_text_from_file,
+    rebuild_document_chunks,
+)
+from ..services.kb_ingest import INGEST_PROCESSING, kb_ingest_pipeline
+from ..services.sensitive_filter import sensitive_filter
+from ..services.upload_storage import upload_storage
+
+async def _invalidate_config_on_write(request: Request):
+    """写操作结束后让问答使用的配置快照失效（模型、工作流、知识库的增删改都经过本路由）"""
+    try:
+        yield
+    finally:
+        if request.method not in ("GET", "HEAD", "OPTIONS"):
+            ai_config_cache.invalidate()
+
 
-router = APIRouter(prefix="/admin/ai", tags=["Admin AI"])
+router = APIRouter(prefix="/admin/ai", tags=["Admin AI"], dependencies=[Depends(_invalidate_config_on_write)])
 
 _BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 _STATIC_ROOT = os.path.join(_BACKEND_DIR, "static")
@@ -102,11 +125,7 @@ def _resolve_upload_path(stored_filename: str) -> Optional[str]:
 async def _save_upload(file: UploadFile, upload_dir: str) -> dict:
     ext = _ensure_ext(file.filename)
     stored = f"{uuid.uuid4().hex}{ext}"
-    abs_path = os.path.join(upload_dir, stored)
-
-    data = await file.read()
-    with open(abs_path, "wb") as f:
-        f.write(data)
+    saved = await upload_storage.save(file, upload_dir, stored, category="kb")
 
     rel_url = "/static/uploads/kb_base/" + stored
     if upload_dir.endswith("kb_teacher"):
@@ -117,9 +136,9 @@ async def _save_upload(file: UploadFile, upload_dir: str) -> dict:
     return {
         "stored_filename": stored,
         "file_ext": ext,
-        "file_size": len(data),
+        "file_size": saved["file_size"],
         "url": rel_url,
-        "abs_path": abs_path,
+        "abs_path": saved["abs_path"],
     }
 
 
@@ -227,6 +246,8 @@ async def _get_or_create_app(
     db.add(app)
     await db.commit()
     await db.refresh(app)
+    # 查询接口也可能走到这里创建应用
+    ai_config_cache.invalidate()
     return app
 
 
@@ -253,6 +274,10 @@ async def list_model_apis(db: AsyncSession = Depends(get_db), _: User = Depends(
             endpoint=o.endpoint,
             timeout_seconds=o.timeout_seconds,
             quota_per_hour=o.quota_per_hour,
+            max_concurrency=getattr(o, "max_concurrency", 0) or 0,
+            rate_limit_per_minute=getattr(o, "rate_limit_per_minute", 0) or 0,
+            priority=getattr(o, "priority", 0) or 0,
+            context_window=getattr(o, "context_window", 0) or 0,
             enabled=o.enabled,
             is_default=o.is_default,
             created_at=o.created_at,
@@ -272,6 +297,10 @@ async def create_model_api(payload: AiModelApiCreate, db: AsyncSession = Depends
         api_key=payload.api_key,
         timeout_seconds=payload.timeout_seconds,
         quota_per_hour=payload.quota_per_hour,
+        max_concurrency=payload.max_concurrency,
+        rate_limit_per_minute=payload.rate_limit_per_minute,
+        priority=payload.priority,
+        context_window=payload.context_window,
         enabled=payload.enabled,
         is_default=payload.is_default,
     )
@@ -291,6 +320,10 @@ async def create_model_api(payload: AiModelApiCreate, db: AsyncSession = Depends
         endpoint=obj.endpoint,
         timeout_seconds=obj.timeout_seconds,
         quota_per_hour=obj.quota_per_hour,
+        max_concurrency=getattr(obj, "max_concurrency", 0) or 0,
+        rate_limit_per_minute=getattr(obj, "rate_limit_per_minute", 0) or 0,
+        priority=getattr(obj, "priority", 0) or 0,
+        context_window=getattr(obj, "context_window", 0) or 0,
         enabled=obj.enabled,
         is_default=obj.is_default,
         created_at=obj.created_at,
@@ -312,6 +345,7 @@ async def update_model_api(api_id: int, payload: AiModelApiUpdate, db: AsyncSess
 
     await db.commit()
     await db.refresh(obj)
+    provider_clients.invalidate(model_client_key(obj.id))
     return AiModelApiOut(
         id=obj.id,
         name=obj.name,
@@ -320,6 +354,10 @@ async def update_model_api(api_id: int, payload: AiModelApiUpdate, db: AsyncSess
         endpoint=obj.endpoint,
         timeout_seconds=obj.timeout_seconds,
         quota_per_hour=obj.quota_per_hour,
+        max_concurrency=getattr(obj, "max_concurrency", 0) or 0,
+        rate_limit_per_minute=getattr(obj, "rate_limit_per_minute", 0) or 0,
+        priority=getattr(obj, "priority", 0) or 0,
+        context_window=getattr(obj, "context_window", 0) or 0,
         enabled=obj.enabled,
         is_default=obj.is_default,
         created_at=obj.created_at,
@@ -335,9 +373,34 @@ async def delete_model_api(api_id: int, db: AsyncSession = Depends(get_db), _: U
 
     await db.delete(obj)
     await db.commit()
+    provider_clients.invalidate(model_client_key(api_id))
     return {"ok": True}
 
 
+@router.get("/model-apis/pool-stats")
+async def model_api_pool_stats(_: User = Depends(get_current_admin)):
+    """上游模型连接池状态：各客户端的连接数、空闲数、累计请求数"""
+    return provider_clients.stats()
+
+
+@router.get("/model-apis/scheduler-stats")
+async def model_api_scheduler_stats(_: User = Depends(get_current_admin)):
+    """各模型调度器状态：进行中、排队数（按功能）、平均占用时长、拒绝次数"""
+    return model_schedulers.stats()
+
+
+@router.get("/model-apis/health")
+async def model_api_health(_: User = Depends(get_current_admin)):
+    """多模型路由状态：各模型首字延迟 EWMA / p95 估计、错误率，以及兜底与对冲次数"""
+    return model_router.stats()
+
+
+@router.get("/config-cache/stats")
+async def config_cache_stats(_: User = Depends(get_current_admin)):
+    """问答配置快照：版本号、加载次数、缓存的应用与模型数、快照年龄"""
+    return ai_config_cache.stats()
+
+
 @router.post("/model-apis/test", response_model=AiModelApiTestResponse)
 async def test_model_api(
     payload: AiModelApiTestRequest,
@@ -363,10 +426,12 @@ async def test_model_api(
         raise HTTPException(status_code=400, detail="endpoint / api_key / model_name / provider 不能为空")
 
     try:
-        timeout = httpx.Timeout(payload.timeout_seconds)
-        async with httpx.AsyncClient(timeout=timeout) as client:
+        if provider not in ("dashscope_openai", "ark_responses"):
+            return AiModelApiTestResponse(ok=False, message="不支持的 provider（仅 dashscope_openai / ark_responses）")
+        headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+        # 测试的地址多为临时填写，用一次性客户端，不进入共享连接池
+        async with httpx.AsyncClient(timeout=httpx.Timeout(payload.timeout_seconds), headers=headers) as client:
             if provider == "dashscope_openai":
-                headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
                 resp = await client.post(
                     f"{endpoint}/chat/completions",
                     json={
@@ -374,10 +439,8 @@ async def test_model_api(
                         "messages": [{"role": "user", "content": prompt}],
                         "stream": False,
                     },
-                    headers=headers,
                 )
-            elif provider == "ark_responses":
-                headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+            else:
                 resp = await client.post(
                     f"{endpoint}/responses",
                     json={
@@ -385,10 +448,7 @@ async def test_model_api(
                         "stream": False,
                         "input": [{"role": "user", "content": [{"type": "input_text", "text": prompt}]}],
                     },
-                    headers=headers,
                 )
-            else:
-                return AiModelApiTestResponse(ok=False, message="不支持的 provider（仅 dashscope_openai / ark_responses）")
 
         if resp.status_code < 200 or resp.status_code >= 300:
             return AiModelApiTestResponse(ok=False, message=f"连接失败: HTTP {resp.status_code} {resp.text[:200]}")
@@ -528,6 +588,7 @@ async def delete_kb_document(doc_id: int, db: AsyncSession = Depends(get_db), _:
     except Exception:
         pass
 
+    await delete_document_chunks(db, doc.id)
     await db.delete(doc)
     await db.commit()
     return {"ok": True}
@@ -667,6 +728,7 @@ async def delete_workflow_knowledge_base(
     ).scalars().first()
     if in_use:
         raise HTTPException(status_code=400, detail="知识库已绑定 AI 工作流，无法删除")
+    await drop_knowledge_base_index(db, kb.id)
     await db.delete(kb)
     await db.commit()
     return {"ok": True}
@@ -703,6 +765,8 @@ async def list_workflow_documents(
                 created_at=doc.created_at,
                 updated_at=doc.updated_at,
                 chunk_count=chunk_counts.get(doc.id, 0),
+                ingest_status=getattr(doc, "ingest_status", None) or "ready",
+                ingest_error=getattr(doc, "ingest_error", None),
             )
         )
     return out
@@ -776,13 +840,14 @@ async def upload_workflow_document(
         file_size=meta["file_size"],
         uploaded_by_admin=str(getattr(admin, "username", "")),
         enabled=True,
+        ingest_status=INGEST_PROCESSING,
     )
     db.add(doc)
-    await db.flush()
-    text = extract_text_from_file(meta["abs_path"], meta["file_ext"])
-    chunk_count = await rebuild_document_chunks(db, doc, text)
     await db.commit()
     await db.refresh(doc)
+    # 抽取、切分与建索引交给后台流水线，接口立即返回（chunk_count 在处理完成后更新）
+    kb_ingest_pipeline.submit(doc.id, meta["abs_path"], meta["file_ext"], notify_user_id=getattr(admin, "id", None))
+    chunk_count = 0
     return AiKbDocumentOut(
         id=doc.id,
         subject_id=doc.subject_id or 0,
@@ -796,6 +861,8 @@ async def upload_workflow_document(
         created_at=doc.created_at,
         updated_at=doc.updated_at,
         chunk_count=chunk_count,
+        ingest_status=getattr(doc, "ingest_status", None) or "ready",
+        ingest_error=getattr(doc, "ingest_error", None),
     )
 
 
@@ -842,6 +909,8 @@ async def create_manual_workflow_document(
         created_at=doc.created_at,
         updated_at=doc.updated_at,
         chunk_count=chunk_count,
+        ingest_status=getattr(doc, "ingest_status", None) or "ready",
+        ingest_error=getattr(doc, "ingest_error", None),
     )
 
 
@@ -1305,6 +1374,29 @@ async def update_customer_service_settings(
     return AiCustomerServiceSettingsOut(**merged)
 
 
+@router.get("/sensitive-words", response_model=AiSensitiveWordsOut)
+async def get_sensitive_words(db: AsyncSession = Depends(get_db), _: User = Depends(get_current_admin)):
+    await sensitive_filter.refresh(db)
+    return AiSensitiveWordsOut(words=list(sensitive_filter.words))
+
+
+@router.put("/sensitive-words", response_model=AiSensitiveWordsOut)
+async def update_sensitive_words(
+    payload: AiSensitiveWordsUpdate,
+    db: AsyncSession = Depends(get_db),
+    _: User = Depends(get_current_admin),
+):
+    """整体替换敏感词表，保存后立即重建匹配自动机"""
+    words = await sensitive_filter.save(db, payload.words)
+    return AiSensitiveWordsOut(words=words)
+
+
+@router.get("/sensitive-words/stats")
+async def sensitive_words_stats(_: User = Depends(get_current_admin)):
+    """敏感词自动机：词数、状态数、版本号与重建次数"""
+    return sensitive_filter.stats()
+
+
 # ----------------- Teacher / Student sync endpoints (minimal) -----------------
 
 @router.get("/public/models", response_model=List[PublicAiModelOut], include_in_schema=False)
@@ -43,7 +43,11 @@ from ..schemas.ai_portal import (
     TeacherKbUpdateRequest,
 )
 from ..schemas.admin_ai import AiWorkflowAppOut, AiCustomerServiceSettingsOut
-from ..services.ai_workflow import delete_document_chunks, extract_text_from_file, rebuild_document_chunks
+from ..services.ai_config_cache import ai_config_cache
+from ..services.ai_workflow import delete_document_chunks
+from ..services.kb_ingest import INGEST_PROCESSING, kb_ingest_pipeline
+from ..services.lesson_plan_worker import lesson_plan_worker
+from ..services.upload_storage import upload_storage
 
 router = APIRouter(prefix="/ai", tags=["AI Portal"])
 
@@ -96,6 +100,7 @@ async def _get_or_create_app(
     db.add(app)
     await db.commit()
     await db.refresh(app)
+    ai_config_cache.invalidate()
     return app
 
 
@@ -134,6 +139,7 @@ async def _ensure_teacher_course_kb(
     db.add(kb)
     await db.commit()
     await db.refresh(kb)
+    ai_config_cache.invalidate()
     return kb
 
 
@@ -181,6 +187,7 @@ def _lesson_plan_task_to_out(task: AiLessonPlanTask) -> LessonPlanTaskOut:
         status=task.status,
         result=task.result,
         error_message=task.error_message,
+        attempts=task.attempts or 0,
         knowledge_base_id=task.knowledge_base_id,
         model_api_id=task.model_api_id,
         created_at=task.created_at,
@@ -343,6 +350,7 @@ async def create_teacher_course_assistant_app(
     db.add(new_app)
     await db.commit()
     await db.refresh(new_app)
+    ai_config_cache.invalidate()
     return AiWorkflowAppOut(
         code=new_app.code,
         type=new_app.type,
@@ -387,6 +395,7 @@ async def update_teacher_course_assistant_app(
         app.status = status
     await db.commit()
     await db.refresh(app)
+    ai_config_cache.invalidate()
     return AiWorkflowAppOut(
         code=app.code,
         type=app.type,
@@ -422,6 +431,7 @@ async def delete_teacher_course_assistant_app(
         return {"ok": True}
     await db.delete(app)
     await db.commit()
+    ai_config_cache.invalidate()
     return {"ok": True}
 
 _BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
@@ -440,28 +450,23 @@ def _ensure_ext(filename: str) -> str:
 async def _save_upload(file: UploadFile) -> dict:
     ext = _ensure_ext(file.filename)
     stored = f"{uuid.uuid4().hex}{ext}"
-    abs_path = os.path.join(_TEACHER_UPLOAD_DIR, stored)
-
-    data = await file.read()
-    with open(abs_path, "wb") as f:
-        f.write(data)
+    saved = await upload_storage.save(file, _TEACHER_UPLOAD_DIR, stored, category="kb")
 
     rel_url = "/static/uploads/kb_teacher/" + stored
     return {
         "stored_filename": stored,
         "file_ext": ext,
-        "file_size": len(data),
+        "file_size": saved["file_size"],
         "url": rel_url,
-        "abs_path": abs_path,
+        "abs_path": saved["abs_path"],
     }
 
 
 # ---------------- 公共：启用模型列表 ----------------
 @router.get("/public/model-apis", response_model=List[PublicAiModelApiOut])
 async def list_public_model_apis(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
-    res = await db.execute(select(AiModelApi).where(AiModelApi.enabled == True).order_by(AiModelApi.is_default.desc(), AiModelApi.id.desc()))
     items = []
-    for o in res.scalars().all():
+    for o in (await ai_config_cache.snapshot(db)).enabled_models:
         items.append(
             PublicAiModelApiOut(
                 id=o.id,
@@ -521,6 +526,8 @@ async def list_teacher_kb_documents(
                 file_size=doc.file_size,
                 created_at=doc.created_at,
                 updated_at=doc.updated_at,
+                ingest_status=doc.ingest_status or "ready",
+                ingest_error=doc.ingest_error,
             )
         )
     return out
@@ -561,13 +568,13 @@ async def upload_teacher_kb(
         file_size=saved["file_size"],
         uploaded_by_admin=str(current_user.username),
         enabled=True,
+        ingest_status=INGEST_PROCESSING,
     )
     db.add(doc)
-    await db.flush()
-    text = extract_text_from_file(saved["abs_path"], saved["file_ext"])
-    await rebuild_document_chunks(db, doc, text)
     await db.commit()
     await db.refresh(doc)
+    # 抽取、切分与建索引交给后台流水线，接口立即返回
+    kb_ingest_pipeline.submit(doc.id, saved["abs_path"], saved["file_ext"], notify_user_id=current_user.id)
 
     return TeacherKbDocumentOut(
         id=doc.id,
@@ -580,6 +587,8 @@ async def upload_teacher_kb(
         file_size=doc.file_size,
         created_at=doc.created_at,
         updated_at=doc.updated_at,
+        ingest_status=doc.ingest_status or "ready",
+        ingest_error=doc.ingest_error,
     )
 
 
@@ -628,6 +637,8 @@ async def update_teacher_kb_document(
         file_size=doc.file_size,
         created_at=doc.created_at,
         updated_at=doc.updated_at,
+        ingest_status=doc.ingest_status or "ready",
+        ingest_error=doc.ingest_error,
     )
 
 
@@ -666,11 +677,12 @@ async def replace_teacher_kb_document(
     doc.url = saved["url"]
     doc.file_ext = saved["file_ext"]
     doc.file_size = saved["file_size"]
-
-    text = extract_text_from_file(saved["abs_path"], saved["file_ext"])
-    await rebuild_document_chunks(db, doc, text)
+    doc.ingest_status = INGEST_PROCESSING
+    doc.ingest_error = None
     await db.commit()
     await db.refresh(doc)
+    # 旧片段在新文件处理完成前继续可检索
+    kb_ingest_pipeline.submit(doc.id, saved["abs_path"], saved["file_ext"], notify_user_id=current_user.id)
 
     return TeacherKbDocumentOut(
         id=doc.id,
@@ -683,6 +695,8 @@ async def replace_teacher_kb_document(
         file_size=doc.file_size,
         created_at=doc.created_at,
         updated_at=doc.updated_at,
+        ingest_status=doc.ingest_status or "ready",
+        ingest_error=doc.ingest_error,
     )
 
 
@@ -769,9 +783,10 @@ async def create_lesson_plan_task(
         course_id=course_id,
         title=title,
         outline=(payload.outline or "").strip() or None,
+        prompt=(payload.prompt or "").strip() or None,
         status="pending",
         knowledge_base_id=app.knowledge_base_id,
-        model_api_id=app.model_api_id,
+        model_api_id=payload.model_api_id or app.model_api_id,
     )
     db.add(task)
     db.add(
@@ -784,6 +799,7 @@ async def create_lesson_plan_task(
     )
     await db.commit()
     await db.refresh(task)
+    lesson_plan_worker.notify()
     return _lesson_plan_task_to_out(task)
 
 
@@ -827,6 +843,26 @@ async def update_lesson_plan_task_result(
     return _lesson_plan_task_to_out(task)
 
 
+@router.post("/teacher/lesson-plan/tasks/{task_id}/retry", response_model=LessonPlanTaskOut)
+async def retry_lesson_plan_task(
+    task_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can access")
+    task = await _load_teacher_task(db, current_user.id, task_id)
+    if task.status != "failed":
+        raise HTTPException(status_code=400, detail="只有失败的任务可以重试")
+    task.status = "pending"
+    task.attempts = 0
+    task.lease_until = None
+    await db.commit()
+    await db.refresh(task)
+    lesson_plan_worker.notify()
+    return _lesson_plan_task_to_out(task)
+
+
 @router.delete("/teacher/lesson-plan/tasks/{task_id}")
 async def delete_lesson_plan_task(
     task_id: int,
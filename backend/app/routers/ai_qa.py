@@ -3,25 +3,39 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
-from typing import AsyncGenerator, Optional, List
+import os
+from typing import AsyncGenerator, Callable, Optional, List, Tuple
 
 import httpx
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import StreamingResponse
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..database import get_db
-from ..models.ai_config import AiModelApi, AiWorkflowApp, AiKnowledgeBase
+from ..database import AsyncSessionLocal, get_db
+from ..models.ai_config import AiModelApi, AiWorkflowApp
 from ..schemas.ai import QARequest
+from ..services.ai_answer_cache import answer_cache
+from ..services.ai_config_cache import ai_config_cache
+from ..services.ai_context_packer import context_budget, pack_context
+from ..services.ai_http_clients import model_client_key, provider_clients
+from ..services.ai_model_router import model_router
+from ..services.ai_model_scheduler import ModelOverloaded, ModelScheduler, model_schedulers
+from ..services.ai_single_flight import answer_flights
 from ..services.ai_service import QwenClient
-from ..services.ai_workflow import retrieve_top_chunks
+from ..services.ai_workflow import knowledge_base_versions, retrieve_top_chunks
+from ..services.sensitive_filter import sensitive_filter
 
 router = APIRouter(prefix="/ai_qa", tags=["AI QA"])
 
 ai_client = QwenClient()
 logger = logging.getLogger(__name__)
 
+# 检索候选片段数，实际放入提示词的段落由上下文打包按 token 预算决定
+_CONTEXT_CANDIDATES = 16
+# 一次问答最多串联的模型数（含主模型），1 表示不兜底
+_MAX_ROUTED_MODELS = int(os.getenv("AI_FALLBACK_MAX_MODELS", 3))
+_SENSITIVE_REFUSAL = "抱歉，您的问题包含敏感词，暂无法回答。"
+
 SSE_HEADERS = {
     "Cache-Control": "no-cache",
     "Connection": "keep-alive",
@@ -43,7 +57,7 @@ def _parse_model_id(raw: Optional[str]) -> Optional[int]:
 async def _load_workflow_app(db: AsyncSession, code: Optional[str]) -> Optional[AiWorkflowApp]:
     if not code:
         return None
-    return (await db.execute(select(AiWorkflowApp).where(AiWorkflowApp.code == code))).scalars().first()
+    return (await ai_config_cache.snapshot(db)).app(code)
 
 
 async def _resolve_model(
@@ -51,39 +65,50 @@ async def _resolve_model(
     model_raw: Optional[str],
     app: Optional[AiWorkflowApp],
 ) -> Optional[AiModelApi]:
-    model_id = _parse_model_id(model_raw)
-    if model_id:
-        obj = (
-            await db.execute(
-                select(AiModelApi).where(
-                    AiModelApi.id == model_id,
-                    AiModelApi.enabled == True,  # noqa: E712
-                )
-            )
-        ).scalars().first()
-        if obj:
-            return obj
+    config = await ai_config_cache.snapshot(db)
+    obj = config.enabled_model(_parse_model_id(model_raw))
+    if obj:
+        return obj
 
     if app and app.model_api_id:
-        obj = (
-            await db.execute(
-                select(AiModelApi).where(
-                    AiModelApi.id == app.model_api_id,
-                    AiModelApi.enabled == True,  # noqa: E712
-                )
-            )
-        ).scalars().first()
+        obj = config.enabled_model(app.model_api_id)
         if obj:
             return obj
 
     # fallback: enabled default model
-    return (
-        await db.execute(
-            select(AiModelApi)
-            .where(AiModelApi.enabled == True)  # noqa: E712
-            .order_by(AiModelApi.is_default.desc(), AiModelApi.id.desc())
-        )
-    ).scalars().first()
+    return config.default_model()
+
+
+async def _resolve_fallback_models(db: AsyncSession, primary: AiModelApi) -> List[AiModelApi]:
+    """主模型之外可兜底的已启用模型，按优先级排序；priority 为负的模型不参与"""
+    if _MAX_ROUTED_MODELS <= 1:
+        return []
+    config = await ai_config_cache.snapshot(db)
+    candidates = sorted(
+        (m for m in config.enabled_models if m.id != primary.id),
+        key=lambda m: (-(m.priority or 0), not m.is_default, -m.id),
+    )
+    out: List[AiModelApi] = []
+    for obj in candidates:
+        if (obj.priority or 0) < 0 or not (obj.endpoint and obj.api_key and obj.model_name):
+            continue
+        out.append(obj)
+        if len(out) >= _MAX_ROUTED_MODELS - 1:
+            break
+    return out
+
+
+def _prompt_budget(models: List[AiModelApi], question: str) -> int:
+    """同一份提示词可能发给兜底模型，按候选模型中最小的预算打包"""
+    return min(context_budget(getattr(m, "context_window", 0), m.max_output_tokens, question) for m in models)
+
+
+def _scheduler_for(model: AiModelApi) -> ModelScheduler:
+    return model_schedulers.get(
+        model_client_key(model.id),
+        getattr(model, "max_concurrency", 0),
+        getattr(model, "rate_limit_per_minute", 0),
+    )
 
 
 async def _collect_kb_ids(
@@ -95,8 +120,7 @@ async def _collect_kb_ids(
     if app and app.knowledge_base_id:
         ids.append(int(app.knowledge_base_id))
     if course_id:
-        res = await db.execute(select(AiKnowledgeBase.id).where(AiKnowledgeBase.course_id == int(course_id)))
-        ids.extend([int(x) for x in res.scalars().all()])
+        ids.extend((await ai_config_cache.snapshot(db)).course_kb_ids(course_id))
     # de-dup
     out: List[int] = []
     for x in ids:
@@ -105,22 +129,19 @@ async def _collect_kb_ids(
     return out
 
 
-async def _build_prompt(db: AsyncSession, question: str, kb_ids: List[int]) -> str:
+async def _build_prompt(db: AsyncSession, question: str, kb_ids: List[int], budget_tokens: Optional[int] = None) -> str:
     if not kb_ids:
         return question
+    if budget_tokens is None:
+        budget_tokens = context_budget(None, None, question)
     try:
-        chunks = await retrieve_top_chunks(db, kb_ids, question, limit=6)
+        chunks = await retrieve_top_chunks(db, kb_ids, question, limit=_CONTEXT_CANDIDATES)
     except Exception:
         return question
-    if not chunks:
-        return question
-    lines: List[str] = []
-    for idx, (chunk, _score) in enumerate(chunks, start=1):
-        text = (chunk.content or "").strip()
-        if text:
-            lines.append(f"[{idx}] {text}")
-    if not lines:
+    passages = pack_context(chunks, budget_tokens)
+    if not passages:
         return question
+    lines = [f"[{idx}] {passage.text}" for idx, passage in enumerate(passages, start=1)]
     context = "\n".join(lines)
     return f"以下是与问题相关的知识库片段，请结合回答：\n{context}\n\n问题：{question}"
 
@@ -149,6 +170,125 @@ def _make_sse_payload(content: str, kind: str = "answer") -> str:
     return f"data: {json.dumps({'type': kind, 'content': content}, ensure_ascii=False)}\n\n"
 
 
+def _make_error_payload(content: str, retryable: bool = False) -> str:
+    # retryable：换一个模型可能成功（连接失败、超时、5xx、限流），供多模型路由判断是否兜底
+    payload = {"type": "error", "content": content, "retryable": retryable}
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _is_retryable_status(status_code: int) -> bool:
+    return status_code >= 500 or status_code in (408, 429)
+
+
+def _parse_sse_payload(chunk: str) -> Optional[dict]:
+    text = (chunk or "").strip()
+    if not text.startswith("data:"):
+        return None
+    try:
+        data = json.loads(text[5:].strip())
+    except Exception:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _classify_chunk(chunk: str) -> Tuple[str, bool]:
+    """供多模型路由判断：answer（已出字）/ error（附带是否可换模型重试）/ other（过程事件）"""
+    data = _parse_sse_payload(chunk)
+    if data is None:
+        return "other", False
+    kind = data.get("type", "answer")
+    if kind == "answer" and data.get("content"):
+        return "answer", False
+    if kind == "error":
+        return "error", bool(data.get("retryable"))
+    return "other", False
+
+
+async def _moderated(stream: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+    """答案文本逐块经过敏感词自动机替换；可能跨块的尾部先扣留，在下一个非答案事件之前或结束时补发"""
+    masker = sensitive_filter.masker()
+    async for chunk in stream:
+        data = _parse_sse_payload(chunk)
+        if data is not None and data.get("type", "answer") == "answer":
+            text = masker.feed(str(data.get("content") or ""))
+            if text:
+                yield _make_sse_payload(text)
+            continue
+        tail = masker.flush()
+        if tail:
+            yield _make_sse_payload(tail)
+        yield chunk
+    tail = masker.flush()
+    if tail:
+        yield _make_sse_payload(tail)
+
+
+async def _replay_cached_answer(answer: str) -> AsyncGenerator[str, None]:
+    # 缓存写入后词表可能已更新，回放时再替换一遍
+    for piece in _split_text(sensitive_filter.mask(answer)):
+        yield _make_sse_payload(piece)
+
+
+async def _record_answer(stream: AsyncGenerator[str, None], cache_key: Optional[str]) -> AsyncGenerator[str, None]:
+    """原样转发上游输出，完整结束且无错误时把拼接的答案写入缓存（客户端中途断开则不缓存）"""
+    parts: List[str] = []
+    failed = False
+    async for chunk in stream:
+        if cache_key and not failed:
+            data = _parse_sse_payload(chunk)
+            if data is None or data.get("type") == "error":
+                failed = True
+            elif data.get("type", "answer") == "answer":
+                parts.append(str(data.get("content") or ""))
+        yield chunk
+    if cache_key and not failed:
+        await answer_cache.set(cache_key, "".join(parts))
+
+
+def _coalesce(cache_key: Optional[str], source: Callable[[], AsyncGenerator[str, None]]) -> AsyncGenerator[str, None]:
+    # 可缓存（与用户无关）的回答才合并；带个人历史的请求各自生成
+    if not cache_key:
+        return source()
+    return answer_flights.stream(cache_key, source)
+
+
+def _feature_of(app: Optional[AiWorkflowApp], course_id: Optional[int]) -> str:
+    if app and app.type:
+        return app.type
+    return "course_assistant" if course_id else "customer_service"
+
+
+def _queue_message(position: int) -> str:
+    if position <= 0:
+        return "排队中，即将开始生成"
+    return f"排队中，前面还有 {position} 个请求"
+
+
+async def _scheduled(
+    scheduler: ModelScheduler,
+    user_id: str,
+    feature: str,
+    upstream: Callable[[], AsyncGenerator[str, None]],
+    started: Optional[Callable[[], None]] = None,
+) -> AsyncGenerator[str, None]:
+    """在模型调度器中排队（推送排队位置），获得执行权后再调用上游，结束或断开时归还名额；
+    started 在获得执行权时调用，多模型路由据此开始首字计时"""
+    try:
+        ticket = scheduler.enqueue(user_id, feature)
+    except ModelOverloaded as exc:
+        yield _make_error_payload(f"AI 服务繁忙，请 {exc.retry_after} 秒后重试", retryable=True)
+        return
+    try:
+        async for position in ticket.wait():
+            yield _make_sse_payload(_queue_message(position), "thinking")
+        if started is not None:
+            started()
+        async for chunk in upstream():
+            yield chunk
+    finally:
+        ticket.release()
+
+
 def _thinking_steps(kb_ids: List[int]) -> List[str]:
     steps: List[str] = []
     if kb_ids:
@@ -298,7 +438,7 @@ async def _call_model_api(model: AiModelApi, prompt: str) -> AsyncGenerator[str,
     model_name = (model.model_name or "").strip()
     api_key = (model.api_key or "").strip()
     if not endpoint or not model_name or not api_key:
-        yield _make_sse_payload("AI 模型未完整配置，请在管理端补全 API Key/Endpoint/模型名称")
+        yield _make_error_payload("AI 模型未完整配置，请在管理端补全 API Key/Endpoint/模型名称", retryable=True)
         return
 
     headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
@@ -309,84 +449,138 @@ async def _call_model_api(model: AiModelApi, prompt: str) -> AsyncGenerator[str,
         timeout_seconds = 60
     timeout = httpx.Timeout(timeout_seconds, connect=min(15.0, float(timeout_seconds)), write=min(30.0, float(timeout_seconds)))
     try:
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            if provider == "dashscope_openai":
-                payload = {
-                    "model": model_name,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "stream": True,
-                }
-                if model.temperature is not None:
-                    payload["temperature"] = model.temperature
-                if model.max_output_tokens is not None:
-                    payload["max_tokens"] = model.max_output_tokens
-                async with client.stream(
-                    "POST",
-                    f"{endpoint}/chat/completions",
-                    json=payload,
-                    headers={**headers, "Accept": "text/event-stream"},
-                ) as resp:
-                    if resp.status_code < 200 or resp.status_code >= 300:
-                        body = (await resp.aread()).decode("utf-8", errors="ignore")
-                        msg = f"AI 接口请求失败: HTTP {resp.status_code} {body[:200]}"
-                        yield _make_sse_payload(msg)
-                        return
-                    content_type = resp.headers.get("content-type", "")
-                    if "text/event-stream" in content_type:
-                        async for raw in _iter_sse_events(resp):
-                            if raw == "[DONE]":
-                                break
-                            chunk = _extract_stream_text(raw)
-                            if chunk:
-                                yield _make_sse_payload(chunk)
-                        return
-
+        client = provider_clients.client(model_client_key(model.id), endpoint=endpoint, timeout=timeout, headers=headers)
+        if provider == "dashscope_openai":
+            payload = {
+                "model": model_name,
+                "messages": [{"role": "user", "content": prompt}],
+                "stream": True,
+            }
+            if model.temperature is not None:
+                payload["temperature"] = model.temperature
+            if model.max_output_tokens is not None:
+                payload["max_tokens"] = model.max_output_tokens
+            async with client.stream(
+                "POST",
+                f"{endpoint}/chat/completions",
+                json=payload,
+                headers={"Accept": "text/event-stream"},
+            ) as resp:
+                if resp.status_code < 200 or resp.status_code >= 300:
                     body = (await resp.aread()).decode("utf-8", errors="ignore")
-                    output_text = _extract_non_stream_text(provider, body)
-                    for piece in _split_text(output_text):
-                        yield _make_sse_payload(piece)
+                    msg = f"AI 接口请求失败: HTTP {resp.status_code} {body[:200]}"
+                    yield _make_error_payload(msg, retryable=_is_retryable_status(resp.status_code))
+                    return
+                content_type = resp.headers.get("content-type", "")
+                if "text/event-stream" in content_type:
+                    async for raw in _iter_sse_events(resp):
+                        if raw == "[DONE]":
+                            break
+                        chunk = _extract_stream_text(raw)
+                        if chunk:
+                            yield _make_sse_payload(chunk)
                     return
 
-            if provider == "ark_responses":
-                payload = {
-                    "model": model_name,
-                    "stream": True,
-                    "input": [{"role": "user", "content": [{"type": "input_text", "text": prompt}]}],
-                }
-                if model.temperature is not None:
-                    payload["temperature"] = model.temperature
-                async with client.stream(
-                    "POST",
-                    f"{endpoint}/responses",
-                    json=payload,
-                    headers={**headers, "Accept": "text/event-stream"},
-                ) as resp:
-                    if resp.status_code < 200 or resp.status_code >= 300:
-                        body = (await resp.aread()).decode("utf-8", errors="ignore")
-                        msg = f"AI 接口请求失败: HTTP {resp.status_code} {body[:200]}"
-                        yield _make_sse_payload(msg)
-                        return
-                    content_type = resp.headers.get("content-type", "")
-                    if "text/event-stream" in content_type:
-                        async for raw in _iter_sse_events(resp):
-                            if raw == "[DONE]":
-                                break
-                            chunk = _extract_stream_text(raw)
-                            if chunk:
-                                yield _make_sse_payload(chunk)
-                        return
-
+                body = (await resp.aread()).decode("utf-8", errors="ignore")
+                output_text = _extract_non_stream_text(provider, body)
+                for piece in _split_text(output_text):
+                    yield _make_sse_payload(piece)
+                return
+
+        if provider == "ark_responses":
+            payload = {
+                "model": model_name,
+                "stream": True,
+                "input": [{"role": "user", "content": [{"type": "input_text", "text": prompt}]}],
+            }
+            if model.temperature is not None:
+                payload["temperature"] = model.temperature
+            async with client.stream(
+                "POST",
+                f"{endpoint}/responses",
+                json=payload,
+                headers={"Accept": "text/event-stream"},
+            ) as resp:
+                if resp.status_code < 200 or resp.status_code >= 300:
                     body = (await resp.aread()).decode("utf-8", errors="ignore")
-                    output_text = _extract_non_stream_text(provider, body)
-                    for piece in _split_text(output_text):
-                        yield _make_sse_payload(piece)
+                    msg = f"AI 接口请求失败: HTTP {resp.status_code} {body[:200]}"
+                    yield _make_error_payload(msg, retryable=_is_retryable_status(resp.status_code))
+                    return
+                content_type = resp.headers.get("content-type", "")
+                if "text/event-stream" in content_type:
+                    async for raw in _iter_sse_events(resp):
+                        if raw == "[DONE]":
+                            break
+                        chunk = _extract_stream_text(raw)
+                        if chunk:
+                            yield _make_sse_payload(chunk)
                     return
 
-            yield _make_sse_payload("不支持的模型 provider，请在管理端检查配置")
-            return
+                body = (await resp.aread()).decode("utf-8", errors="ignore")
+                output_text = _extract_non_stream_text(provider, body)
+                for piece in _split_text(output_text):
+                    yield _make_sse_payload(piece)
+                return
+
+        yield _make_error_payload("不支持的模型 provider，请在管理端检查配置", retryable=True)
+        return
     except Exception as e:
         logger.exception("AI upstream request raised an exception")
-        yield _make_sse_payload(f"AI 请求异常: {_describe_upstream_exception(e)}")
+        yield _make_error_payload(f"AI 请求异常: {_describe_upstream_exception(e)}", retryable=True)
+
+
+async def generate_events(
+    db: AsyncSession,
+    *,
+    user_id: str,
+    question: str,
+    workflow: Optional[str] = None,
+    course_id: Optional[int] = None,
+    model_raw: Optional[str] = None,
+) -> AsyncGenerator[dict, None]:
+    """后台任务（如智能教案）使用：与 stream_qa 相同的模型选择、检索、调度与兜底，
+    不经过答案缓存与请求合并，产出解析后的事件（type 为 thinking / answer / error）"""
+    await sensitive_filter.refresh(db)
+    if sensitive_filter.contains(question):
+        yield {"type": "error", "content": _SENSITIVE_REFUSAL, "retryable": False}
+        return
+
+    app = await _load_workflow_app(db, workflow)
+    model = await _resolve_model(db, model_raw, app)
+    kb_ids = await _collect_kb_ids(db, app, course_id)
+    feature = _feature_of(app, course_id)
+
+    if model:
+        chain = [model, *await _resolve_fallback_models(db, model)]
+        prompt = await _build_prompt(db, question, kb_ids, _prompt_budget(chain, question))
+
+        def attempt(target: AiModelApi, started: Callable[[], None]) -> AsyncGenerator[str, None]:
+            return _scheduled(
+                _scheduler_for(target), user_id, feature, lambda: _call_model_api(target, prompt), started
+            )
+
+        stream = model_router.stream(
+            [(model_client_key(m.id), m) for m in chain],
+            attempt,
+            _classify_chunk,
+            can_hedge=lambda target: _scheduler_for(target).has_capacity(),
+        )
+    elif ai_client.api_key:
+        prompt = await _build_prompt(db, question, kb_ids)
+        stream = _scheduled(
+            model_schedulers.get("dashscope:qwen-turbo"),
+            user_id,
+            feature,
+            lambda: ai_client.call_stream_api(user_id, prompt, False),
+        )
+    else:
+        yield {"type": "error", "content": "AI 模型未配置，请在管理端配置并启用模型", "retryable": False}
+        return
+
+    async for chunk in _moderated(stream):
+        data = _parse_sse_payload(chunk)
+        if data is not None:
+            yield data
 
 
 @router.post("/qa/stream")
@@ -395,29 +589,93 @@ async def stream_qa(request: QARequest, db: AsyncSession = Depends(get_db)):
     if not question:
         raise HTTPException(status_code=400, detail="Question cannot be empty")
 
+    # 问题与回答都按敏感词自动机线性扫描一遍（词表由管理端维护，定期从数据库刷新）
+    await sensitive_filter.refresh(db)
+    if sensitive_filter.contains(question):
+        return StreamingResponse(_replay_cached_answer(_SENSITIVE_REFUSAL), media_type="text/event-stream", headers=SSE_HEADERS)
+
     app = await _load_workflow_app(db, request.workflow)
     model = await _resolve_model(db, request.model, app)
     kb_ids = await _collect_kb_ids(db, app, request.course_id)
-    prompt = await _build_prompt(db, question, kb_ids)
 
+    # 配置的模型不带多轮历史；DashScope 兜底通道携带历史时答案依赖上下文，不走缓存
+    cache_key: Optional[str] = None
+    if model or (ai_client.api_key and not request.history_flag):
+        model_key = f"db:{model.id}:{model.model_name}" if model else "dashscope:qwen-turbo"
+        cache_key = answer_cache.make_key(question, model_key, await knowledge_base_versions(db, kb_ids))
+        cached = await answer_cache.get(cache_key)
+        if cached:
+            return StreamingResponse(_replay_cached_answer(cached), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    feature = _feature_of(app, request.course_id)
     if model:
+        scheduler = _scheduler_for(model)
+    else:
+        scheduler = model_schedulers.get("dashscope:qwen-turbo")
+
+    chain = [model, *await _resolve_fallback_models(db, model)] if model else []
+    budget = _prompt_budget(chain, question) if chain else context_budget(None, None, question)
+
+    # 相同签名的请求正在生成时直接订阅，无需排队或再检索
+    prompt: Optional[str] = None
+    if not (cache_key and answer_flights.in_flight(cache_key)):
+        if model or ai_client.api_key:
+            try:
+                scheduler.admit()
+            except ModelOverloaded as exc:
+                raise HTTPException(
+                    status_code=429,
+                    detail="AI 服务繁忙，请稍后重试",
+                    headers={"Retry-After": str(exc.retry_after)},
+                )
+        prompt = await _build_prompt(db, question, kb_ids, budget)
+
+    async def resolved_prompt() -> str:
+        # 合并后的生成任务可能比发起它的请求活得更久（首个请求断开后仍为其他订阅者服务），
+        # 不能再使用请求的 db 会话；检索通常已在上面完成，这里只兜底
+        if prompt is not None:
+            return prompt
+        async with AsyncSessionLocal() as session:
+            return await _build_prompt(session, question, kb_ids, budget)
+
+    if model:
+        candidates = [(model_client_key(m.id), m) for m in chain]
+
+        def attempt(target: AiModelApi, started: Callable[[], None]) -> AsyncGenerator[str, None]:
+            async def upstream():
+                async for chunk in _call_model_api(target, await resolved_prompt()):
+                    yield chunk
+
+            return _scheduled(_scheduler_for(target), request.user_id, feature, upstream, started)
+
         async def gen():
             for step in _thinking_steps(kb_ids):
                 yield _make_sse_payload(step, "thinking")
-            async for chunk in _call_model_api(model, prompt):
+            routed = model_router.stream(
+                candidates,
+                attempt,
+                _classify_chunk,
+                can_hedge=lambda target: _scheduler_for(target).has_capacity(),
+            )
+            async for chunk in _record_answer(_moderated(routed), cache_key):
                 yield chunk
 
-        return StreamingResponse(gen(), media_type="text/event-stream", headers=SSE_HEADERS)
+        return StreamingResponse(_coalesce(cache_key, gen), media_type="text/event-stream", headers=SSE_HEADERS)
 
     if ai_client.api_key:
+        async def upstream_qwen():
+            async for chunk in ai_client.call_stream_api(request.user_id, await resolved_prompt(), request.history_flag):
+                yield chunk
+
         async def gen_qwen():
             for step in _thinking_steps(kb_ids):
                 yield _make_sse_payload(step, "thinking")
-            for chunk in ai_client.call_stream_api(request.user_id, prompt, request.history_flag):
+            stream = _scheduled(scheduler, request.user_id, feature, upstream_qwen)
+            async for chunk in _record_answer(_moderated(stream), cache_key):
                 yield chunk
 
         return StreamingResponse(
-            gen_qwen(),
+            _coalesce(cache_key, gen_qwen),
             media_type="text/event-stream",
             headers=SSE_HEADERS,
         )
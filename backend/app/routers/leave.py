@@ -6,7 +6,6 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, func, desc
 from typing import List, Optional
 from datetime import datetime, timedelta
-import shutil
 import os
 
 from ..database import get_db
@@ -17,6 +16,7 @@ from ..models.user import User
 from ..schemas.leave import LeaveCreate, LeaveResponse, LeaveApprove, LeaveRecall
 from ..dependencies.auth import get_current_user
 from ..services.socket_manager import sio, online_users
+from ..services.upload_storage import upload_storage
 
 router = APIRouter(prefix="/leave", tags=["请假管理"])
 
@@ -152,11 +152,8 @@ async def upload_proof(
         
     # 生成文件名
     timestamp = int(datetime.now().timestamp())
-    filename = f"{current_user.id}_{timestamp}_{file.filename}"
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    filename = f"{current_user.id}_{timestamp}_{os.path.basename(file.filename)}"
+    await upload_storage.save(file, UPLOAD_DIR, filename, category="leave")
         
     # 返回相对路径
     return {"url": f"/static/uploads/leave/{filename}"}
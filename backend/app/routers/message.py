@@ -18,6 +18,7 @@ from ..schemas.message import (
 )
 from ..dependencies.auth import get_current_user
 from ..dependencies.permissions import check_chat_permission
+from ..services.sensitive_filter import sensitive_filter
 from ..services.socket_manager import sio, online_users
 
 router = APIRouter(tags=["即时通讯"])
@@ -60,12 +61,18 @@ async def send_message(
         raise HTTPException(status_code=404, detail="Target user not found")
     to_role = target_user.role
 
+    # 4. 文本消息中的敏感词替换为 *
+    content = msg.content
+    if msg.type == MessageType.TEXT:
+        await sensitive_filter.refresh(db)
+        content = sensitive_filter.mask(content)
+
     new_msg = Message(
         from_id=msg.from_id,
         from_role=from_role,
         to_id=msg.to_id,
         to_role=to_role,
-        content=msg.content,
+        content=content,
         type=msg.type.value,
         send_time=datetime.now(),
         is_read=0
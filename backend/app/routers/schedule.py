@@ -1,21 +1,24 @@
+import asyncio
+import json
 from datetime import date, datetime, time, timedelta
 
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import delete, select
+from sqlalchemy import delete, insert, or_, select
 from ..schemas.schedule import (
+    ScheduleJobStatus,
     ScheduleRequest,
     ScheduleResponse,
     ScheduleSaveRequest,
 )
-from ..algorithms.schedule_genetic import GeneticSchedule
 from ..database import get_db
 from ..dependencies.auth import get_current_admin
-from ..models.schedule import Classroom, Schedule
+from ..models.schedule import Classroom, ClassroomResource, Schedule
 from ..models.course import Course, Teacher
-from ..models.teaching import WorkSchedule, WorkType
+from ..models.teaching import AdjustStatus, ClassAdjust, WorkSchedule, WorkType
 from ..models.user import User
-import time as pytime
+from ..services.schedule_jobs import FINISHED_STATES, schedule_job_manager
 
 router = APIRouter(prefix="/schedule", tags=["Schedule Management"])
 
@@ -35,48 +38,168 @@ def _current_week_monday(today: date | None = None) -> date:
     return base - timedelta(days=base.weekday())
 
 
-async def _resolve_teacher_user_id(db: AsyncSession, teacher_id: str) -> int | None:
-    tid = str(teacher_id or "").strip()
-    if not tid:
-        return None
-    user = (await db.execute(select(User).where(User.username == tid))).scalars().first()
-    if user:
-        return int(user.id)
-    if tid.isdigit():
-        user = (await db.execute(select(User).where(User.id == int(tid)))).scalars().first()
-        if user:
-            return int(user.id)
-    return None
+async def _resolve_teacher_user_ids(db: AsyncSession, teacher_ids) -> dict[str, int]:
+    """一次查询解析所有教师对应的 User.id：优先按用户名（工号）匹配，其次按数字 id 匹配。"""
+    tids = {str(tid or "").strip() for tid in teacher_ids}
+    tids.discard("")
+    if not tids:
+        return {}
+    digit_ids = {int(tid) for tid in tids if tid.isdigit()}
+    conditions = [User.username.in_(tids)]
+    if digit_ids:
+        conditions.append(User.id.in_(digit_ids))
+    rows = (await db.execute(select(User.id, User.username).where(or_(*conditions)))).all()
+    by_username = {str(username): int(uid) for uid, username in rows}
+    by_id = {int(uid) for uid, _ in rows}
+    resolved: dict[str, int] = {}
+    for tid in tids:
+        if tid in by_username:
+            resolved[tid] = by_username[tid]
+        elif tid.isdigit() and int(tid) in by_id:
+            resolved[tid] = int(tid)
+    return resolved
 
 
 def _resolve_period_time(period: int) -> time:
     return _PERIOD_STARTS.get(period, time(8, 0))
 
+
+def _resolve_period_index(value: time) -> int:
+    # 取开始时间不晚于 value 的最后一节课
+    period = 0
+    for idx, start in sorted(_PERIOD_STARTS.items()):
+        if start <= value:
+            period = idx
+    return period
+
+
+async def _prepare_warm_start(db: AsyncSession, request: ScheduleRequest):
+    """根据已保存的排课构造增量重排的种子。
+
+    未变动的排课固定（pinned）；停用（维修/报废）教室中的排课被移除；
+    已审批的调课若仍对应原时间段，则按新时间/教室固定。
+    返回 (去掉停用教室后的 request, 种子列表)。
+    """
+    unavailable = set(
+        (
+            await db.execute(
+                select(ClassroomResource.classroom_id).where(ClassroomResource.status.in_(["maintenance", "scrapped"]))
+            )
+        ).scalars().all()
+    )
+    classrooms = [room for room in request.classrooms if int(room.id) not in unavailable]
+    request = request.model_copy(update={"classrooms": classrooms})
+
+    rows = (await db.execute(select(Schedule).order_by(Schedule.id))).scalars().all()
+    # 教师变更的课程只作为初始种子，不固定；按原排课行的教师判断，之后的调课只移动时间/教室
+    course_teachers = {int(c.id): str(c.teacher_id) for c in request.courses}
+    entries = {
+        (int(row.course_id), int(row.day), int(row.period)): {
+            "course_id": int(row.course_id),
+            "classroom_id": int(row.classroom_id),
+            "day": int(row.day),
+            "period": int(row.period),
+            "pinned": course_teachers.get(int(row.course_id)) == str(row.teacher_id),
+        }
+        for row in rows
+    }
+
+    room_ids_by_name = {room.name: int(room.id) for room in classrooms}
+    adjusts = (
+        await db.execute(select(ClassAdjust).where(ClassAdjust.status == AdjustStatus.APPROVED.value))
+    ).scalars().all()
+    for adjust in adjusts:
+        old_key = (int(adjust.course_id), adjust.old_time.weekday(), _resolve_period_index(adjust.old_time.time()))
+        entry = entries.pop(old_key, None)
+        if entry is None:
+            continue  # 已应用过或原排课不存在
+        entry = dict(entry, day=adjust.new_time.weekday(), period=_resolve_period_index(adjust.new_time.time()))
+        if adjust.new_classroom:
+            entry["classroom_id"] = room_ids_by_name.get(adjust.new_classroom, entry["classroom_id"])
+        entries[(entry["course_id"], entry["day"], entry["period"])] = entry
+    return request, list(entries.values())
+
 @router.post("/generate", response_model=ScheduleResponse)
 async def generate_schedule(
     request: ScheduleRequest,
+    db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_admin),
 ):
-    start_time = pytime.time()
-    
-    ga = GeneticSchedule(request.teachers, request.courses, request.classrooms)
-    best_schedule, stats = ga.evolve()
-    
-    if best_schedule is None:
+    warm_start_entries = None
+    if request.warm_start:
+        request, warm_start_entries = await _prepare_warm_start(db, request)
+    # 遗传算法在线程池中运行，避免阻塞事件循环
+    try:
+        return await schedule_job_manager.solve(request, warm_start_entries)
+    except RuntimeError:
         raise HTTPException(status_code=500, detail="Failed to generate schedule")
-    
-    formatted_schedule = ga.format_result(best_schedule)
-    entries = ga.schedule_to_entries(best_schedule)
-    
-    end_time = pytime.time()
-    print(f"Scheduling took {end_time - start_time:.2f} seconds")
-    
-    return ScheduleResponse(
-        schedule=formatted_schedule,
-        fitness=stats["fitness"],
-        utilization=stats["utilization"],
-        conflict_rate=stats["conflicts"],
-        entries=entries,
+
+
+def _get_job_or_404(job_id: str):
+    job = schedule_job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="排课任务不存在或已过期")
+    return job
+
+
+@router.post("/jobs", response_model=ScheduleJobStatus)
+async def submit_schedule_job(
+    request: ScheduleRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_admin),
+):
+    warm_start_entries = None
+    if request.warm_start:
+        request, warm_start_entries = await _prepare_warm_start(db, request)
+    job = schedule_job_manager.submit(request, int(current_user.id), warm_start_entries)
+    return job.snapshot()
+
+
+@router.get("/jobs/{job_id}", response_model=ScheduleJobStatus)
+async def get_schedule_job(
+    job_id: str,
+    current_user=Depends(get_current_admin),
+):
+    return _get_job_or_404(job_id).snapshot()
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=ScheduleJobStatus)
+async def cancel_schedule_job(
+    job_id: str,
+    current_user=Depends(get_current_admin),
+):
+    job = _get_job_or_404(job_id)
+    schedule_job_manager.cancel(job)
+    return job.snapshot()
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_schedule_job(
+    job_id: str,
+    current_user=Depends(get_current_admin),
+):
+    job = _get_job_or_404(job_id)
+
+    async def gen():
+        queue = schedule_job_manager.subscribe(job)
+        try:
+            # 先推送当前状态，再持续推送每代进度，直到任务结束
+            event = job.event(job.status if job.status in FINISHED_STATES else "progress")
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+            while event["type"] not in FINISHED_STATES:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            schedule_job_manager.unsubscribe(job, queue)
+
+    return StreamingResponse(
+        gen(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"},
     )
 
 
@@ -86,10 +209,6 @@ async def save_schedule(
     db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_admin),
 ):
-    if payload.clear_existing:
-        await db.execute(delete(Schedule))
-        await db.execute(delete(WorkSchedule).where(WorkSchedule.remark.like(f"{_SYNC_REMARK_PREFIX}%")))
-
     course_ids = {int(entry.course_id) for entry in payload.entries}
     classroom_ids = {int(entry.classroom_id) for entry in payload.entries}
 
@@ -106,39 +225,75 @@ async def save_schedule(
     if classroom_ids:
         res = await db.execute(select(Classroom).where(Classroom.id.in_(classroom_ids)))
         classrooms = {int(c.id): c for c in res.scalars().all()}
+    user_ids = await _resolve_teacher_user_ids(db, {entry.teacher_id for entry in payload.entries})
 
     monday = _current_week_monday()
 
+    schedule_rows = {}
+    work_rows = {}
     for entry in payload.entries:
-        schedule_row = Schedule(
-            course_id=entry.course_id,
-            classroom_id=entry.classroom_id,
-            teacher_id=entry.teacher_id,
-            day=entry.day,
-            period=entry.period,
-        )
-        db.add(schedule_row)
+        schedule_row = {
+            "course_id": int(entry.course_id),
+            "classroom_id": int(entry.classroom_id),
+            "teacher_id": str(entry.teacher_id),
+            "day": int(entry.day),
+            "period": int(entry.period),
+        }
+        schedule_rows[tuple(schedule_row.values())] = schedule_row
 
+        user_id = user_ids.get(str(entry.teacher_id).strip())
+        if user_id is None:
+            continue
         course = courses.get(int(entry.course_id))
         classroom = classrooms.get(int(entry.classroom_id))
         teacher_name = teachers.get(str(entry.teacher_id)).name if teachers.get(str(entry.teacher_id)) else f"教师{entry.teacher_id}"
         course_name = course.name if course else f"课程{entry.course_id}"
         classroom_name = classroom.name if classroom else f"教室{entry.classroom_id}"
+        class_date = monday + timedelta(days=int(entry.day))
+        work_row = {
+            "teacher_id": user_id,
+            "time": datetime.combine(class_date, _resolve_period_time(int(entry.period))),
+            "content": f"{course_name}（{classroom_name}）",
+            "type": WorkType.CLASS.value,
+            "remark": f"{_SYNC_REMARK_PREFIX}班级/教室:{classroom_name} 教师:{teacher_name}",
+        }
+        work_rows[(work_row["teacher_id"], work_row["time"], work_row["content"], work_row["remark"])] = work_row
 
-        user_id = await _resolve_teacher_user_id(db, str(entry.teacher_id))
-        if user_id is not None:
-            class_date = monday + timedelta(days=int(entry.day))
-            period_time = _resolve_period_time(int(entry.period))
-            schedule_time = datetime.combine(class_date, period_time)
-            db.add(
-                WorkSchedule(
-                    teacher_id=user_id,
-                    time=schedule_time,
-                    content=f"{course_name}（{classroom_name}）",
-                    type=WorkType.CLASS.value,
-                    remark=f"{_SYNC_REMARK_PREFIX}班级/教室:{classroom_name} 教师:{teacher_name}",
+    try:
+        if payload.clear_existing:
+            # 与现有数据做差异比对：只删除不再需要的行、只插入新增的行
+            existing = (
+                await db.execute(
+                    select(Schedule.id, Schedule.course_id, Schedule.classroom_id, Schedule.teacher_id, Schedule.day, Schedule.period)
                 )
-            )
+            ).all()
+            stale_ids = []
+            for row_id, *key in existing:
+                key = (int(key[0]), int(key[1]), str(key[2]), int(key[3]), int(key[4]))
+                if schedule_rows.pop(key, None) is None:
+                    stale_ids.append(row_id)
+            if stale_ids:
+                await db.execute(delete(Schedule).where(Schedule.id.in_(stale_ids)))
+
+            existing = (
+                await db.execute(
+                    select(WorkSchedule.id, WorkSchedule.teacher_id, WorkSchedule.time, WorkSchedule.content, WorkSchedule.remark)
+                    .where(WorkSchedule.remark.like(f"{_SYNC_REMARK_PREFIX}%"))
+                )
+            ).all()
+            stale_ids = []
+            for row_id, *key in existing:
+                if work_rows.pop(tuple(key), None) is None:
+                    stale_ids.append(row_id)
+            if stale_ids:
+                await db.execute(delete(WorkSchedule).where(WorkSchedule.id.in_(stale_ids)))
 
-    await db.commit()
+        if schedule_rows:
+            await db.execute(insert(Schedule), list(schedule_rows.values()))
+        if work_rows:
+            await db.execute(insert(WorkSchedule), list(work_rows.values()))
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
     return {"message": "Schedule saved", "count": len(payload.entries)}
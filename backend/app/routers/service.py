@@ -5,11 +5,11 @@ from typing import List, Optional, Dict, Any
 from datetime import datetime
 import json
 import os
-import shutil
 from ..database import get_db
 from ..models.service import ServiceItem, ServiceApply, ServiceApplyConfig, ServiceUpload
 from ..models.user import User
 from ..dependencies.auth import get_current_user
+from ..services.upload_storage import upload_storage
 from pydantic import BaseModel, Field
 
 router = APIRouter(
@@ -108,7 +108,7 @@ class ServiceItemUpsert(BaseModel):
     config: Optional[ServiceItemConfigIn] = None
 
 
-def _save_upload(file: UploadFile, user_id: int) -> Dict[str, Any]:
+async def _save_upload(file: UploadFile, user_id: int) -> Dict[str, Any]:
     filename = file.filename
     if not filename:
         raise HTTPException(status_code=400, detail="Empty filename")
@@ -118,15 +118,13 @@ def _save_upload(file: UploadFile, user_id: int) -> Dict[str, Any]:
         raise HTTPException(status_code=400, detail="Unsupported file type")
 
     timestamp = int(datetime.now().timestamp())
-    safe_name = filename.replace(" ", "_")
+    safe_name = os.path.basename(filename).replace(" ", "_")
     final_name = f"{user_id}_{timestamp}_{safe_name}"
-    file_path = os.path.join(UPLOAD_DIR, final_name)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    saved = await upload_storage.save(file, UPLOAD_DIR, final_name, category="service")
     return {
         "url": f"/static/uploads/service/{final_name}",
         "name": filename,
-        "size": os.path.getsize(file_path),
+        "size": saved["file_size"],
         "mime_type": file.content_type,
     }
 
@@ -173,7 +171,7 @@ async def upload_material(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    meta = _save_upload(file, current_user.id)
+    meta = await _save_upload(file, current_user.id)
 
     db_upload = ServiceUpload(
         user_id=current_user.id,
@@ -17,8 +17,12 @@ class AiModelApiBase(BaseModel):
     api_version: Optional[str] = Field(None, description="API 版本号（Azure/OpenAI）")
     timeout_seconds: int = Field(30, ge=1, le=600)
     quota_per_hour: int = Field(0, ge=0)
+    max_concurrency: int = Field(0, ge=0, le=1000, description="同时进行的上游请求数，0 使用默认值")
+    rate_limit_per_minute: int = Field(0, ge=0, description="每分钟请求数上限，0 表示不限速")
+    priority: int = Field(0, description="兜底顺序，越大越靠前；负数表示不参与兜底")
     temperature: Optional[float] = Field(None, ge=0, le=2)
     max_output_tokens: Optional[int] = Field(None, ge=32, le=32768)
+    context_window: int = Field(0, ge=0, le=2000000, description="模型上下文长度（token），0 使用默认值")
     enabled: bool = True
     is_default: bool = False
 
@@ -38,8 +42,12 @@ class AiModelApiUpdate(BaseModel):
     api_version: Optional[str] = None
     timeout_seconds: Optional[int] = Field(default=None, ge=1, le=600)
     quota_per_hour: Optional[int] = Field(default=None, ge=0)
+    max_concurrency: Optional[int] = Field(default=None, ge=0, le=1000)
+    rate_limit_per_minute: Optional[int] = Field(default=None, ge=0)
+    priority: Optional[int] = None
     temperature: Optional[float] = Field(default=None, ge=0, le=2)
     max_output_tokens: Optional[int] = Field(default=None, ge=32, le=32768)
+    context_window: Optional[int] = Field(default=None, ge=0, le=2000000)
     enabled: Optional[bool] = None
     is_default: Optional[bool] = None
 
@@ -55,8 +63,12 @@ class AiModelApiOut(BaseModel):
     api_version: Optional[str] = None
     timeout_seconds: int
     quota_per_hour: int
+    max_concurrency: int = 0
+    rate_limit_per_minute: int = 0
+    priority: int = 0
     temperature: Optional[float] = None
     max_output_tokens: Optional[int] = None
+    context_window: int = 0
     enabled: bool
     is_default: bool
     created_at: datetime
@@ -136,6 +148,8 @@ class AiKbDocumentOut(BaseModel):
     created_at: datetime
     updated_at: Optional[datetime] = None
     chunk_count: Optional[int] = None
+    ingest_status: str = "ready"  # processing / ready / failed
+    ingest_error: Optional[str] = None
 
 
 class AiKbDocumentPreviewOut(BaseModel):
@@ -213,6 +227,14 @@ class AiCustomerServiceSettingsUpdate(BaseModel):
     system_prompt_template: Optional[str] = None
 
 
+class AiSensitiveWordsOut(BaseModel):
+    words: List[str] = Field(default_factory=list)
+
+
+class AiSensitiveWordsUpdate(BaseModel):
+    words: List[str] = Field(default_factory=list)
+
+
 class PublicAiModelOut(BaseModel):
     id: int
     name: str
@@ -33,6 +33,8 @@ class TeacherKbDocumentOut(BaseModel):
     file_size: int
     created_at: datetime
     updated_at: Optional[datetime] = None
+    ingest_status: str = "ready"  # processing / ready / failed
+    ingest_error: Optional[str] = None
 
 
 class TeacherKbUpdateRequest(BaseModel):
@@ -66,6 +68,8 @@ class LessonPlanTaskCreate(BaseModel):
     title: str = Field(..., description="教案标题", max_length=200)
     outline: Optional[str] = Field(None, description="课件大纲/思路")
     course_id: Optional[int] = Field(None, description="关联课程，可选")
+    prompt: Optional[str] = Field(None, description="完整提示词，为空时按标题与大纲生成")
+    model_api_id: Optional[int] = Field(None, description="指定模型，默认使用智能教案应用配置的模型")
 
 
 class LessonPlanTaskResultUpdate(BaseModel):
@@ -82,6 +86,7 @@ class LessonPlanTaskOut(BaseModel):
     status: str
     result: Optional[str] = None
     error_message: Optional[str] = None
+    attempts: int = 0
     knowledge_base_id: Optional[int] = None
     model_api_id: Optional[int] = None
     created_at: datetime
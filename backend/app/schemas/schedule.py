@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Literal, Optional
 
 
 class TeacherItem(BaseModel):
@@ -25,6 +25,12 @@ class ScheduleRequest(BaseModel):
     teachers: List[TeacherItem]
     courses: List[CourseItem]
     classrooms: List[ClassroomItem]
+    island_count: int = Field(1, ge=1, le=32, description="岛屿模型子种群数量（多进程并行），1 表示单种群")
+    warm_start: bool = Field(False, description="基于已保存的排课结果增量重排，仅调整变动部分")
+    post_optimizers: List[Literal["repair", "tabu", "anneal"]] = Field(
+        default_factory=lambda: ["repair", "tabu"],
+        description="遗传算法结束后依次执行的局部搜索阶段（冲突修复 / 禁忌搜索 / 模拟退火），为空则跳过",
+    )
 
 
 class ScheduleEntry(BaseModel):
@@ -43,6 +49,16 @@ class ScheduleResponse(BaseModel):
     entries: List[ScheduleEntry]
 
 
+class ScheduleJobStatus(BaseModel):
+    job_id: str
+    status: str = Field(..., description="pending / running / completed / failed / cancelled")
+    generation: int = 0
+    fitness: Optional[float] = None
+    conflicts: Optional[int] = None
+    error: Optional[str] = None
+    result: Optional[ScheduleResponse] = None
+
+
 class ScheduleSaveRequest(BaseModel):
     entries: List[ScheduleEntry]
     clear_existing: bool = True
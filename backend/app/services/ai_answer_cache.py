@@ -0,0 +1,142 @@
+"""
+AI 问答答案缓存
+键由规范化后的问题、模型、参与检索的知识库及其内容版本组成：知识库文档增删会递增内容版本，
+旧答案随之失效，不会把过期或其他课程的答案返回给学生。
+进程内 LRU 为一级缓存，可选 Redis 作为多进程共享的二级缓存（不可用时自动降级为仅本地）。
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional, Sequence, Tuple
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+_SPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT = "?？.。!！~～ "
+# Redis 出错后暂停使用的时间，避免每个请求都等待连接超时
+_REDIS_COOLDOWN_SECONDS = 60.0
+
+
+def normalize_question(question: str) -> str:
+    """全半角统一、小写、合并空白、去掉句末标点，使“请问选课时间？”与“请问选课时间”命中同一条缓存"""
+    text = unicodedata.normalize("NFKC", question or "").lower()
+    text = _SPACE_RE.sub(" ", text).strip()
+    return text.rstrip(_TRAILING_PUNCT)
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        ttl_seconds: int = 3600,
+        redis_client=None,
+        prefix: str = "ai:answer:",
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.redis = redis_client
+        self.prefix = prefix
+        self._local: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._redis_paused_until = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, question: str, model_key: str, kb_versions: Sequence[Tuple[int, int]]) -> str:
+        raw = json.dumps(
+            {
+                "q": normalize_question(question),
+                "model": model_key,
+                "kb": sorted([int(kb_id), int(version)] for kb_id, version in kb_versions),
+            },
+            ensure_ascii=False,
+        )
+        return self.prefix + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _redis_available(self) -> bool:
+        return self.redis is not None and time.monotonic() >= self._redis_paused_until
+
+    def _pause_redis(self) -> None:
+        logger.warning("Answer cache Redis unavailable, using in-process cache only for %ss", _REDIS_COOLDOWN_SECONDS)
+        self._redis_paused_until = time.monotonic() + _REDIS_COOLDOWN_SECONDS
+
+    def _get_local(self, key: str) -> Optional[str]:
+        item = self._local.get(key)
+        if item is None:
+            return None
+        expires_at, answer = item
+        if expires_at < time.monotonic():
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return answer
+
+    def _set_local(self, key: str, answer: str, ttl: float) -> None:
+        self._local[key] = (time.monotonic() + ttl, answer)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[str]:
+        answer = self._get_local(key)
+        if answer is None and self._redis_available():
+            try:
+                value = await self.redis.get(key)
+                if value is not None:
+                    answer = value.decode("utf-8") if isinstance(value, bytes) else str(value)
+                    ttl = await self.redis.ttl(key)
+                    self._set_local(key, answer, ttl if ttl and ttl > 0 else self.ttl_seconds)
+            except Exception:
+                self._pause_redis()
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer
+
+    async def set(self, key: str, answer: str) -> None:
+        if not answer:
+            return
+        self._set_local(key, answer, self.ttl_seconds)
+        if self._redis_available():
+            try:
+                await self.redis.set(key, answer, ex=self.ttl_seconds)
+            except Exception:
+                self._pause_redis()
+
+    def clear(self) -> None:
+        self._local.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._local), "hits": self.hits, "misses": self.misses}
+
+
+def _build_redis_client():
+    if os.getenv("AI_ANSWER_CACHE_REDIS", "1") == "0":
+        return None
+    try:
+        import redis.asyncio as aioredis
+
+        return aioredis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB,
+            password=settings.REDIS_PASSWORD,
+            socket_connect_timeout=0.5,
+            socket_timeout=1.0,
+        )
+    except Exception:
+        return None
+
+
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("AI_ANSWER_CACHE_SIZE", 2048)),
+    ttl_seconds=int(os.getenv("AI_ANSWER_CACHE_TTL", 3600)),
+    redis_client=_build_redis_client(),
+)
@@ -0,0 +1,117 @@
+"""
+AI 配置缓存
+问答请求需要的工作流应用、模型 API 与课程知识库映射整体加载到进程内快照，请求时按字典查找，无需逐项查询数据库。
+管理端增删改这些配置时调用 invalidate() 递增版本号，下一个请求重新加载；
+多进程部署时其他进程的快照最迟在 ttl_seconds 后刷新。
+快照中的对象是与会话无关的副本，只读使用，不要修改或加入会话。
+"""
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from sqlalchemy import inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.ai_config import AiKnowledgeBase, AiModelApi, AiWorkflowApp
+
+
+def _detached_copy(obj):
+    mapper = inspect(type(obj))
+    return type(obj)(**{attr.key: getattr(obj, attr.key) for attr in mapper.column_attrs})
+
+
+class AiConfigSnapshot:
+    def __init__(
+        self,
+        apps: List[AiWorkflowApp],
+        models: List[AiModelApi],
+        course_kbs: Dict[int, List[int]],
+        version: int,
+    ):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.apps: Dict[str, AiWorkflowApp] = {app.code: app for app in apps}
+        self.models: Dict[int, AiModelApi] = {model.id: model for model in models}
+        # 与原先“启用的默认模型”查询相同的顺序
+        self.enabled_models: List[AiModelApi] = sorted(
+            (m for m in models if m.enabled), key=lambda m: (not m.is_default, -m.id)
+        )
+        self.course_kbs = course_kbs
+
+    def app(self, code: Optional[str]) -> Optional[AiWorkflowApp]:
+        return self.apps.get(code) if code else None
+
+    def enabled_model(self, model_id: Optional[int]) -> Optional[AiModelApi]:
+        model = self.models.get(model_id) if model_id else None
+        return model if model is not None and model.enabled else None
+
+    def default_model(self) -> Optional[AiModelApi]:
+        return self.enabled_models[0] if self.enabled_models else None
+
+    def course_kb_ids(self, course_id: Optional[int]) -> List[int]:
+        return list(self.course_kbs.get(int(course_id), [])) if course_id else []
+
+
+class AiConfigCache:
+    def __init__(self, ttl_seconds: float = 30.0):
+        self.ttl_seconds = ttl_seconds
+        self.version = 0
+        self._snapshot: Optional[AiConfigSnapshot] = None
+        # 快照来自哪个数据库引擎；换了引擎（测试、多库）即重新加载
+        self._bind = None
+        self.loads = 0
+
+    def invalidate(self) -> None:
+        self.version += 1
+
+    def _fresh(self, bind) -> bool:
+        snapshot = self._snapshot
+        return (
+            snapshot is not None
+            and snapshot.version == self.version
+            and self._bind is bind
+            and time.monotonic() - snapshot.loaded_at < self.ttl_seconds
+        )
+
+    async def snapshot(self, db: AsyncSession) -> AiConfigSnapshot:
+        bind = db.get_bind()
+        if self._fresh(bind):
+            return self._snapshot
+        # 加载期间若再次失效，快照带的是旧版本号，下一个请求会重新加载
+        version = self.version
+        apps = (await db.execute(select(AiWorkflowApp))).scalars().all()
+        models = (await db.execute(select(AiModelApi))).scalars().all()
+        rows = (
+            await db.execute(
+                select(AiKnowledgeBase.course_id, AiKnowledgeBase.id)
+                .where(AiKnowledgeBase.course_id != None)  # noqa: E711
+                .order_by(AiKnowledgeBase.id)
+            )
+        ).all()
+        course_kbs: Dict[int, List[int]] = defaultdict(list)
+        for course_id, kb_id in rows:
+            course_kbs[int(course_id)].append(int(kb_id))
+        snapshot = AiConfigSnapshot(
+            [_detached_copy(a) for a in apps],
+            [_detached_copy(m) for m in models],
+            dict(course_kbs),
+            version,
+        )
+        self._snapshot = snapshot
+        self._bind = bind
+        self.loads += 1
+        return snapshot
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "version": self.version,
+            "loads": self.loads,
+            "apps": len(snapshot.apps) if snapshot else 0,
+            "models": len(snapshot.models) if snapshot else 0,
+            "age_seconds": round(time.monotonic() - snapshot.loaded_at, 1) if snapshot else None,
+        }
+
+
+ai_config_cache = AiConfigCache(ttl_seconds=float(os.getenv("AI_CONFIG_CACHE_TTL", 30)))
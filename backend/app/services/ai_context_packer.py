@@ -0,0 +1,159 @@
+"""
+问答上下文打包
+检索结果不再原样拼接：同一文档中相邻的片段合并并去掉切分时的重叠部分，近似重复的段落只保留一段，
+再按最大边际相关（MMR）在相关性与多样性之间取舍，装满按模型上下文长度与输出上限算出的 token 预算为止。
+"""
+import math
+import os
+import re
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+from ..models.ai_config import AiKnowledgeBaseChunk
+from .text_tokenizer import split_tokens
+
+DEFAULT_CONTEXT_WINDOW = int(os.getenv("AI_CONTEXT_WINDOW_TOKENS", 8192))
+DEFAULT_MAX_OUTPUT_TOKENS = int(os.getenv("AI_DEFAULT_MAX_OUTPUT_TOKENS", 1024))
+# 无论模型窗口多大，知识库片段最多占用的 token 数（更短的提示词首字更快）
+MAX_CONTEXT_TOKENS = int(os.getenv("AI_CONTEXT_MAX_TOKENS", 3000))
+# 提示词模板与片段编号的开销
+_PROMPT_OVERHEAD_TOKENS = 64
+_MMR_LAMBDA = 0.7
+_DUPLICATE_SIMILARITY = 0.8
+# 相邻片段重叠部分的最短长度，过短的公共前后缀视为巧合
+_MIN_OVERLAP_CHARS = 8
+_MAX_OVERLAP_CHARS = 240
+
+_CJK_RE = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文字符与全角标点约 1 token，其余字符约 4 个 1 token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def context_budget(context_window: Optional[int], max_output_tokens: Optional[int], question: str) -> int:
+    """片段可用的 token 预算：上下文长度 - 输出上限 - 问题与模板，再受 MAX_CONTEXT_TOKENS 限制"""
+    window = context_window or DEFAULT_CONTEXT_WINDOW
+    output = max_output_tokens or DEFAULT_MAX_OUTPUT_TOKENS
+    budget = window - output - _PROMPT_OVERHEAD_TOKENS - estimate_tokens(question)
+    return max(0, min(MAX_CONTEXT_TOKENS, budget))
+
+
+class Passage:
+    """一段待放入提示词的文本：单个片段，或同一文档中若干相邻片段合并而成"""
+
+    def __init__(self, chunk: AiKnowledgeBaseChunk, score: float):
+        self.document_id = chunk.document_id
+        self.title = chunk.document_title
+        self.first_seq = chunk.seq or 0
+        self.last_seq = self.first_seq
+        self.chunk_ids = [chunk.id]
+        self.text = (chunk.content or "").strip()
+        self.score = float(score)
+        self.terms: Set[str] = _terms_of(chunk)
+
+    def can_follow(self, chunk: AiKnowledgeBaseChunk) -> bool:
+        return self.document_id is not None and chunk.document_id == self.document_id and chunk.seq == self.last_seq + 1
+
+    def extend(self, chunk: AiKnowledgeBaseChunk, score: float) -> None:
+        text = (chunk.content or "").strip()
+        self.text += text[_overlap_length(self.text, text):]
+        self.last_seq = chunk.seq
+        self.chunk_ids.append(chunk.id)
+        self.score = max(self.score, float(score))
+        self.terms |= _terms_of(chunk)
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.text)
+
+
+def _terms_of(chunk: AiKnowledgeBaseChunk) -> Set[str]:
+    terms = set(split_tokens(chunk.tokens)) if chunk.tokens else set()
+    if not terms:
+        # 旧片段没有分词结果时退化为字符二元组
+        text = chunk.content or ""
+        terms = {text[i : i + 2] for i in range(len(text) - 1)}
+    return terms
+
+
+def _overlap_length(prev: str, nxt: str) -> int:
+    """prev 的后缀与 nxt 的前缀重合的最大长度（split_text_into_chunks 会把上一块末尾带入下一块）"""
+    upper = min(len(prev), len(nxt), _MAX_OVERLAP_CHARS)
+    for size in range(upper, _MIN_OVERLAP_CHARS - 1, -1):
+        if prev.endswith(nxt[:size]):
+            return size
+    return 0
+
+
+def _similarity(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def merge_adjacent(chunks: Iterable[Tuple[AiKnowledgeBaseChunk, float]]) -> List[Passage]:
+    """同一文档中 seq 连续的片段合并为一段；结果按分数从高到低排列"""
+    ordered = sorted(chunks, key=lambda item: (item[0].document_id is None, item[0].document_id or 0, item[0].seq or 0))
+    passages: List[Passage] = []
+    seen: Set[int] = set()
+    for chunk, score in ordered:
+        if chunk.id in seen or not (chunk.content or "").strip():
+            continue
+        seen.add(chunk.id)
+        if passages and passages[-1].can_follow(chunk):
+            passages[-1].extend(chunk, score)
+        else:
+            passages.append(Passage(chunk, score))
+    passages.sort(key=lambda p: p.score, reverse=True)
+    return passages
+
+
+def select_passages(passages: Sequence[Passage], budget_tokens: int, mmr_lambda: float = _MMR_LAMBDA) -> List[Passage]:
+    """按 MMR 依次挑选放得进剩余预算的段落；近似重复的段落直接跳过"""
+    if not passages or budget_tokens <= 0:
+        return []
+    top_score = max(p.score for p in passages)
+    if top_score > 0:
+        relevance = {id(p): p.score / top_score for p in passages}
+    else:
+        # 没有检索分数（按时间兜底取的片段）时按原顺序递减
+        relevance = {id(p): 1.0 / (1 + rank) for rank, p in enumerate(passages)}
+
+    remaining = list(passages)
+    selected: List[Passage] = []
+    left = budget_tokens
+    while remaining:
+        best: Optional[Passage] = None
+        best_value = -math.inf
+        for passage in list(remaining):
+            redundancy = max((_similarity(passage.terms, s.terms) for s in selected), default=0.0)
+            if redundancy >= _DUPLICATE_SIMILARITY or passage.tokens > left:
+                remaining.remove(passage)
+                continue
+            value = mmr_lambda * relevance[id(passage)] - (1 - mmr_lambda) * redundancy
+            if value > best_value:
+                best, best_value = passage, value
+        if best is None:
+            break
+        selected.append(best)
+        remaining.remove(best)
+        left -= best.tokens
+
+    if not selected:
+        # 最相关的一段单独就超出预算：截断后放入，总比没有上下文好
+        first = passages[0]
+        cut = first.text
+        while cut and estimate_tokens(cut) > budget_tokens:
+            cut = cut[: max(0, len(cut) - max(1, len(cut) // 8))]
+        if cut:
+            first.text = cut
+            selected.append(first)
+    return selected
+
+
+def pack_context(chunks: Sequence[Tuple[AiKnowledgeBaseChunk, float]], budget_tokens: int) -> List[Passage]:
+    return select_passages(merge_adjacent(chunks), budget_tokens)
@@ -0,0 +1,183 @@
+"""
+上游模型服务 HTTP 客户端池
+每个模型配置对应一个长期存活的 httpx.AsyncClient（HTTP/2 + keep-alive 连接池），
+问答请求复用已建立的 TCP/TLS 连接，不再为每个问题重新握手。
+配置（地址、请求头、超时）变化时自动换新客户端，旧客户端在在途请求结束后关闭；应用停止时统一关闭。
+"""
+import asyncio
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import time
+from typing import Callable, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 未安装 h2 时退回 HTTP/1.1 keep-alive
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class _PooledClient:
+    def __init__(self, fingerprint: str, loop: asyncio.AbstractEventLoop):
+        self.client: Optional[httpx.AsyncClient] = None
+        self.fingerprint = fingerprint
+        self.loop = loop
+        self.created_at = time.time()
+        self.requests = 0
+
+
+class ProviderClientRegistry:
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 120.0,
+        http2: bool = True,
+        retire_grace_seconds: float = 300.0,
+        transport_factory: Optional[Callable[[], httpx.AsyncBaseTransport]] = None,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.retire_grace_seconds = retire_grace_seconds
+        self.transport_factory = transport_factory
+        self._clients: Dict[str, _PooledClient] = {}
+        self._retiring: Dict[asyncio.Task, _PooledClient] = {}
+        self.rebuilds = 0
+
+    @staticmethod
+    def _fingerprint(endpoint: str, timeout: httpx.Timeout, headers: Optional[dict]) -> str:
+        raw = json.dumps(
+            {"endpoint": endpoint, "timeout": timeout.as_dict(), "headers": sorted((headers or {}).items())},
+            sort_keys=True,
+        )
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _build(self, entry: _PooledClient, timeout: httpx.Timeout, headers: Optional[dict]) -> httpx.AsyncClient:
+        async def count_request(_request: httpx.Request) -> None:
+            entry.requests += 1
+
+        kwargs = {
+            "timeout": timeout,
+            "headers": headers or {},
+            "limits": self.limits,
+            "http2": self.http2,
+            "event_hooks": {"request": [count_request]},
+        }
+        if self.transport_factory is not None:
+            kwargs["transport"] = self.transport_factory()
+        return httpx.AsyncClient(**kwargs)
+
+    def client(
+        self,
+        key: str,
+        *,
+        endpoint: str = "",
+        timeout: httpx.Timeout,
+        headers: Optional[dict] = None,
+    ) -> httpx.AsyncClient:
+        """取 key 对应的共享客户端；地址、超时或默认请求头与现有客户端不同则换新"""
+        loop = asyncio.get_running_loop()
+        fingerprint = self._fingerprint(endpoint, timeout, headers)
+        entry = self._clients.get(key)
+        if entry is not None and entry.fingerprint == fingerprint and entry.loop is loop:
+            return entry.client
+        new_entry = _PooledClient(fingerprint, loop)
+        new_entry.client = self._build(new_entry, timeout, headers)
+        self._clients[key] = new_entry
+        if entry is not None:
+            self.rebuilds += 1
+            self._retire(entry)
+        return new_entry.client
+
+    def invalidate(self, key: str) -> None:
+        """模型配置被修改或删除时调用，下次请求按新配置建立客户端"""
+        entry = self._clients.pop(key, None)
+        if entry is not None:
+            self._retire(entry)
+
+    def _retire(self, entry: _PooledClient) -> None:
+        # 旧客户端上可能还有正在输出的流式回答，宽限期后再关闭
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if entry.loop is not loop or entry.loop.is_closed():
+            return
+
+        async def close_later():
+            await asyncio.sleep(self.retire_grace_seconds)
+            await entry.client.aclose()
+
+        task = loop.create_task(close_later())
+        self._retiring[task] = entry
+        task.add_done_callback(lambda t: self._retiring.pop(t, None))
+
+    async def aclose(self) -> None:
+        """应用停止时关闭全部客户端"""
+        entries = list(self._clients.values())
+        for task, entry in list(self._retiring.items()):
+            task.cancel()
+            entries.append(entry)
+        self._clients.clear()
+        loop = asyncio.get_running_loop()
+        for entry in entries:
+            if entry.loop is not loop:
+                continue
+            try:
+                await entry.client.aclose()
+            except Exception:
+                logger.warning("Failed to close upstream HTTP client", exc_info=True)
+
+    @staticmethod
+    def _pool_stats(client: httpx.AsyncClient) -> dict:
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        idle = 0
+        http2 = 0
+        for conn in connections:
+            try:
+                idle += 1 if conn.is_idle() else 0
+                info = conn.info()
+                http2 += 1 if "HTTP/2" in info else 0
+            except Exception:
+                continue
+        return {"connections": len(connections), "idle": idle, "active": len(connections) - idle, "http2_connections": http2}
+
+    def stats(self) -> dict:
+        clients = []
+        for key, entry in self._clients.items():
+            item = {
+                "key": key,
+                "requests": entry.requests,
+                "age_seconds": round(time.time() - entry.created_at, 1),
+            }
+            item.update(self._pool_stats(entry.client))
+            clients.append(item)
+        return {
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+            "rebuilds": self.rebuilds,
+            "retiring": len(self._retiring),
+            "clients": clients,
+        }
+
+
+def model_client_key(model_id: int) -> str:
+    return f"model:{int(model_id)}"
+
+
+provider_clients = ProviderClientRegistry(
+    max_connections=int(os.getenv("AI_HTTP_MAX_CONNECTIONS", 100)),
+    max_keepalive_connections=int(os.getenv("AI_HTTP_MAX_KEEPALIVE", 20)),
+    http2=os.getenv("AI_HTTP2", "1") != "0",
+)
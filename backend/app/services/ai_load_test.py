@@ -0,0 +1,296 @@
+"""
+流式问答压测
+在本进程内直接调用 /ai_qa/qa/stream 的处理函数（临时 SQLite 中登记一个指向模拟服务的模型），
+以 N 个并发流跑完指定数量的请求，报告服务端视角的首字时间（TTFT）、整段耗时、吞吐与事件循环延迟，
+以及调度器、多模型路由、上游连接池和模拟服务自身的统计。
+未指定 --provider-url 时自动在子进程中启动 mock_llm_provider（独立进程，不占用被测事件循环）。
+
+用法（在 backend/ 目录下）：
+    python -m app.services.ai_load_test --concurrency 50 --requests 500 --provider dashscope_openai \
+        --first-token-ms 300 --tokens-per-second 40 --error-rate 0.02 --output load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence
+
+import httpx
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from ..database import Base
+from ..models.ai_config import AiModelApi
+from ..routers import ai_qa
+from ..schemas.ai import QARequest
+from .ai_http_clients import provider_clients
+from .ai_model_router import model_router
+from .ai_model_scheduler import model_schedulers
+from .mock_llm_provider import MockConfig, add_config_arguments, config_from_args
+
+PROVIDERS = ("dashscope_openai", "ark_responses")
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class LoopLagMonitor:
+    """每 interval 秒睡一次，实际醒来时间超出的部分即事件循环被占用的时长"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def _distribution(values: Sequence[float], scale: float = 1000.0) -> Optional[Dict[str, float]]:
+    """秒 -> 毫秒的分位数摘要"""
+    if not values:
+        return None
+    data = np.asarray(values, dtype=float) * scale
+    return {
+        "p50": round(float(np.percentile(data, 50)), 3),
+        "p95": round(float(np.percentile(data, 95)), 3),
+        "p99": round(float(np.percentile(data, 99)), 3),
+        "max": round(float(data.max()), 3),
+        "mean": round(float(data.mean()), 3),
+    }
+
+
+class _StreamResult:
+    def __init__(self):
+        self.ttft: Optional[float] = None
+        self.duration = 0.0
+        self.chars = 0
+        self.events = 0
+        self.error: Optional[str] = None
+        self.rejected = False
+
+
+async def _one_stream(session_factory, model_id: int, user_id: str, question: str) -> _StreamResult:
+    result = _StreamResult()
+    loop = asyncio.get_running_loop()
+    async with session_factory() as db:
+        started = loop.time()
+        try:
+            response = await ai_qa.stream_qa(
+                QARequest(user_id=user_id, question=question, history_flag=False, model=f"db:{model_id}"), db
+            )
+        except HTTPException as exc:
+            result.rejected = exc.status_code == 429
+            result.error = str(exc.detail)
+            result.duration = loop.time() - started
+            return result
+        async for chunk in response.body_iterator:
+            data = ai_qa._parse_sse_payload(chunk if isinstance(chunk, str) else chunk.decode("utf-8"))
+            if data is None:
+                continue
+            result.events += 1
+            kind = data.get("type", "answer")
+            if kind == "answer" and data.get("content"):
+                if result.ttft is None:
+                    result.ttft = loop.time() - started
+                result.chars += len(data["content"])
+            elif kind == "error" and result.error is None:
+                result.error = str(data.get("content") or "error")
+        result.duration = loop.time() - started
+    return result
+
+
+async def run_load(
+    provider_url: str,
+    provider: str = "dashscope_openai",
+    concurrency: int = 10,
+    requests: int = 100,
+    question: str = "选课和补考的时间安排是怎样的？",
+    model_concurrency: int = 0,
+    users: int = 0,
+) -> Dict:
+    """对指向 provider_url 的模拟模型压测 stream_qa；每个请求的问题带序号，不命中答案缓存与请求合并"""
+    with tempfile.TemporaryDirectory(prefix="ai_load_") as root:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(root, 'load.db')}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        try:
+            async with SessionLocal() as db:
+                model = AiModelApi(
+                    name="mock",
+                    provider=provider,
+                    model_name="mock-model",
+                    endpoint=provider_url,
+                    api_key="mock",
+                    enabled=True,
+                    is_default=True,
+                    max_concurrency=model_concurrency,
+                )
+                db.add(model)
+                await db.commit()
+                model_id = model.id
+
+            results: List[_StreamResult] = []
+            next_index = 0
+            users = users or concurrency
+
+            async def worker() -> None:
+                nonlocal next_index
+                while next_index < requests:
+                    index = next_index
+                    next_index += 1
+                    results.append(
+                        await _one_stream(SessionLocal, model_id, f"load-{index % users}", f"{question} #{index}")
+                    )
+
+            monitor = LoopLagMonitor()
+            monitor.start()
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+            wall = time.perf_counter() - started
+            await monitor.stop()
+        finally:
+            await engine.dispose()
+
+    ok = [r for r in results if r.error is None and r.ttft is not None]
+    errors = [r.error for r in results if r.error is not None]
+    return {
+        "requests": len(results),
+        "completed": len(ok),
+        "errors": len(errors),
+        "rejected": sum(1 for r in results if r.rejected),
+        "error_samples": list(dict.fromkeys(errors))[:5],
+        "wall_time_s": round(wall, 3),
+        "ttft_ms": _distribution([r.ttft for r in ok]),
+        "duration_ms": _distribution([r.duration for r in ok]),
+        "throughput": {
+            "streams_per_s": round(len(ok) / wall, 3) if wall else 0.0,
+            "answer_chars_per_s": round(sum(r.chars for r in ok) / wall, 1) if wall else 0.0,
+            "events_per_s": round(sum(r.events for r in results) / wall, 1) if wall else 0.0,
+        },
+        "event_loop_lag_ms": _distribution(monitor.samples),
+        "scheduler": model_schedulers.stats(),
+        "router": model_router.stats(),
+        "provider_clients": provider_clients.stats(),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spawn_mock_provider(config: MockConfig, seed: Optional[int] = None, timeout: float = 20.0):
+    """在子进程中启动模拟服务，返回 (进程, 根地址)；调用方负责 terminate"""
+    port = _free_port()
+    argv = [sys.executable, "-m", "app.services.mock_llm_provider", "--port", str(port)]
+    for name, value in config.as_dict().items():
+        argv += ["--" + name.replace("_", "-"), str(value)]
+    if seed is not None:
+        argv += ["--seed", str(seed)]
+    process = subprocess.Popen(argv, cwd=_BACKEND_DIR)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"mock provider exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{url}/health", timeout=0.5).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("mock provider did not become ready")
+
+
+async def _provider_stats(url: str) -> Optional[dict]:
+    try:
+        async with httpx.AsyncClient(timeout=2.0) as client:
+            resp = await client.get(f"{url}/stats")
+            return resp.json() if resp.status_code == 200 else None
+    except (httpx.HTTPError, ValueError):
+        return None
+
+
+async def _main_async(args: argparse.Namespace, url: str) -> Dict:
+    report = await run_load(
+        url,
+        provider=args.provider,
+        concurrency=args.concurrency,
+        requests=args.requests,
+        question=args.question,
+        model_concurrency=args.model_concurrency,
+        users=args.users,
+    )
+    report["mock_provider"] = await _provider_stats(url)
+    await provider_clients.aclose()
+    return report
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test the streaming QA pipeline against a mock LLM provider")
+    parser.add_argument("--provider", choices=PROVIDERS, default="dashscope_openai")
+    parser.add_argument("--provider-url", help="use an already running provider instead of spawning the mock")
+    parser.add_argument("--concurrency", type=int, default=10, help="concurrent streams")
+    parser.add_argument("--requests", type=int, default=100, help="total streams")
+    parser.add_argument("--users", type=int, default=0, help="distinct user ids (default: one per stream)")
+    parser.add_argument("--model-concurrency", type=int, default=0, help="AiModelApi.max_concurrency (0 = default)")
+    parser.add_argument("--question", default="选课和补考的时间安排是怎样的？")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the mock provider's error injection")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    process = None
+    url = args.provider_url
+    if not url:
+        process, url = spawn_mock_provider(config_from_args(args), args.seed)
+    try:
+        report = asyncio.run(_main_async(args, url))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+    report = {
+        "benchmark": "ai_stream_load",
+        "provider": args.provider,
+        "provider_url": url,
+        "concurrency": args.concurrency,
+        **report,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
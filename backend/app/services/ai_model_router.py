@@ -0,0 +1,286 @@
+"""
+多模型路由：兜底与对冲
+按优先级串联多个已启用模型：当前模型在输出第一个字之前出现可重试错误（连接失败、超时、5xx、限流）时换下一个模型；
+开启对冲后，若首字超过该模型首字延迟的 p95 估计仍未到达，再并行启动下一个模型，先出字者胜出，另一个立即取消。
+每个模型维护 EWMA 首字延迟与错误率，持续出错的模型会被排到后面。
+首字计时与对冲截止时间都从调度器放行、真正调用上游时算起，排队等待不计入模型延迟。
+"""
+import asyncio
+import os
+import time
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Sequence, Tuple
+
+# classify(chunk) -> (kind, retryable)；kind 为 "answer" / "error" / "other"
+Classifier = Callable[[str], Tuple[str, bool]]
+# attempt(target, started) -> 上游输出流；在排队结束、真正调用上游时调用 started()
+Attempt = Callable[[Any, Callable[[], None]], AsyncGenerator[str, None]]
+
+
+class ModelHealth:
+    """首字延迟与错误率的指数滑动平均"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.deviation = 0.0
+        self.error_rate = 0.0
+        self.samples = 0
+        self.failures = 0
+
+    def record_success(self, ttft: float) -> None:
+        if self.latency is None:
+            self.latency = ttft
+            self.deviation = ttft / 2
+        else:
+            diff = ttft - self.latency
+            self.latency += self.alpha * diff
+            self.deviation += self.alpha * (abs(diff) - self.deviation)
+        self.error_rate *= 1 - self.alpha
+        self.samples += 1
+
+    def record_failure(self) -> None:
+        self.error_rate = self.error_rate * (1 - self.alpha) + self.alpha
+        self.samples += 1
+        self.failures += 1
+
+    @property
+    def healthy(self) -> bool:
+        return self.samples < 3 or self.error_rate < 0.5
+
+    def ttft_p95(self) -> Optional[float]:
+        # 近似正态：均值 + 2 倍平均偏差
+        if self.latency is None:
+            return None
+        return self.latency + 2 * self.deviation
+
+    def stats(self) -> dict:
+        return {
+            "ttft_ewma": round(self.latency, 3) if self.latency is not None else None,
+            "ttft_p95": round(self.ttft_p95(), 3) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "samples": self.samples,
+            "failures": self.failures,
+            "healthy": self.healthy,
+        }
+
+
+class _Attempt:
+    def __init__(self, key: str, target: Any, attempt: Attempt):
+        self.key = key
+        self.created = time.monotonic()
+        # 调度器放行的时刻；之前仍在排队，不计首字延迟也不触发对冲
+        self.started: Optional[float] = None
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._pump(attempt(target, self.mark_started)))
+        self.getter: Optional[asyncio.Task] = None
+
+    def mark_started(self) -> None:
+        if self.started is None:
+            self.started = time.monotonic()
+            # 唤醒路由循环，按新的起点计算对冲截止时间
+            self.queue.put_nowait(("started", None))
+
+    def ttft(self) -> float:
+        return time.monotonic() - (self.started if self.started is not None else self.created)
+
+    async def _pump(self, stream: AsyncGenerator[str, None]) -> None:
+        try:
+            async for chunk in stream:
+                await self.queue.put(("chunk", chunk))
+            await self.queue.put(("end", None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            await self.queue.put(("exc", exc))
+
+    def next_item(self) -> asyncio.Task:
+        if self.getter is None:
+            self.getter = asyncio.ensure_future(self.queue.get())
+        return self.getter
+
+    def cancel(self) -> None:
+        if self.getter is not None:
+            self.getter.cancel()
+        self.task.cancel()
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        hedge: bool = False,
+        hedge_after_seconds: Optional[float] = None,
+        hedge_min_seconds: float = 1.0,
+        hedge_max_seconds: float = 20.0,
+    ):
+        self.hedge = hedge
+        self.hedge_after_seconds = hedge_after_seconds
+        self.hedge_min_seconds = hedge_min_seconds
+        self.hedge_max_seconds = hedge_max_seconds
+        self._health: Dict[str, ModelHealth] = {}
+        self.fallbacks = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def health(self, key: str) -> ModelHealth:
+        if key not in self._health:
+            self._health[key] = ModelHealth()
+        return self._health[key]
+
+    def order(self, candidates: Sequence[Tuple[str, Any]]) -> List[Tuple[str, Any]]:
+        """保持配置顺序，但把不健康的模型（且后面还有健康模型时）移到末尾"""
+        healthy = [c for c in candidates if self.health(c[0]).healthy]
+        unhealthy = [c for c in candidates if not self.health(c[0]).healthy]
+        return healthy + unhealthy
+
+    def hedge_deadline(self, key: str) -> Optional[float]:
+        if not self.hedge:
+            return None
+        if self.hedge_after_seconds:
+            return self.hedge_after_seconds
+        p95 = self.health(key).ttft_p95()
+        if p95 is None:
+            return self.hedge_max_seconds
+        return min(self.hedge_max_seconds, max(self.hedge_min_seconds, p95))
+
+    async def stream(
+        self,
+        candidates: Sequence[Tuple[str, Any]],
+        attempt: Attempt,
+        classify: Classifier,
+        can_hedge: Callable[[Any], bool] = lambda _target: True,
+    ) -> AsyncGenerator[str, None]:
+        """依次（或对冲）调用候选模型，转发胜出者的完整输出
+
+        首字之前只转发主请求的过程事件（排队位置等），兜底请求的可重试错误被吞掉；
+        所有候选都失败时转发最后一个错误。
+        """
+        ordered = self.order(candidates)
+        next_index = 0
+        active: List[_Attempt] = []
+        last_error: Optional[str] = None
+
+        def start_next() -> Optional[_Attempt]:
+            nonlocal next_index
+            if next_index >= len(ordered):
+                return None
+            key, target = ordered[next_index]
+            next_index += 1
+            item = _Attempt(key, target, attempt)
+            active.append(item)
+            return item
+
+        def drop(item: _Attempt) -> None:
+            item.cancel()
+            if item in active:
+                active.remove(item)
+
+        winner: Optional[_Attempt] = None
+        finished = False
+        hedge_allowed = True
+        try:
+            start_next()
+            while winner is None and active:
+                primary = active[0]
+                timeout = None
+                if hedge_allowed and len(active) == 1 and next_index < len(ordered):
+                    deadline = self.hedge_deadline(primary.key)
+                    if deadline is not None and primary.started is not None:
+                        timeout = max(0.0, primary.started + deadline - time.monotonic())
+                done, _ = await asyncio.wait(
+                    {item.next_item() for item in active},
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    # 每个请求最多对冲一次；备用模型此刻没有空闲名额时不对冲，继续等主请求
+                    hedge_allowed = False
+                    if can_hedge(ordered[next_index][1]):
+                        self.hedges += 1
+                        start_next()
+                    continue
+                for item in list(active):
+                    if item.getter is None or item.getter not in done:
+                        continue
+                    kind, value = item.getter.result()
+                    item.getter = None
+                    if kind == "started":
+                        continue
+                    if kind == "chunk":
+                        chunk_kind, retryable = classify(value)
+                        if chunk_kind == "answer":
+                            winner = item
+                            self.health(item.key).record_success(item.ttft())
+                            if item is not active[0]:
+                                self.hedge_wins += 1
+                            yield value
+                            break
+                        if chunk_kind == "error":
+                            self.health(item.key).record_failure()
+                            last_error = value
+                            drop(item)
+                            if retryable and not active and next_index < len(ordered):
+                                self.fallbacks += 1
+                                start_next()
+                            elif not retryable and not active:
+                                next_index = len(ordered)
+                            continue
+                        if item is active[0]:
+                            yield value
+                        continue
+                    if kind == "exc":
+                        self.health(item.key).record_failure()
+                        drop(item)
+                        if not active:
+                            if next_index < len(ordered):
+                                self.fallbacks += 1
+                                start_next()
+                            elif last_error is None:
+                                raise value
+                        continue
+                    # 上游正常结束但没有输出任何答案（空回答）：直接结束
+                    winner = item
+                    finished = True
+                    break
+
+            if winner is None:
+                if last_error is not None:
+                    yield last_error
+                return
+            for item in list(active):
+                if item is not winner:
+                    drop(item)
+            if finished:
+                return
+            while True:
+                kind, value = await winner.next_item()
+                winner.getter = None
+                if kind == "started":
+                    continue
+                if kind == "chunk":
+                    if classify(value)[0] == "error":
+                        self.health(winner.key).record_failure()
+                    yield value
+                elif kind == "exc":
+                    self.health(winner.key).record_failure()
+                    raise value
+                else:
+                    return
+        finally:
+            for item in list(active):
+                item.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "hedge": self.hedge,
+            "fallbacks": self.fallbacks,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "models": {key: health.stats() for key, health in self._health.items()},
+        }
+
+
+model_router = ModelRouter(
+    hedge=os.getenv("AI_HEDGE_ENABLED", "0") == "1",
+    hedge_after_seconds=float(os.getenv("AI_HEDGE_AFTER_SECONDS", 0)) or None,
+    hedge_max_seconds=float(os.getenv("AI_HEDGE_MAX_SECONDS", 20)),
+)
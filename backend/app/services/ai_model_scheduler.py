@@ -0,0 +1,274 @@
+"""
+上游模型调用调度
+每个模型一个调度器：限制同时进行的上游流数量（max_concurrency），按令牌桶限制请求速率（rate_limit_per_minute），
+超出的请求排队，出队顺序在功能（customer_service / course_assistant / lesson_plan）之间轮转、
+同一功能内再在用户之间轮转，避免某个班级或某个功能的突发请求独占额度。
+队列已满时直接拒绝（429 + Retry-After），排队中的请求可以拿到当前位置推送给前端。
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import AsyncGenerator, Deque, Dict, List, Optional
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("AI_MODEL_MAX_CONCURRENCY", 8))
+DEFAULT_MAX_QUEUE = int(os.getenv("AI_MODEL_MAX_QUEUE", 64))
+# 未知耗时时估算 Retry-After 用的单次调用时长（秒）
+_DEFAULT_HOLD_SECONDS = 15.0
+
+
+class ModelOverloaded(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"model overloaded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """rate_per_minute 为 0 表示不限速；容量为 10 秒的配额（至少 1 个），允许小幅突发"""
+
+    def __init__(self, rate_per_minute: int = 0):
+        self.configure(rate_per_minute)
+
+    def configure(self, rate_per_minute: int) -> None:
+        rate_per_minute = max(0, int(rate_per_minute or 0))
+        if getattr(self, "rate_per_minute", None) == rate_per_minute:
+            return
+        self.rate_per_minute = rate_per_minute
+        self.capacity = max(1.0, rate_per_minute / 6.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_minute / 60.0)
+        self.updated = now
+
+    def try_take(self) -> bool:
+        if not self.rate_per_minute:
+            return True
+        self._refill()
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def seconds_until_token(self) -> float:
+        if not self.rate_per_minute:
+            return 0.0
+        self._refill()
+        return max(0.0, (1.0 - self.tokens) * 60.0 / self.rate_per_minute)
+
+
+class Ticket:
+    """一次上游调用的排队凭证；wait() 逐步产出排队位置，获得执行权后结束，用完调用 release()"""
+
+    def __init__(self, scheduler: "ModelScheduler", user: str, feature: str):
+        self.scheduler = scheduler
+        self.user = user
+        self.feature = feature
+        self.granted = False
+        self.released = False
+        self._changed = asyncio.Event()
+        self._granted_at = 0.0
+
+    def _notify(self) -> None:
+        self._changed.set()
+
+    async def wait(self) -> AsyncGenerator[int, None]:
+        last = None
+        try:
+            while not self.granted:
+                position = self.scheduler.position(self)
+                if position != last:
+                    last = position
+                    yield position
+                    # 产出期间状态可能已变化，重新检查后再等待
+                    continue
+                self._changed.clear()
+                timeout = self.scheduler.wake_delay()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self.scheduler.dispatch()
+        except BaseException:
+            if not self.granted:
+                self.scheduler.cancel(self)
+            raise
+
+    def release(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        if self.granted:
+            self.scheduler._finish(self)
+        else:
+            self.scheduler.cancel(self)
+
+
+class ModelScheduler:
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, rate_limit_per_minute: int = 0, max_queue: int = DEFAULT_MAX_QUEUE):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.bucket = TokenBucket(rate_limit_per_minute)
+        self.in_flight = 0
+        # feature -> user -> 等待中的凭证；两层 OrderedDict 的顺序即轮转顺序
+        self._queues: "OrderedDict[str, OrderedDict[str, Deque[Ticket]]]" = OrderedDict()
+        self.waiting = 0
+        self.avg_hold_seconds = _DEFAULT_HOLD_SECONDS
+        self.rejected = 0
+        self.completed = 0
+
+    def configure(self, max_concurrency: int, rate_limit_per_minute: int) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self.bucket.configure(rate_limit_per_minute)
+        self.dispatch()
+
+    def has_capacity(self) -> bool:
+        """此刻入队能否立即获得执行权（对冲请求只在有空闲名额时发起）"""
+        return not self.waiting and self.in_flight < self.max_concurrency
+
+    def retry_after(self) -> int:
+        by_slots = (self.waiting + 1) * self.avg_hold_seconds / self.max_concurrency
+        by_rate = (self.waiting + 1) * 60.0 / self.bucket.rate_per_minute if self.bucket.rate_per_minute else 0.0
+        return max(1, math.ceil(max(by_slots, by_rate)))
+
+    def admit(self) -> None:
+        """队列已满时抛出 ModelOverloaded（在返回流式响应之前调用，以便给出 429）"""
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise ModelOverloaded(self.retry_after())
+
+    def enqueue(self, user: str, feature: str) -> Ticket:
+        """登记一次调用；队列已满时抛出 ModelOverloaded"""
+        self.admit()
+        ticket = Ticket(self, user or "anonymous", feature or "default")
+        users = self._queues.setdefault(ticket.feature, OrderedDict())
+        users.setdefault(ticket.user, deque()).append(ticket)
+        self.waiting += 1
+        self.dispatch(queue_changed=True)
+        return ticket
+
+    def _order(self) -> List[Ticket]:
+        """按轮转规则模拟出队顺序（队列有上限，代价可忽略）"""
+        queues = OrderedDict(
+            (feature, OrderedDict((user, deque(tickets)) for user, tickets in users.items()))
+            for feature, users in self._queues.items()
+        )
+        order: List[Ticket] = []
+        while queues:
+            feature, users = next(iter(queues.items()))
+            user, tickets = next(iter(users.items()))
+            order.append(tickets.popleft())
+            if tickets:
+                users.move_to_end(user)
+            else:
+                del users[user]
+            if users:
+                queues.move_to_end(feature)
+            else:
+                del queues[feature]
+        return order
+
+    def position(self, ticket: Ticket) -> int:
+        """排在该请求之前的等待数（0 表示下一个）"""
+        try:
+            return self._order().index(ticket)
+        except ValueError:
+            return 0
+
+    def _pop_next(self) -> Optional[Ticket]:
+        while self._queues:
+            feature, users = next(iter(self._queues.items()))
+            user, tickets = next(iter(users.items()))
+            ticket = tickets.popleft()
+            if tickets:
+                users.move_to_end(user)
+            else:
+                del users[user]
+            if users:
+                self._queues.move_to_end(feature)
+            else:
+                del self._queues[feature]
+            self.waiting -= 1
+            return ticket
+        return None
+
+    def dispatch(self, queue_changed: bool = False) -> None:
+        while self.waiting and self.in_flight < self.max_concurrency and self.bucket.try_take():
+            ticket = self._pop_next()
+            if ticket is None:
+                break
+            ticket.granted = True
+            ticket._granted_at = time.monotonic()
+            self.in_flight += 1
+            ticket._notify()
+            queue_changed = True
+        if queue_changed:
+            # 队列位置变化，通知其余等待者刷新
+            for users in self._queues.values():
+                for tickets in users.values():
+                    for waiter in tickets:
+                        waiter._notify()
+
+    def wake_delay(self) -> Optional[float]:
+        """令牌桶是瓶颈时到下一个令牌的时间；否则等待释放事件即可"""
+        if self.in_flight < self.max_concurrency and self.waiting:
+            return max(0.05, self.bucket.seconds_until_token())
+        return None
+
+    def cancel(self, ticket: Ticket) -> None:
+        users = self._queues.get(ticket.feature)
+        tickets = users.get(ticket.user) if users else None
+        if tickets and ticket in tickets:
+            tickets.remove(ticket)
+            self.waiting -= 1
+            if not tickets:
+                del users[ticket.user]
+            if not users:
+                del self._queues[ticket.feature]
+        self.dispatch(queue_changed=True)
+
+    def _finish(self, ticket: Ticket) -> None:
+        self.in_flight -= 1
+        self.completed += 1
+        held = time.monotonic() - ticket._granted_at
+        self.avg_hold_seconds = 0.8 * self.avg_hold_seconds + 0.2 * held
+        self.dispatch()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "rate_limit_per_minute": self.bucket.rate_per_minute,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "waiting_by_feature": {f: sum(len(t) for t in users.values()) for f, users in self._queues.items()},
+            "avg_hold_seconds": round(self.avg_hold_seconds, 2),
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+class ModelSchedulerRegistry:
+    def __init__(self, max_queue: int = DEFAULT_MAX_QUEUE):
+        self.max_queue = max_queue
+        self._schedulers: Dict[str, ModelScheduler] = {}
+
+    def get(self, key: str, max_concurrency: Optional[int] = None, rate_limit_per_minute: Optional[int] = None) -> ModelScheduler:
+        """取调度器，并按模型当前配置更新并发与速率（0/None 使用默认并发、不限速）"""
+        concurrency = int(max_concurrency or 0) or DEFAULT_MAX_CONCURRENCY
+        rate = int(rate_limit_per_minute or 0)
+        scheduler = self._schedulers.get(key)
+        if scheduler is None:
+            scheduler = ModelScheduler(concurrency, rate, self.max_queue)
+            self._schedulers[key] = scheduler
+        elif scheduler.max_concurrency != concurrency or scheduler.bucket.rate_per_minute != rate:
+            scheduler.configure(concurrency, rate)
+        return scheduler
+
+    def stats(self) -> dict:
+        return {key: scheduler.stats() for key, scheduler in self._schedulers.items()}
+
+
+model_schedulers = ModelSchedulerRegistry()
@@ -1,77 +1,118 @@
+import asyncio
+import concurrent.futures
 import json
-import hashlib
-import redis
-import jieba
+import logging
+import os
+import threading
 import dashscope
-from tenacity import retry, stop_after_attempt, wait_fixed
-from typing import Generator, List, Tuple, Dict
+import redis.asyncio as aioredis
+from typing import AsyncGenerator, Callable, Dict, Iterator, List
 from http import HTTPStatus
 from ..config import settings
+from .sensitive_filter import sensitive_filter
 
-# Initialize Redis
+logger = logging.getLogger(__name__)
+
+# Initialize Redis (connections are opened lazily on first command)
 try:
-    redis_client = redis.Redis(
+    redis_client = aioredis.Redis(
         host=settings.REDIS_HOST,
         port=settings.REDIS_PORT,
         db=settings.REDIS_DB,
         password=settings.REDIS_PASSWORD,
-        decode_responses=True
+        decode_responses=True,
+        socket_connect_timeout=0.5,
+        socket_timeout=1.0,
     )
 except Exception as e:
     print(f"Redis connection failed: {e}")
     redis_client = None
 
+# DashScope's SDK only streams through a blocking iterator. Each answer is iterated on a
+# dedicated, bounded pool so slow answers never run on (or exhaust) the event loop.
+_stream_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.getenv("AI_QWEN_STREAM_WORKERS", 8)),
+    thread_name_prefix="qwen-stream",
+)
+# Chunks buffered between the worker thread and the consumer before the worker waits
+_STREAM_QUEUE_SIZE = 32
+
+
+async def iterate_in_thread(
+    make_iter: Callable[[], Iterator],
+    executor: concurrent.futures.Executor = _stream_executor,
+    queue_size: int = _STREAM_QUEUE_SIZE,
+) -> AsyncGenerator:
+    """Drive a blocking iterator in `executor` and yield its items on the event loop.
+
+    The queue is bounded so a slow client applies backpressure to the worker; when the
+    consumer stops early (client disconnected) the worker stops at the next item.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        try:
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        except RuntimeError:
+            return False
+        while True:
+            try:
+                future.result(timeout=0.5)
+                return True
+            except concurrent.futures.TimeoutError:
+                if stop.is_set():
+                    future.cancel()
+                    return False
+            except concurrent.futures.CancelledError:
+                return False
+
+    def produce() -> None:
+        try:
+            for item in make_iter():
+                if stop.is_set() or not put(("item", item)):
+                    return
+            put(("end", None))
+        except BaseException as exc:
+            put(("error", exc))
+
+    loop.run_in_executor(executor, produce)
+    try:
+        while True:
+            kind, value = await queue.get()
+            if kind == "item":
+                yield value
+            elif kind == "error":
+                raise value
+            else:
+                return
+    finally:
+        stop.set()
+
+
 class QwenClient:
     def __init__(self):
         self.api_key = settings.DASHSCOPE_API_KEY
         dashscope.api_key = self.api_key
-        # Sensitive words list (Mock)
-        self.sensitive_words = ["暴力", "色情", "赌博"] 
-    
+        self.redis = redis_client
+
     def _disable_redis(self):
-        global redis_client
-        redis_client = None
+        self.redis = None
 
     def _check_sensitive(self, text: str) -> bool:
-        words = jieba.lcut(text)
-        for word in words:
-            if word in self.sensitive_words:
-                return True
-        return False
-
-    def _get_cache_key(self, question: str) -> str:
-        hash_obj = hashlib.md5(question.encode('utf-8'))
-        return f"ai:qa:{hash_obj.hexdigest()}"
+        # Single pass over the admin-managed word list (Aho-Corasick), no segmentation needed
+        return sensitive_filter.contains(text)
 
     def _get_history_key(self, user_id: str) -> str:
         return f"ai:chat:{user_id}"
 
-    def get_cached_answer(self, question: str) -> str:
-        if not redis_client:
-            return None
-        key = self._get_cache_key(question)
-        try:
-            return redis_client.get(key)
-        except Exception:
-            # Redis unavailable; disable cache to avoid crashing stream
-            self._disable_redis()
-            return None
-
-    def cache_answer(self, question: str, answer: str):
-        if not redis_client:
-            return
-        key = self._get_cache_key(question)
-        try:
-            redis_client.setex(key, 3600, answer) # 1 hour
-        except Exception:
-            self._disable_redis()
-
-    def get_history(self, user_id: str) -> List[Dict]:
-        if not redis_client:
+    async def get_history(self, user_id: str) -> List[Dict]:
+        if not self.redis:
             return []
         key = self._get_history_key(user_id)
         try:
-            history_json = redis_client.get(key)
+            history_json = await self.redis.get(key)
             if history_json:
                 return json.loads(history_json)
             return []
@@ -79,70 +120,72 @@ class QwenClient:
             self._disable_redis()
             return []
 
-    def update_history(self, user_id: str, question: str, answer: str):
-        if not redis_client:
+    async def update_history(self, user_id: str, question: str, answer: str):
+        if not self.redis:
             return
         key = self._get_history_key(user_id)
-        history = self.get_history(user_id)
+        history = await self.get_history(user_id)
         history.append({"role": "user", "content": question})
         history.append({"role": "assistant", "content": answer})
         # Keep last 10 rounds to avoid token limit
         if len(history) > 20:
             history = history[-20:]
         try:
-            redis_client.setex(key, 86400, json.dumps(history)) # 24 hours
+            await self.redis.setex(key, 86400, json.dumps(history))  # 24 hours
         except Exception:
             self._disable_redis()
 
-    @retry(stop=stop_after_attempt(2), wait=wait_fixed(1))
-    def call_stream_api(self, user_id: str, question: str, history_flag: bool) -> Generator[str, None, None]:
+    def _generation_stream(self, messages: List[Dict]) -> Iterator:
+        # Runs in a worker thread. Generation.call(stream=True) is lazy: the request is only
+        # sent, and network/API errors only raised, once the first response is pulled. Pull it
+        # here so a failure before anything was streamed can be retried once.
+        kwargs = dict(
+            model=dashscope.Generation.Models.qwen_turbo,
+            messages=messages,
+            result_format='message',
+            stream=True,
+            incremental_output=True  # Important for real streaming
+        )
+        for attempt in range(2):
+            try:
+                responses = iter(dashscope.Generation.call(**kwargs))
+                first = next(responses, None)
+                break
+            except Exception as e:
+                if attempt:
+                    raise
+                logger.warning("DashScope request failed, retrying once: %r", e)
+        if first is None:
+            return
+        yield first
+        yield from responses
+
+    async def call_stream_api(self, user_id: str, question: str, history_flag: bool) -> AsyncGenerator[str, None]:
         if self._check_sensitive(question):
             yield "data: {\"content\": \"抱歉，您的问题包含敏感词，暂无法回答。\"}\n\n"
             return
 
-        # Check cache first (if not needing history context strictly, or if exact match)
-        # For multi-turn, cache might be tricky. 
-        # Requirement says: "Cache answer (key: ai:qa:{question_hash})". 
-        # This implies simple QA cache. If history is important, this cache might be invalid.
-        # We will check cache only if history_flag is False or history is empty, 
-        # OR we assume the cache is for the exact question regardless of context (which is a simplification).
-        # Let's follow the prompt: "Cache query... if hit return".
-        
-        cached = self.get_cached_answer(question)
-        if cached:
-            # Simulate stream for cached response
-            yield f"data: {json.dumps({'content': cached}, ensure_ascii=False)}\n\n"
-            return
+        # 答案缓存由 ai_qa 路由统一处理（键包含模型与知识库版本）
 
         messages = []
         if history_flag:
-            messages = self.get_history(user_id)
-        
+            messages = await self.get_history(user_id)
+
         messages.append({"role": "user", "content": question})
 
         try:
-            responses = dashscope.Generation.call(
-                model=dashscope.Generation.Models.qwen_turbo,
-                messages=messages,
-                result_format='message',
-                stream=True,
-                incremental_output=True  # Important for real streaming
-            )
-
             full_answer = ""
-            for response in responses:
+            async for response in iterate_in_thread(lambda: self._generation_stream(messages)):
                 if response.status_code == HTTPStatus.OK:
                     content = response.output.choices[0]['message']['content']
                     full_answer += content
                     yield f"data: {json.dumps({'content': content}, ensure_ascii=False)}\n\n"
                 else:
-                    yield f"data: {json.dumps({'content': f'Error: {response.message}'}, ensure_ascii=False)}\n\n"
-            
-            # Cache the full answer
-            self.cache_answer(question, full_answer)
+                    yield f"data: {json.dumps({'type': 'error', 'content': f'Error: {response.message}'}, ensure_ascii=False)}\n\n"
+
             # Update history
-            self.update_history(user_id, question, full_answer)
+            await self.update_history(user_id, question, full_answer)
 
         except Exception as e:
-            print(f"API Error: {e}")
-            yield f"data: {json.dumps({'content': '服务暂时不可用，请稍后再试。'}, ensure_ascii=False)}\n\n"
+            logger.warning("DashScope API error: %r", e)
+            yield f"data: {json.dumps({'type': 'error', 'content': '服务暂时不可用，请稍后再试。'}, ensure_ascii=False)}\n\n"
@@ -0,0 +1,107 @@
+"""
+AI 问答请求合并（single-flight）
+同一签名（问题 + 模型 + 知识库版本）的并发请求只向上游发起一次：
+首个请求启动后台任务驱动上游流，输出写入内存缓冲区；之后到达的相同请求订阅同一缓冲区，
+都从头收到完整的 SSE 序列。上游流结束即从登记表移除（答案此时已进入答案缓存）。
+"""
+import asyncio
+import logging
+from typing import AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk: str) -> None:
+        self.chunks.append(chunk)
+        self._wake()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.done = True
+        self.error = error
+        self._wake()
+
+    def _wake(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self) -> None:
+        await self._changed.wait()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._flights
+
+    def stream(self, key: str, source: Callable[[], AsyncIterator[str]]) -> AsyncGenerator[str, None]:
+        """订阅 key 对应的输出；没有进行中的相同请求时用 source() 启动一个"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._drive(key, flight, source))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        # 立即计入订阅者：在第一次迭代之前，驱动任务也不会因“无人订阅”而被取消
+        flight.subscribers += 1
+        return self._subscribe(key, flight)
+
+    async def _drive(self, key: str, flight: _Flight, source: Callable[[], AsyncIterator[str]]) -> None:
+        error: Optional[BaseException] = None
+        try:
+            async for chunk in source():
+                flight.publish(chunk)
+        except asyncio.CancelledError:
+            error = ConnectionAbortedError("all subscribers disconnected")
+        except Exception as exc:
+            logger.exception("Coalesced AI stream failed")
+            error = exc
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.finish(error)
+
+    async def _subscribe(self, key: str, flight: _Flight) -> AsyncGenerator[str, None]:
+        index = 0
+        try:
+            while True:
+                while index < len(flight.chunks):
+                    yield flight.chunks[index]
+                    index += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers <= 0 and not flight.done and flight.task is not None:
+                # 所有客户端都已断开，没有必要继续消耗上游额度
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._flights),
+            "subscribers": sum(f.subscribers for f in self._flights.values()),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
+
+
+answer_flights = SingleFlight()
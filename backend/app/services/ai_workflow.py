@@ -1,22 +1,35 @@
 from __future__ import annotations
 
+import asyncio
+import heapq
 import math
 import os
 import re
-from typing import Iterable, List, Sequence, Tuple
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Sequence, Tuple
 
-import numpy as np
-from sqlalchemy import delete, select
+from sqlalchemy import delete, func, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 
-from ..models.ai_config import AiKnowledgeBaseChunk, AiKnowledgeBaseDocument
+from ..models.ai_config import (
+    AiKnowledgeBase,
+    AiKnowledgeBaseChunk,
+    AiKnowledgeBaseDocument,
+    AiKnowledgeBaseIndexStat,
+    AiKnowledgeBasePosting,
+)
+from .kb_vector_index import kb_vector_index
+from .sensitive_filter import compile_words, sensitive_filter
+from .text_tokenizer import TOKENIZER_VERSION, join_tokens, split_tokens, text_tokenizer
 
-_TOKEN_RE = re.compile(r"[A-Za-z0-9\u4e00-\u9fff]+")
 _DEFAULT_CHUNK_SIZE = 450
 _DEFAULT_CHUNK_OVERLAP = 80
 _MAX_CHUNK_FETCH = 420
+_BM25_K1 = 1.5
+_BM25_B = 0.75
+# 混合检索：语义相似度的权重（其余为归一化后的 BM25 分数），以及每一路召回的候选数
+_HYBRID_DENSE_WEIGHT = 0.4
+_HYBRID_CANDIDATES = 50
 
 
 def _normalize_text(text: str) -> str:
@@ -132,42 +145,244 @@ def extract_text_from_file(path: str, file_ext: str) -> str:
 
 
 async def delete_document_chunks(db: AsyncSession, document_id: int) -> None:
+    await _unindex_document(db, document_id)
     await db.execute(delete(AiKnowledgeBaseChunk).where(AiKnowledgeBaseChunk.document_id == document_id))
 
 
-def _extract_tokens(text: str, limit: int = 40) -> str:
-    tokens = _TOKEN_RE.findall(text)
-    return " ".join(tokens[:limit])
+async def _bump_index_stats(db: AsyncSession, kb_id: int, chunk_delta: int, token_delta: int) -> None:
+    if not chunk_delta and not token_delta:
+        return
+    await db.execute(
+        update(AiKnowledgeBaseIndexStat)
+        .where(AiKnowledgeBaseIndexStat.knowledge_base_id == kb_id)
+        .values(
+            chunk_count=AiKnowledgeBaseIndexStat.chunk_count + chunk_delta,
+            token_total=AiKnowledgeBaseIndexStat.token_total + token_delta,
+        )
+    )
+    # 片段有增删即视为内容变化，使依赖该知识库的缓存答案失效
+    await db.execute(
+        update(AiKnowledgeBase)
+        .where(AiKnowledgeBase.id == kb_id)
+        .values(content_version=AiKnowledgeBase.content_version + 1)
+    )
 
 
-async def rebuild_document_chunks(
-    db: AsyncSession,
-    document: AiKnowledgeBaseDocument,
+async def _index_chunks(db: AsyncSession, kb_id: int, chunks: Sequence[AiKnowledgeBaseChunk]) -> None:
+    rows: List[dict] = []
+    chunk_count = 0
+    token_total = 0
+    for chunk in chunks:
+        # 入库时已分词，这里只读缓存的词项
+        terms = split_tokens(chunk.tokens)
+        if not terms:
+            continue
+        chunk_count += 1
+        token_total += len(terms)
+        rows.extend(
+            {"knowledge_base_id": kb_id, "term": term, "chunk_id": chunk.id, "tf": tf, "doc_len": len(terms)}
+            for term, tf in Counter(terms).items()
+        )
+    if rows:
+        await db.execute(insert(AiKnowledgeBasePosting), rows)
+    await _bump_index_stats(db, kb_id, chunk_count, token_total)
+
+
+async def _index_chunk_vectors(db: AsyncSession, kb_id: int, chunks: Sequence[AiKnowledgeBaseChunk]) -> None:
+    # 新增片段较少时用已拟合的模型投影追加；增长过多（或尚无向量索引）时整库重新拟合
+    if kb_vector_index.needs_refit(kb_id, len(chunks)):
+        await _rebuild_chunk_vectors(db, kb_id)
+    else:
+        await asyncio.to_thread(kb_vector_index.add, kb_id, [(chunk.id, split_tokens(chunk.tokens)) for chunk in chunks])
+
+
+async def _rebuild_chunk_vectors(db: AsyncSession, kb_id: int) -> None:
+    res = await db.execute(
+        select(AiKnowledgeBaseChunk.id, AiKnowledgeBaseChunk.tokens).where(
+            AiKnowledgeBaseChunk.knowledge_base_id == kb_id
+        )
+    )
+    chunks = [(chunk_id, split_tokens(tokens)) for chunk_id, tokens in res.all()]
+    # 拟合 LSA 是 CPU 密集操作，放到线程里避免阻塞事件循环
+    await asyncio.to_thread(kb_vector_index.rebuild, kb_id, chunks)
+
+
+async def _unindex_document(db: AsyncSession, document_id: int) -> None:
+    chunk_ids = select(AiKnowledgeBaseChunk.id).where(AiKnowledgeBaseChunk.document_id == document_id)
+    res = await db.execute(
+        select(AiKnowledgeBaseChunk.knowledge_base_id, AiKnowledgeBaseChunk.id).where(
+            AiKnowledgeBaseChunk.document_id == document_id
+        )
+    )
+    vector_ids: Dict[int, List[int]] = defaultdict(list)
+    for kb_id, chunk_id in res.all():
+        vector_ids[kb_id].append(chunk_id)
+    for kb_id, ids in vector_ids.items():
+        await asyncio.to_thread(kb_vector_index.remove, kb_id, ids)
+
+    res = await db.execute(
+        select(
+            AiKnowledgeBasePosting.knowledge_base_id,
+            AiKnowledgeBasePosting.chunk_id,
+            func.max(AiKnowledgeBasePosting.doc_len),
+        )
+        .where(AiKnowledgeBasePosting.chunk_id.in_(chunk_ids))
+        .group_by(AiKnowledgeBasePosting.knowledge_base_id, AiKnowledgeBasePosting.chunk_id)
+    )
+    removed: Dict[int, List[int]] = defaultdict(lambda: [0, 0])
+    for kb_id, _chunk_id, doc_len in res.all():
+        removed[kb_id][0] += 1
+        removed[kb_id][1] += int(doc_len or 0)
+    if not removed:
+        return
+    await db.execute(delete(AiKnowledgeBasePosting).where(AiKnowledgeBasePosting.chunk_id.in_(chunk_ids)))
+    for kb_id, (chunk_count, token_total) in removed.items():
+        await _bump_index_stats(db, kb_id, -chunk_count, -token_total)
+
+
+def _segment_all(contents: Sequence[str]) -> List[str]:
+    return [join_tokens(text_tokenizer.segment(content)) for content in contents]
+
+
+async def rebuild_knowledge_base_index(db: AsyncSession, kb_id: int) -> int:
+    """按当前分词规则重新切分全部片段并重建倒排索引，返回入索引的片段数"""
+    await drop_knowledge_base_index(db, kb_id)
+    db.add(
+        AiKnowledgeBaseIndexStat(knowledge_base_id=kb_id, chunk_count=0, token_total=0, tokenizer=TOKENIZER_VERSION)
+    )
+    await db.flush()
+    res = await db.execute(
+        select(AiKnowledgeBaseChunk).where(AiKnowledgeBaseChunk.knowledge_base_id == kb_id)
+    )
+    chunks = list(res.scalars().all())
+    # 整库重新分词是 CPU 密集操作，放到线程里避免阻塞事件循环
+    tokens = await asyncio.to_thread(_segment_all, [chunk.content for chunk in chunks])
+    for chunk, chunk_tokens in zip(chunks, tokens):
+        chunk.tokens = chunk_tokens
+    await db.flush()
+    await _index_chunks(db, kb_id, chunks)
+    await asyncio.to_thread(kb_vector_index.rebuild, kb_id, [(chunk.id, split_tokens(chunk.tokens)) for chunk in chunks])
+    return len(chunks)
+
+
+async def ensure_knowledge_base_index(db: AsyncSession, kb_id: int) -> None:
+    """旧数据没有倒排索引（或分词规则已变化）时重建一次；之后由文档增删增量维护。
+    只在入库与启动修复时调用（调用方负责提交），检索路径不建索引"""
+    stat = await db.get(AiKnowledgeBaseIndexStat, kb_id)
+    if stat is None or stat.tokenizer != TOKENIZER_VERSION:
+        await rebuild_knowledge_base_index(db, kb_id)
+    elif stat.chunk_count >= 3 and not kb_vector_index.exists(kb_id):
+        # 倒排索引已在，但语义向量文件缺失（新部署或目录被清理）
+        await _rebuild_chunk_vectors(db, kb_id)
+
+
+async def repair_knowledge_base_indexes(db: AsyncSession) -> List[int]:
+    """为尚未建立倒排索引（或分词规则已变化）的知识库重建索引，并补齐缺失的语义向量文件（新部署或目录被清理），
+    返回处理过的知识库；启动时调用，由调用方提交"""
+    res = await db.execute(
+        select(AiKnowledgeBase.id).where(
+            AiKnowledgeBase.id.not_in(
+                select(AiKnowledgeBaseIndexStat.knowledge_base_id).where(
+                    AiKnowledgeBaseIndexStat.tokenizer == TOKENIZER_VERSION
+                )
+            )
+        )
+    )
+    repaired = list(res.scalars().all())
+    for kb_id in repaired:
+        await rebuild_knowledge_base_index(db, kb_id)
+    res = await db.execute(
+        select(AiKnowledgeBaseIndexStat.knowledge_base_id).where(AiKnowledgeBaseIndexStat.chunk_count >= 3)
+    )
+    for kb_id in res.scalars().all():
+        if kb_id not in repaired and not kb_vector_index.exists(kb_id):
+            await _rebuild_chunk_vectors(db, kb_id)
+            repaired.append(kb_id)
+    return repaired
+
+
+async def knowledge_base_versions(db: AsyncSession, kb_ids: Sequence[int]) -> List[Tuple[int, int]]:
+    """[(知识库 ID, 内容版本)]，供答案缓存组成缓存键"""
+    if not kb_ids:
+        return []
+    res = await db.execute(
+        select(AiKnowledgeBase.id, AiKnowledgeBase.content_version).where(AiKnowledgeBase.id.in_(list(kb_ids)))
+    )
+    return [(int(kb_id), int(version or 0)) for kb_id, version in res.all()]
+
+
+async def drop_knowledge_base_index(db: AsyncSession, kb_id: int) -> None:
+    await db.execute(delete(AiKnowledgeBasePosting).where(AiKnowledgeBasePosting.knowledge_base_id == kb_id))
+    await db.execute(delete(AiKnowledgeBaseIndexStat).where(AiKnowledgeBaseIndexStat.knowledge_base_id == kb_id))
+    kb_vector_index.drop(kb_id)
+
+
+def prepare_chunks(
     text: str,
     *,
     chunk_size: int = _DEFAULT_CHUNK_SIZE,
     overlap: int = _DEFAULT_CHUNK_OVERLAP,
+) -> List[Tuple[str, str]]:
+    """切分并分词，返回 [(片段内容, 空格分隔的词项)]；纯 CPU 计算，可在工作进程中执行"""
+    content = _normalize_text(text)
+    if not content:
+        return []
+    chunks = split_text_into_chunks(content, chunk_size=chunk_size, overlap=overlap)
+    return [(chunk_text, join_tokens(text_tokenizer.segment(chunk_text))) for chunk_text in chunks]
+
+
+def prepare_document_file(path: str, file_ext: str, sensitive_words: Sequence[str] = ()) -> List[Tuple[str, str]]:
+    """抽取文件文本、替换敏感词并切分分词（PDF/DOCX/XLSX 解析都在这里），供入库流水线的进程池调用"""
+    text = extract_text_from_file(path, file_ext)
+    if sensitive_words:
+        text = compile_words(tuple(sensitive_words)).mask(text)
+    return prepare_chunks(text)
+
+
+async def store_document_chunks(
+    db: AsyncSession,
+    document: AiKnowledgeBaseDocument,
+    prepared: Sequence[Tuple[str, str]],
 ) -> int:
+    """用 prepare_chunks 的结果替换文档的全部片段，并增量更新倒排索引与向量索引"""
     if not document.knowledge_base_id:
         return 0
+    await ensure_knowledge_base_index(db, document.knowledge_base_id)
     await delete_document_chunks(db, document.id)
-    content = _normalize_text(text)
-    if not content:
+    if not prepared:
         return 0
-    chunks = split_text_into_chunks(content, chunk_size=chunk_size, overlap=overlap)
-    for idx, chunk_text in enumerate(chunks):
-        db.add(
-            AiKnowledgeBaseChunk(
-                knowledge_base_id=document.knowledge_base_id,
-                document_id=document.id,
-                seq=idx,
-                content=chunk_text,
-                tokens=_extract_tokens(chunk_text),
-                document_title=document.title,
-                document_url=document.url,
-            )
+    rows = [
+        AiKnowledgeBaseChunk(
+            knowledge_base_id=document.knowledge_base_id,
+            document_id=document.id,
+            seq=idx,
+            content=chunk_text,
+            tokens=tokens,
+            document_title=document.title,
+            document_url=document.url,
         )
-    return len(chunks)
+        for idx, (chunk_text, tokens) in enumerate(prepared)
+    ]
+    db.add_all(rows)
+    await db.flush()
+    await _index_chunks(db, document.knowledge_base_id, rows)
+    await _index_chunk_vectors(db, document.knowledge_base_id, rows)
+    return len(rows)
+
+
+async def rebuild_document_chunks(
+    db: AsyncSession,
+    document: AiKnowledgeBaseDocument,
+    text: str,
+    *,
+    chunk_size: int = _DEFAULT_CHUNK_SIZE,
+    overlap: int = _DEFAULT_CHUNK_OVERLAP,
+) -> int:
+    if not document.knowledge_base_id:
+        return 0
+    await sensitive_filter.refresh(db)
+    prepared = prepare_chunks(sensitive_filter.mask(text), chunk_size=chunk_size, overlap=overlap)
+    return await store_document_chunks(db, document, prepared)
 
 
 async def fetch_recent_chunks(
@@ -188,36 +403,92 @@ async def fetch_recent_chunks(
     return list(res.scalars().all())
 
 
+async def _indexed_stats(db: AsyncSession, kb_ids: Sequence[int]) -> Dict[int, AiKnowledgeBaseIndexStat]:
+    """按当前分词规则建好索引的知识库；缺失或过期的索引由入库与启动修复重建，检索时跳过"""
+    res = await db.execute(
+        select(AiKnowledgeBaseIndexStat).where(
+            AiKnowledgeBaseIndexStat.knowledge_base_id.in_(kb_ids),
+            AiKnowledgeBaseIndexStat.tokenizer == TOKENIZER_VERSION,
+        )
+    )
+    return {row.knowledge_base_id: row for row in res.scalars()}
+
+
+async def _bm25_scores(
+    db: AsyncSession,
+    stats: Dict[int, AiKnowledgeBaseIndexStat],
+    terms: Sequence[str],
+) -> Dict[int, float]:
+    kb_ids = list(stats)
+    res = await db.execute(
+        select(
+            AiKnowledgeBasePosting.knowledge_base_id,
+            AiKnowledgeBasePosting.term,
+            AiKnowledgeBasePosting.chunk_id,
+            AiKnowledgeBasePosting.tf,
+            AiKnowledgeBasePosting.doc_len,
+        ).where(
+            AiKnowledgeBasePosting.knowledge_base_id.in_(kb_ids),
+            AiKnowledgeBasePosting.term.in_(terms),
+        )
+    )
+    postings = res.all()
+    # 文档频率按知识库分别统计：每个知识库是独立的语料
+    doc_freq = Counter((kb_id, term) for kb_id, term, _, _, _ in postings)
+    scores: Dict[int, float] = defaultdict(float)
+    for kb_id, term, chunk_id, tf, doc_len in postings:
+        stat = stats.get(kb_id)
+        if stat is None or stat.chunk_count <= 0:
+            continue
+        avg_len = stat.token_total / stat.chunk_count or 1.0
+        df = doc_freq[(kb_id, term)]
+        idf = math.log(1.0 + (stat.chunk_count - df + 0.5) / (df + 0.5))
+        norm = _BM25_K1 * (1.0 - _BM25_B + _BM25_B * doc_len / avg_len)
+        scores[chunk_id] += idf * tf * (_BM25_K1 + 1.0) / (tf + norm)
+    return scores
+
+
+def _fuse_scores(lexical: Dict[int, float], dense: Sequence[Tuple[int, float]]) -> Dict[int, float]:
+    """BM25 按最高分归一化到 [0, 1] 后与余弦相似度加权求和"""
+    fused: Dict[int, float] = defaultdict(float)
+    top_lexical = heapq.nlargest(_HYBRID_CANDIDATES, lexical.items(), key=lambda item: item[1])
+    max_lexical = top_lexical[0][1] if top_lexical else 0.0
+    if max_lexical > 0:
+        for chunk_id, score in top_lexical:
+            fused[chunk_id] += (1.0 - _HYBRID_DENSE_WEIGHT) * score / max_lexical
+    for chunk_id, similarity in dense:
+        if similarity > 0:
+            fused[chunk_id] += _HYBRID_DENSE_WEIGHT * similarity
+    return fused
+
+
 async def retrieve_top_chunks(
     db: AsyncSession,
     kb_ids: Sequence[int],
     question: str,
     *,
     limit: int = 6,
-    fetch_limit: int = _MAX_CHUNK_FETCH,
 ) -> List[Tuple[AiKnowledgeBaseChunk, float]]:
-    chunks = await fetch_recent_chunks(db, kb_ids, fetch_limit=fetch_limit)
-    if not chunks:
+    """混合检索：BM25 只读取问题词项的倒排记录，语义向量召回换一种说法的问题，两路分数加权融合。
+    只读索引：没有可用索引的知识库不参与打分，全部不可用时退回最近的片段"""
+    if not kb_ids:
         return []
-    cleaned_question = (question or "").strip()
-    if not cleaned_question:
-        return [(chunk, 0.0) for chunk in chunks[:limit]]
-    texts = [chunk.content for chunk in chunks]
-    try:
-        vectorizer = TfidfVectorizer(max_df=0.95, min_df=1, ngram_range=(1, 2))
-        matrix = vectorizer.fit_transform(texts + [cleaned_question])
-        query_vec = matrix[-1]
-        doc_mat = matrix[:-1]
-    except ValueError:
-        return [(chunk, 0.0) for chunk in chunks[:limit]]
-
-    sims = cosine_similarity(doc_mat, query_vec.reshape(1, -1)).ravel()
-    if sims.size == 0:
-        return [(chunk, 0.0) for chunk in chunks[:limit]]
-    top_indices = np.argsort(sims)[::-1][: limit or 6]
-    results: List[Tuple[AiKnowledgeBaseChunk, float]] = []
-    for idx in top_indices:
-        score = float(sims[idx])
-        chunk = chunks[int(idx)]
-        results.append((chunk, score))
-    return results
+    limit = limit or 6
+    terms = text_tokenizer.segment_query(question)
+    scores: Dict[int, float] = {}
+    stats = await _indexed_stats(db, kb_ids) if terms else {}
+    if stats:
+        lexical = await _bm25_scores(db, stats, terms)
+        # 首次检索某知识库时要读取向量文件并建立内存映射，与矩阵运算一起放到线程里
+        dense = await asyncio.to_thread(kb_vector_index.search, list(stats), terms, _HYBRID_CANDIDATES)
+        scores = _fuse_scores(lexical, dense)
+    if not scores:
+        chunks = await fetch_recent_chunks(db, kb_ids, fetch_limit=limit)
+        return [(chunk, 0.0) for chunk in chunks]
+
+    top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+    res = await db.execute(
+        select(AiKnowledgeBaseChunk).where(AiKnowledgeBaseChunk.id.in_([chunk_id for chunk_id, _ in top]))
+    )
+    by_id = {chunk.id: chunk for chunk in res.scalars().all()}
+    return [(by_id[chunk_id], float(score)) for chunk_id, score in top if chunk_id in by_id]
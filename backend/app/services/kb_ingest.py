@@ -0,0 +1,120 @@
+"""
+知识库文档入库流水线
+上传接口只保存文件并登记文档（状态 processing）后立即返回；
+文本抽取 → 切分 → 分词在进程池中执行，写片段与索引回到事件循环完成，结束后推送状态与片段数。
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Callable, Dict, Optional
+
+from ..database import AsyncSessionLocal
+from ..models.ai_config import AiKnowledgeBaseDocument
+from .ai_workflow import prepare_document_file, store_document_chunks
+from .sensitive_filter import sensitive_filter
+from .socket_manager import online_users, sio
+
+logger = logging.getLogger(__name__)
+
+INGEST_PROCESSING = "processing"
+INGEST_READY = "ready"
+INGEST_FAILED = "failed"
+
+
+class KbIngestPipeline:
+    def __init__(
+        self,
+        max_workers: int = 2,
+        session_factory: Callable = AsyncSessionLocal,
+        executor: Optional[Executor] = None,
+    ):
+        self.max_workers = max_workers
+        self.session_factory = session_factory
+        self._executor = executor
+        # 每个文档最近一次提交的序号：替换文件时旧任务的结果直接丢弃
+        self._latest: Dict[int, int] = {}
+        self._seq = 0
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def submit(self, document_id: int, abs_path: str, file_ext: str, notify_user_id: Optional[int] = None) -> asyncio.Task:
+        """登记一次入库；调用方需先把文档状态置为 processing 并提交事务"""
+        self._seq += 1
+        self._latest[document_id] = self._seq
+        task = asyncio.create_task(self._run(document_id, self._seq, abs_path, file_ext, notify_user_id))
+        self._tasks[document_id] = task
+        task.add_done_callback(lambda t, doc_id=document_id: self._forget(doc_id, t))
+        return task
+
+    def _forget(self, document_id: int, task: asyncio.Task) -> None:
+        if self._tasks.get(document_id) is task:
+            del self._tasks[document_id]
+
+    def is_pending(self, document_id: int) -> bool:
+        return document_id in self._tasks
+
+    async def _run(self, document_id: int, seq: int, abs_path: str, file_ext: str, notify_user_id: Optional[int]) -> None:
+        loop = asyncio.get_running_loop()
+        event = {"document_id": document_id, "status": INGEST_READY, "chunk_count": 0, "error": None}
+        try:
+            async with self.session_factory() as db:
+                await sensitive_filter.refresh(db)
+            # 工作进程按传入的词表编译自动机，在切分之前替换敏感词
+            prepared = await loop.run_in_executor(
+                self.executor, prepare_document_file, abs_path, file_ext, sensitive_filter.words
+            )
+            if self._latest.get(document_id) != seq:
+                return
+            async with self.session_factory() as db:
+                doc = await db.get(AiKnowledgeBaseDocument, document_id)
+                if doc is None:
+                    # 处理期间文档已被删除
+                    return
+                event["chunk_count"] = await store_document_chunks(db, doc, prepared)
+                doc.ingest_status = INGEST_READY
+                doc.ingest_error = None
+                await db.commit()
+        except Exception as exc:
+            logger.exception("KB ingest failed for document %s", document_id)
+            event["status"] = INGEST_FAILED
+            event["error"] = str(exc) or type(exc).__name__
+            await self._mark_failed(document_id, seq, event["error"])
+        finally:
+            if self._latest.get(document_id) == seq:
+                del self._latest[document_id]
+        await self._notify(notify_user_id, event)
+
+    async def _mark_failed(self, document_id: int, seq: int, error: str) -> None:
+        if self._latest.get(document_id) != seq:
+            return
+        try:
+            async with self.session_factory() as db:
+                doc = await db.get(AiKnowledgeBaseDocument, document_id)
+                if doc is not None:
+                    doc.ingest_status = INGEST_FAILED
+                    doc.ingest_error = error[:500]
+                    await db.commit()
+        except Exception:
+            logger.exception("Failed to record ingest failure for document %s", document_id)
+
+    async def _notify(self, user_id: Optional[int], event: dict) -> None:
+        if user_id is None or user_id not in online_users:
+            return
+        try:
+            await sio.emit("kb_document_ingested", event, to=online_users[user_id])
+        except Exception:
+            logger.warning("Failed to push ingest status for document %s", event.get("document_id"))
+
+    async def drain(self) -> None:
+        """等待当前所有入库任务结束（测试与停机时使用）"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+
+kb_ingest_pipeline = KbIngestPipeline(max_workers=int(os.getenv("KB_INGEST_WORKERS", 2)))
@@ -0,0 +1,275 @@
+"""
+知识库语义向量索引
+每个知识库一份本地向量文件：片段向量在入库时计算（默认 TF-IDF + TruncatedSVD 即 LSA），
+以连续的 float32 矩阵存放并通过内存映射读取，检索时一次矩阵乘法算出全部余弦相似度，无需外部服务。
+"""
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import joblib
+import numpy as np
+
+from ..config import settings
+
+
+class EmbeddingBackend(ABC):
+    """向量化后端接口：fit 拟合语料，encode 输出 L2 归一化的 float32 向量"""
+
+    name = "base"
+
+    @abstractmethod
+    def fit(self, docs: Sequence[Sequence[str]]) -> bool:
+        """拟合模型，语料不足以建立向量空间时返回 False"""
+
+    @abstractmethod
+    def encode(self, docs: Sequence[Sequence[str]]) -> np.ndarray:
+        """批量编码片段"""
+
+    def encode_query(self, tokens: Sequence[str]) -> np.ndarray:
+        return self.encode([tokens])[0]
+
+    @property
+    @abstractmethod
+    def dim(self) -> int:
+        """向量维度"""
+
+
+def _identity(tokens):
+    return tokens
+
+
+class LsaBackend(EmbeddingBackend):
+    """潜在语义分析：对分词后的片段做 TF-IDF，再用截断 SVD 降到低维稠密空间"""
+
+    name = "lsa"
+
+    def __init__(self, n_components: int = 128):
+        self.n_components = n_components
+        self.vectorizer = None
+        self.svd = None
+
+    def fit(self, docs: Sequence[Sequence[str]]) -> bool:
+        from sklearn.decomposition import TruncatedSVD
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        docs = [list(d) for d in docs]
+        if len(docs) < 3:
+            return False
+        vectorizer = TfidfVectorizer(analyzer=_identity, sublinear_tf=True)
+        try:
+            matrix = vectorizer.fit_transform(docs)
+        except ValueError:
+            return False
+        n_components = min(self.n_components, matrix.shape[0] - 1, matrix.shape[1] - 1)
+        if n_components < 2:
+            return False
+        svd = TruncatedSVD(n_components=n_components, random_state=0)
+        svd.fit(matrix)
+        self.vectorizer, self.svd = vectorizer, svd
+        return True
+
+    def encode(self, docs: Sequence[Sequence[str]]) -> np.ndarray:
+        vectors = self.svd.transform(self.vectorizer.transform([list(d) for d in docs])).astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def encode_query(self, tokens: Sequence[str]) -> np.ndarray:
+        # 单条问题绕开 sklearn 的稀疏矩阵开销：TF-IDF 与 SVD 都是线性的，直接累加词项在投影矩阵中的行
+        vocabulary = self.vectorizer.vocabulary_
+        counts: Dict[int, int] = {}
+        for token in tokens:
+            idx = vocabulary.get(token)
+            if idx is not None:
+                counts[idx] = counts.get(idx, 0) + 1
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if not counts:
+            return vector
+        idx = np.fromiter(counts.keys(), dtype=np.int64)
+        tf = np.fromiter(counts.values(), dtype=np.float32)
+        weights = (1.0 + np.log(tf)) * self.vectorizer.idf_[idx]
+        vector = (weights @ self.svd.components_[:, idx].T).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    @property
+    def dim(self) -> int:
+        return int(self.svd.n_components)
+
+
+EMBEDDING_BACKENDS = {
+    LsaBackend.name: LsaBackend,
+}
+
+
+class _LoadedIndex:
+    def __init__(self, version: float, meta: dict, backend: EmbeddingBackend, ids: np.ndarray, vectors: np.ndarray):
+        self.version = version
+        self.meta = meta
+        self.backend = backend
+        self.ids = ids
+        self.vectors = vectors
+
+
+class KnowledgeBaseVectorIndex:
+    """按知识库管理向量文件：<dir>/kb_<id>.{f32,ids.npy,model.joblib,json}
+
+    写入一律先写临时文件再 os.replace，读取方按元数据文件的修改时间判断是否需要重新映射。
+    同一知识库的 读取-修改-写入（add / remove / rebuild / drop）持有该知识库的锁串行执行，
+    否则并发入库会各自基于旧文件追加，后写入的一方覆盖先写入的片段。
+    """
+
+    # 入库后新增片段超过拟合时语料的这个比例就整体重新拟合（增量片段只做 fold-in 投影）
+    REFIT_GROWTH = 0.5
+
+    def __init__(self, root: str, backend: str = "lsa"):
+        self.root = root
+        self.backend_name = backend
+        self._cache: Dict[int, _LoadedIndex] = {}
+        self._lock = threading.Lock()
+        self._kb_locks: Dict[int, threading.RLock] = {}
+
+    def _kb_lock(self, kb_id: int) -> threading.RLock:
+        with self._lock:
+            lock = self._kb_locks.get(kb_id)
+            if lock is None:
+                lock = self._kb_locks[kb_id] = threading.RLock()
+            return lock
+
+    def _path(self, kb_id: int, suffix: str) -> str:
+        return os.path.join(self.root, f"kb_{int(kb_id)}.{suffix}")
+
+    def exists(self, kb_id: int) -> bool:
+        return os.path.isfile(self._path(kb_id, "json"))
+
+    def _write(self, kb_id: int, meta: dict, backend: EmbeddingBackend, ids: np.ndarray, vectors: np.ndarray) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        token = f"tmp{os.getpid()}_{threading.get_ident()}"
+        staged = []
+        for suffix, writer in (
+            ("f32", lambda path: np.ascontiguousarray(vectors, dtype=np.float32).tofile(path)),
+            ("ids.npy", lambda path: np.save(path, ids.astype(np.int64))),
+            ("model.joblib", lambda path: joblib.dump(backend, path)),
+        ):
+            tmp = self._path(kb_id, f"{token}.{suffix}")
+            writer(tmp)
+            staged.append((tmp, self._path(kb_id, suffix)))
+        meta_tmp = self._path(kb_id, f"{token}.json")
+        with open(meta_tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        staged.append((meta_tmp, self._path(kb_id, "json")))
+        # 元数据最后替换：读取方看到新元数据时，向量文件已经就位
+        for tmp, final in staged:
+            os.replace(tmp, final)
+        with self._lock:
+            self._cache.pop(kb_id, None)
+
+    def _load(self, kb_id: int) -> Optional[_LoadedIndex]:
+        meta_path = self._path(kb_id, "json")
+        try:
+            version = os.path.getmtime(meta_path)
+        except OSError:
+            return None
+        cached = self._cache.get(kb_id)
+        if cached is not None and cached.version == version:
+            return cached
+        with self._lock:
+            cached = self._cache.get(kb_id)
+            if cached is not None and cached.version == version:
+                return cached
+            try:
+                with open(meta_path, encoding="utf-8") as f:
+                    meta = json.load(f)
+                ids = np.load(self._path(kb_id, "ids.npy"))
+                backend = joblib.load(self._path(kb_id, "model.joblib"))
+                if len(ids):
+                    mapped = np.memmap(self._path(kb_id, "f32"), dtype=np.float32, mode="r", shape=(len(ids), meta["dim"]))
+                    # 普通 ndarray 视图（不拷贝），避免 memmap 子类在每次运算上的额外开销
+                    vectors = np.asarray(mapped)
+                else:
+                    vectors = np.zeros((0, meta["dim"]), dtype=np.float32)
+            except (OSError, ValueError, KeyError):
+                return None
+            loaded = _LoadedIndex(version, meta, backend, ids, vectors)
+            self._cache[kb_id] = loaded
+            return loaded
+
+    def rebuild(self, kb_id: int, chunks: Sequence[Tuple[int, Sequence[str]]]) -> bool:
+        """用 (chunk_id, tokens) 全量拟合并写入；语料太少无法建立向量空间时删除旧索引并返回 False"""
+        with self._kb_lock(kb_id):
+            backend = EMBEDDING_BACKENDS[self.backend_name]()
+            if not backend.fit([tokens for _, tokens in chunks]):
+                self.drop(kb_id)
+                return False
+            ids = np.array([chunk_id for chunk_id, _ in chunks], dtype=np.int64)
+            vectors = backend.encode([tokens for _, tokens in chunks])
+            meta = {"backend": backend.name, "dim": backend.dim, "fitted_count": len(ids)}
+            self._write(kb_id, meta, backend, ids, vectors)
+            return True
+
+    def needs_refit(self, kb_id: int, added: int) -> bool:
+        loaded = self._load(kb_id)
+        if loaded is None:
+            return True
+        return len(loaded.ids) + added > loaded.meta.get("fitted_count", 0) * (1 + self.REFIT_GROWTH)
+
+    def add(self, kb_id: int, chunks: Sequence[Tuple[int, Sequence[str]]]) -> None:
+        """用已拟合模型投影新片段并追加（fold-in），不重新拟合"""
+        if not chunks:
+            return
+        with self._kb_lock(kb_id):
+            loaded = self._load(kb_id)
+            if loaded is None:
+                return
+            new_ids = np.array([chunk_id for chunk_id, _ in chunks], dtype=np.int64)
+            keep = ~np.isin(loaded.ids, new_ids)
+            ids = np.concatenate([loaded.ids[keep], new_ids])
+            vectors = np.vstack([np.asarray(loaded.vectors)[keep], loaded.backend.encode([t for _, t in chunks])])
+            self._write(kb_id, loaded.meta, loaded.backend, ids, vectors)
+
+    def remove(self, kb_id: int, chunk_ids: Sequence[int]) -> None:
+        if not len(chunk_ids):
+            return
+        with self._kb_lock(kb_id):
+            loaded = self._load(kb_id)
+            if loaded is None:
+                return
+            keep = ~np.isin(loaded.ids, np.asarray(chunk_ids, dtype=np.int64))
+            if keep.all():
+                return
+            self._write(kb_id, loaded.meta, loaded.backend, loaded.ids[keep], np.asarray(loaded.vectors)[keep])
+
+    def drop(self, kb_id: int) -> None:
+        with self._kb_lock(kb_id):
+            with self._lock:
+                self._cache.pop(kb_id, None)
+            for suffix in ("json", "f32", "ids.npy", "model.joblib"):
+                try:
+                    os.remove(self._path(kb_id, suffix))
+                except OSError:
+                    pass
+
+    def search(self, kb_ids: Sequence[int], query_tokens: Sequence[str], limit: int) -> List[Tuple[int, float]]:
+        """返回 [(chunk_id, 余弦相似度)]，按相似度降序；每个知识库一次矩阵-向量乘法"""
+        if not query_tokens:
+            return []
+        hits: List[Tuple[int, float]] = []
+        for kb_id in kb_ids:
+            loaded = self._load(kb_id)
+            if loaded is None or not len(loaded.ids):
+                continue
+            query = loaded.backend.encode_query(query_tokens)
+            if not query.any():
+                continue
+            sims = loaded.vectors @ query
+            k = min(limit, len(sims))
+            top = np.argpartition(-sims, k - 1)[:k]
+            hits.extend((int(loaded.ids[i]), float(sims[i])) for i in top)
+        hits.sort(key=lambda item: item[1], reverse=True)
+        return hits[:limit]
+
+
+kb_vector_index = KnowledgeBaseVectorIndex(settings.AI_VECTOR_INDEX_DIR, os.getenv("AI_EMBEDDING_BACKEND", "lsa"))
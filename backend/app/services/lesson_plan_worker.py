@@ -0,0 +1,374 @@
+"""
+智能教案后台生成
+教师提交的 AiLessonPlanTask 由服务端执行，不再依赖浏览器保持连接：
+工作协程领取 pending 任务（带租约），检索知识库并调用模型生成，定期把已生成部分写回 result 并续约，
+通过 Socket.IO 向教师推送进度。失败按次数重试（从已保存的部分续写），超过次数或不可重试的错误记为 failed。
+进程退出时租约到期的 streaming 任务会被重新排队。
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import AsyncGenerator, Callable, Dict, Optional, Set
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.ai_config import AiLessonPlanTask
+from .socket_manager import online_users, sio
+
+logger = logging.getLogger(__name__)
+
+TASK_PENDING = "pending"
+TASK_STREAMING = "streaming"
+TASK_COMPLETED = "completed"
+TASK_FAILED = "failed"
+
+# 续写时附带的已生成内容长度上限（字符）
+_RESUME_TAIL_CHARS = 2000
+
+# generate(db, task, prompt) -> 解析后的事件（type 为 thinking / answer / error）
+Generator = Callable[[AsyncSession, AiLessonPlanTask, str], AsyncGenerator[dict, None]]
+
+
+class _TaskGone(Exception):
+    """任务在生成过程中被删除或被教师手动改写"""
+
+
+class _GenerationFailed(Exception):
+    def __init__(self, message: str, retryable: bool):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def build_prompt(task: AiLessonPlanTask) -> str:
+    base = (task.prompt or "").strip()
+    if not base:
+        base = f"请为《{task.title}》编写一份完整的教案，包括教学目标、教学重点与难点、教学过程、课堂活动与课后作业。"
+        if task.outline:
+            base += f"\n课件大纲/思路：\n{task.outline}"
+    partial = task.result or ""
+    if not partial:
+        return base
+    return (
+        f"{base}\n\n以下是此前已生成的部分内容，请从中断处直接继续输出，不要重复已有内容：\n"
+        f"{partial[-_RESUME_TAIL_CHARS:]}"
+    )
+
+
+async def _default_generate(db: AsyncSession, task: AiLessonPlanTask, prompt: str) -> AsyncGenerator[dict, None]:
+    # 延迟导入：路由模块依赖本模块所在的 services 包
+    from ..routers.ai_qa import generate_events
+
+    async for event in generate_events(
+        db,
+        user_id=str(task.teacher_user_id),
+        question=prompt,
+        workflow="lesson_plan",
+        course_id=task.course_id,
+        model_raw=str(task.model_api_id) if task.model_api_id else None,
+    ):
+        yield event
+
+
+class LessonPlanTaskWorker:
+    def __init__(
+        self,
+        session_factory: Optional[Callable[[], AsyncSession]] = None,
+        generate: Generator = _default_generate,
+        concurrency: int = 2,
+        poll_seconds: float = 10.0,
+        max_attempts: int = 3,
+        timeout_seconds: float = 900.0,
+        checkpoint_seconds: float = 2.0,
+        lease_seconds: float = 120.0,
+        retry_backoff_seconds: float = 10.0,
+    ):
+        self._session_factory = session_factory
+        self.generate = generate
+        self.concurrency = max(1, concurrency)
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.timeout_seconds = timeout_seconds
+        self.checkpoint_seconds = checkpoint_seconds
+        self.lease_seconds = lease_seconds
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self._running: Dict[int, asyncio.Task] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        # 事件循环只弱引用任务，推送任务需在这里持有直到完成
+        self._emits: Set[asyncio.Task] = set()
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+
+    def _session(self) -> AsyncSession:
+        if self._session_factory is None:
+            from ..database import AsyncSessionLocal
+
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory()
+
+    def start(self) -> None:
+        if self._loop_task is None or self._loop_task.done():
+            self._wake = asyncio.Event()
+            self._loop_task = asyncio.create_task(self._run_loop())
+
+    def notify(self) -> None:
+        """有新任务或任务被重新排队时唤醒领取循环"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def stop(self) -> None:
+        """停止领取并取消执行中的任务；这些任务保持 streaming，租约到期后由下次启动的进程接手"""
+        tasks = [t for t in [self._loop_task, *self._running.values()] if t is not None]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop_task = None
+        self._running.clear()
+
+    async def _run_loop(self) -> None:
+        while True:
+            self._wake.clear()
+            try:
+                await self.recover_expired()
+                while len(self._running) < self.concurrency:
+                    task_id = await self.claim()
+                    if task_id is None:
+                        break
+                    job = asyncio.create_task(self.run_task(task_id))
+                    self._running[task_id] = job
+                    job.add_done_callback(lambda _t, tid=task_id: self._on_done(tid))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Lesson plan worker loop failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def _on_done(self, task_id: int) -> None:
+        self._running.pop(task_id, None)
+        self.notify()
+
+    async def recover_expired(self) -> int:
+        """租约过期的 streaming 任务（执行进程已退出）重新排队"""
+        now = datetime.utcnow()
+        conditions = [
+            AiLessonPlanTask.status == TASK_STREAMING,
+            or_(AiLessonPlanTask.lease_until == None, AiLessonPlanTask.lease_until < now),  # noqa: E711
+        ]
+        if self._running:
+            conditions.append(AiLessonPlanTask.id.notin_(list(self._running)))
+        async with self._session() as db:
+            res = await db.execute(
+                update(AiLessonPlanTask).where(*conditions).values(status=TASK_PENDING, lease_until=None)
+            )
+            await db.commit()
+            return res.rowcount or 0
+
+    async def claim(self) -> Optional[int]:
+        """领取最早的可执行任务；条件更新保证多个进程不会领取同一任务"""
+        now = datetime.utcnow()
+        async with self._session() as db:
+            candidates = (
+                await db.execute(
+                    select(AiLessonPlanTask.id)
+                    .where(
+                        AiLessonPlanTask.status == TASK_PENDING,
+                        or_(AiLessonPlanTask.lease_until == None, AiLessonPlanTask.lease_until <= now),  # noqa: E711
+                    )
+                    .order_by(AiLessonPlanTask.created_at, AiLessonPlanTask.id)
+                    .limit(self.concurrency)
+                )
+            ).scalars().all()
+            for task_id in candidates:
+                res = await db.execute(
+                    update(AiLessonPlanTask)
+                    .where(AiLessonPlanTask.id == task_id, AiLessonPlanTask.status == TASK_PENDING)
+                    .values(
+                        status=TASK_STREAMING,
+                        attempts=AiLessonPlanTask.attempts + 1,
+                        lease_until=now + timedelta(seconds=self.lease_seconds),
+                    )
+                )
+                await db.commit()
+                if res.rowcount:
+                    return task_id
+        return None
+
+    async def run_task(self, task_id: int) -> None:
+        async with self._session() as db:
+            task = await db.get(AiLessonPlanTask, task_id)
+            if task is None:
+                return
+            owner = task.teacher_user_id
+            attempts = task.attempts or 1
+            # 已生成的全部文本（含此前各次尝试保存的部分），失败时一并写回以便续写
+            progress = [task.result or ""]
+            self._publish(owner, {"type": "started", "task_id": task_id, "status": TASK_STREAMING, "attempt": attempts})
+            # 排队、检索与首字之前都没有答案文本、不会触发检查点，租约由独立的定时续约维持
+            heartbeat = asyncio.create_task(self._keep_lease(task_id))
+            try:
+                await asyncio.wait_for(self._generate(db, task, progress), self.timeout_seconds)
+            except _TaskGone:
+                return
+            except asyncio.TimeoutError:
+                await self._fail(db, task_id, owner, attempts, progress[0], "生成超时", retryable=True)
+                return
+            except _GenerationFailed as exc:
+                await self._fail(db, task_id, owner, attempts, progress[0], str(exc), exc.retryable)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.exception("Lesson plan task %s failed", task_id)
+                await self._fail(db, task_id, owner, attempts, progress[0], f"生成异常: {exc}", retryable=True)
+                return
+            finally:
+                heartbeat.cancel()
+                await asyncio.gather(heartbeat, return_exceptions=True)
+
+            text = progress[0]
+            if not text.strip():
+                await self._fail(db, task_id, owner, attempts, text, "模型未返回内容", retryable=True)
+                return
+            res = await db.execute(
+                update(AiLessonPlanTask)
+                .where(AiLessonPlanTask.id == task_id, AiLessonPlanTask.status == TASK_STREAMING)
+                .values(
+                    status=TASK_COMPLETED,
+                    result=text,
+                    error_message=None,
+                    lease_until=None,
+                    completed_at=datetime.utcnow(),
+                )
+            )
+            await db.commit()
+            if res.rowcount:
+                self.completed += 1
+                self._publish(owner, {"type": TASK_COMPLETED, "task_id": task_id, "status": TASK_COMPLETED, "length": len(text)})
+
+    async def _generate(self, db: AsyncSession, task: AiLessonPlanTask, progress: list) -> None:
+        """消费模型事件，文本累积到 progress[0]；按 checkpoint_seconds 写回已生成部分并续约"""
+        task_id, owner = task.id, task.teacher_user_id
+        prompt = build_prompt(task)
+        text = progress[0]
+        pushed = len(text)
+        last_checkpoint = time.monotonic()
+        async for event in self.generate(db, task, prompt):
+            kind = event.get("type", "answer")
+            content = event.get("content") or ""
+            if kind == "error":
+                raise _GenerationFailed(content or "生成失败", bool(event.get("retryable", True)))
+            if kind == "thinking":
+                # 排队位置等过程提示
+                self._publish(owner, {"type": "thinking", "task_id": task_id, "status": TASK_STREAMING, "message": content})
+                continue
+            text += content
+            progress[0] = text
+            if time.monotonic() - last_checkpoint >= self.checkpoint_seconds:
+                await self._checkpoint(db, task_id, text)
+                self._publish(
+                    owner,
+                    {"type": "progress", "task_id": task_id, "status": TASK_STREAMING, "delta": text[pushed:], "length": len(text)},
+                )
+                pushed = len(text)
+                last_checkpoint = time.monotonic()
+
+    async def _keep_lease(self, task_id: int) -> None:
+        """每三分之一个租约期续约一次；使用独立会话，不与生成过程共用（检索也在用那个会话）"""
+        interval = self.lease_seconds / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with self._session() as db:
+                    res = await db.execute(
+                        update(AiLessonPlanTask)
+                        .where(AiLessonPlanTask.id == task_id, AiLessonPlanTask.status == TASK_STREAMING)
+                        .values(lease_until=datetime.utcnow() + timedelta(seconds=self.lease_seconds))
+                    )
+                    await db.commit()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Failed to renew lease for lesson plan task %s", task_id)
+                continue
+            if not res.rowcount:
+                return
+
+    async def _checkpoint(self, db: AsyncSession, task_id: int, text: str) -> None:
+        res = await db.execute(
+            update(AiLessonPlanTask)
+            .where(AiLessonPlanTask.id == task_id, AiLessonPlanTask.status == TASK_STREAMING)
+            .values(result=text, lease_until=datetime.utcnow() + timedelta(seconds=self.lease_seconds))
+        )
+        await db.commit()
+        if not res.rowcount:
+            raise _TaskGone()
+
+    async def _fail(
+        self, db: AsyncSession, task_id: int, owner: int, attempts: int, text: str, message: str, retryable: bool
+    ) -> None:
+        """可重试且未超过次数时重新排队（退避后再领取，保留已生成部分），否则标记失败"""
+        await db.rollback()
+        retry = retryable and attempts < self.max_attempts
+        if retry:
+            values = {
+                "status": TASK_PENDING,
+                "result": text or None,
+                "error_message": message,
+                "lease_until": datetime.utcnow() + timedelta(seconds=self.retry_backoff_seconds * attempts),
+            }
+        else:
+            values = {"status": TASK_FAILED, "result": text or None, "error_message": message, "lease_until": None}
+        res = await db.execute(
+            update(AiLessonPlanTask)
+            .where(AiLessonPlanTask.id == task_id, AiLessonPlanTask.status == TASK_STREAMING)
+            .values(**values)
+        )
+        await db.commit()
+        if not res.rowcount:
+            return
+        if retry:
+            self.retried += 1
+            self._schedule_wake(self.retry_backoff_seconds * attempts)
+        else:
+            self.failed += 1
+        self._publish(owner, {"type": values["status"], "task_id": task_id, "status": values["status"], "error_message": message})
+
+    def _schedule_wake(self, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        loop.call_later(delay, self.notify)
+
+    def _publish(self, owner_user_id: int, event: dict) -> None:
+        # Socket.IO 推送给提交任务的教师（未在线时由前端轮询任务状态）
+        if owner_user_id in online_users:
+            task = asyncio.create_task(self._emit(online_users[owner_user_id], event))
+            self._emits.add(task)
+            task.add_done_callback(self._emits.discard)
+
+    async def _emit(self, sid: str, event: dict) -> None:
+        try:
+            await sio.emit("lesson_plan_task_progress", event, to=sid)
+        except Exception:
+            logger.warning("Failed to push lesson plan progress for task %s", event.get("task_id"))
+
+    def stats(self) -> dict:
+        return {
+            "running": sorted(self._running),
+            "concurrency": self.concurrency,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
+
+
+lesson_plan_worker = LessonPlanTaskWorker(
+    concurrency=int(os.getenv("LESSON_PLAN_WORKERS", 2)),
+    max_attempts=int(os.getenv("LESSON_PLAN_MAX_ATTEMPTS", 3)),
+    timeout_seconds=float(os.getenv("LESSON_PLAN_TIMEOUT_SECONDS", 900)),
+)
@@ -0,0 +1,285 @@
+"""
+本地模拟大模型服务（压测用）
+同时提供 dashscope_openai 的 /chat/completions（OpenAI 兼容 SSE，以 [DONE] 结束）与 ark_responses 的 /responses
+（response.output_text.delta / .done / response.completed 事件），在管理端把模型接口地址配置为本服务即可，不消耗真实额度。
+ark_responses 按真实服务的事件格式输出：当前 _extract_stream_text 只从 response.output_text.done 取到全文，
+因此该协议下首字时间约等于整段生成时间。
+
+可调参数（启动参数为默认值，单个请求可用 X-Mock-* 请求头覆盖，例如在模型的 api_header 中配置 {"X-Mock-Error-Rate": "0.1"}）：
+    first_token_ms     首字延迟（毫秒）
+    tokens_per_second  出字速率（0 表示不限速）
+    tokens             回答长度（token 数，请求中的 max_tokens 更小时以其为准）
+    chunk_tokens       每个 SSE 事件包含的 token 数
+    pad_bytes          每个事件附加的无关字段字节数（模拟冗长的上游报文）
+    error_rate         直接返回错误状态码的概率
+    error_status       注入错误使用的状态码（429 时附带 Retry-After）
+    disconnect_rate    输出一半后断开连接的概率
+
+用法（在 backend/ 目录下）：
+    python -m app.services.mock_llm_provider --port 9100 --first-token-ms 300 --tokens-per-second 40 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import AsyncGenerator, Mapping, Optional, Sequence
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 逐 token 循环输出的文本（1 token = 1 个字符）
+_ANSWER_TEXT = (
+    "这是模拟大模型服务返回的回答，用于压测流式问答链路。"
+    "选课通常在每学期开学前两周进行，具体时间以教务处通知为准。"
+    "补考安排在下学期开学第二周，成绩最高按六十分记录。"
+)
+
+
+class MockConfig:
+    FIELDS = {
+        "first_token_ms": float,
+        "tokens_per_second": float,
+        "tokens": int,
+        "chunk_tokens": int,
+        "pad_bytes": int,
+        "error_rate": float,
+        "error_status": int,
+        "disconnect_rate": float,
+    }
+
+    def __init__(
+        self,
+        first_token_ms: float = 300.0,
+        tokens_per_second: float = 50.0,
+        tokens: int = 200,
+        chunk_tokens: int = 1,
+        pad_bytes: int = 0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        disconnect_rate: float = 0.0,
+    ):
+        self.first_token_ms = max(0.0, first_token_ms)
+        self.tokens_per_second = max(0.0, tokens_per_second)
+        self.tokens = max(1, tokens)
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.pad_bytes = max(0, pad_bytes)
+        self.error_rate = min(1.0, max(0.0, error_rate))
+        self.error_status = error_status
+        self.disconnect_rate = min(1.0, max(0.0, disconnect_rate))
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def with_overrides(self, headers: Mapping[str, str]) -> "MockConfig":
+        """X-Mock-First-Token-Ms 之类的请求头覆盖对应参数；无法解析的值忽略"""
+        values = self.as_dict()
+        for name, cast in self.FIELDS.items():
+            raw = headers.get("x-mock-" + name.replace("_", "-"))
+            if raw is None:
+                continue
+            try:
+                values[name] = cast(raw)
+            except ValueError:
+                continue
+        return MockConfig(**values)
+
+
+def _answer_pieces(config: MockConfig, max_tokens: Optional[int]) -> list:
+    total = min(config.tokens, max_tokens) if max_tokens else config.tokens
+    text = (_ANSWER_TEXT * (total // len(_ANSWER_TEXT) + 1))[:total]
+    step = config.chunk_tokens
+    return [text[i : i + step] for i in range(0, len(text), step)]
+
+
+def _event(data: dict, config: MockConfig, event: Optional[str] = None) -> str:
+    if config.pad_bytes:
+        data = dict(data, padding="x" * config.pad_bytes)
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class _Disconnect(Exception):
+    pass
+
+
+class MockLlmProvider:
+    def __init__(self, config: MockConfig, seed: Optional[int] = None):
+        self.config = config
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.active = 0
+        self.completed = 0
+        self.injected_errors = 0
+        self.disconnects = 0
+        self.tokens_sent = 0
+
+    def _injected_error(self, config: MockConfig) -> Optional[JSONResponse]:
+        if not config.error_rate or self.rng.random() >= config.error_rate:
+            return None
+        self.injected_errors += 1
+        headers = {"Retry-After": "1"} if config.error_status == 429 else None
+        return JSONResponse(
+            {"error": {"message": "mock provider injected error", "code": config.error_status}},
+            status_code=config.error_status,
+            headers=headers,
+        )
+
+    async def _full_text(self, config: MockConfig, pieces: Sequence[str]) -> Optional[str]:
+        """非流式请求：等待全部生成后一次返回；注入的断开表现为返回 None"""
+        try:
+            return "".join([piece async for piece in self._paced(config, pieces)])
+        except _Disconnect:
+            return None
+
+    async def _paced(self, config: MockConfig, pieces: Sequence[str]) -> AsyncGenerator[str, None]:
+        """按首字延迟与出字速率逐块产出；以绝对时间排期，避免 sleep 误差累积"""
+        loop = asyncio.get_running_loop()
+        start = loop.time() + config.first_token_ms / 1000
+        disconnect_at = len(pieces) // 2 if config.disconnect_rate and self.rng.random() < config.disconnect_rate else None
+        emitted = 0
+        for index, piece in enumerate(pieces):
+            if disconnect_at is not None and index >= disconnect_at:
+                self.disconnects += 1
+                raise _Disconnect()
+            delay = emitted / config.tokens_per_second if config.tokens_per_second else 0.0
+            wait = start + delay - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            emitted += len(piece)
+            self.tokens_sent += len(piece)
+            yield piece
+
+    def _tracked(self, stream: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+        async def run():
+            self.active += 1
+            try:
+                async for chunk in stream:
+                    yield chunk
+                self.completed += 1
+            finally:
+                self.active -= 1
+
+        return run()
+
+    async def chat_completions(self, request: Request):
+        body = await request.json()
+        config = self.config.with_overrides(request.headers)
+        self.requests += 1
+        error = self._injected_error(config)
+        if error is not None:
+            return error
+        pieces = _answer_pieces(config, body.get("max_tokens"))
+        model = body.get("model") or "mock"
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            text = await self._full_text(config, pieces)
+            if text is None:
+                return JSONResponse({"error": {"message": "mock provider dropped the response"}}, status_code=502)
+            return JSONResponse(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                }
+            )
+
+        async def events():
+            base = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model}
+            async for piece in self._paced(config, pieces):
+                yield _event(dict(base, choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}]), config)
+            yield _event(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]), config)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(self._tracked(events()), media_type="text/event-stream")
+
+    async def responses(self, request: Request):
+        body = await request.json()
+        config = self.config.with_overrides(request.headers)
+        self.requests += 1
+        error = self._injected_error(config)
+        if error is not None:
+            return error
+        pieces = _answer_pieces(config, body.get("max_output_tokens"))
+        response_id = f"resp_{uuid.uuid4().hex[:12]}"
+        item_id = f"msg_{uuid.uuid4().hex[:12]}"
+
+        def response_object(status: str, text: str = "") -> dict:
+            output = [{"id": item_id, "type": "message", "role": "assistant", "content": [{"type": "output_text", "text": text}]}]
+            return {"id": response_id, "object": "response", "model": body.get("model") or "mock", "status": status, "output": output if text else []}
+
+        if not body.get("stream"):
+            text = await self._full_text(config, pieces)
+            if text is None:
+                return JSONResponse({"error": {"message": "mock provider dropped the response"}}, status_code=502)
+            return JSONResponse(response_object("completed", text))
+
+        async def events():
+            yield _event({"type": "response.created", "response": response_object("in_progress")}, config, "response.created")
+            parts = []
+            async for piece in self._paced(config, pieces):
+                parts.append(piece)
+                delta = {"type": "response.output_text.delta", "item_id": item_id, "output_index": 0, "content_index": 0, "delta": piece}
+                yield _event(delta, config, "response.output_text.delta")
+            text = "".join(parts)
+            done = {"type": "response.output_text.done", "item_id": item_id, "output_index": 0, "content_index": 0, "text": text}
+            yield _event(done, config, "response.output_text.done")
+            yield _event({"type": "response.completed", "response": response_object("completed", text)}, config, "response.completed")
+
+        return StreamingResponse(self._tracked(events()), media_type="text/event-stream")
+
+    def stats(self) -> dict:
+        return {
+            "config": self.config.as_dict(),
+            "requests": self.requests,
+            "active_streams": self.active,
+            "completed_streams": self.completed,
+            "injected_errors": self.injected_errors,
+            "disconnects": self.disconnects,
+            "tokens_sent": self.tokens_sent,
+        }
+
+
+def create_app(config: Optional[MockConfig] = None, seed: Optional[int] = None) -> FastAPI:
+    provider = MockLlmProvider(config or MockConfig(), seed)
+    app = FastAPI(title="Mock LLM provider")
+    app.state.provider = provider
+    # endpoint 可配置为根地址或带 /v1、/api/v3 前缀，路径都能匹配
+    for prefix in ("", "/v1", "/api/v3", "/compatible-mode/v1"):
+        app.add_api_route(f"{prefix}/chat/completions", provider.chat_completions, methods=["POST"])
+        app.add_api_route(f"{prefix}/responses", provider.responses, methods=["POST"])
+    app.add_api_route("/health", lambda: {"status": "ok"}, methods=["GET"])
+    app.add_api_route("/stats", provider.stats, methods=["GET"])
+    return app
+
+
+def config_from_args(args: argparse.Namespace) -> MockConfig:
+    return MockConfig(**{name: getattr(args, name) for name in MockConfig.FIELDS})
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = MockConfig()
+    for name, cast in MockConfig.FIELDS.items():
+        parser.add_argument("--" + name.replace("_", "-"), type=cast, default=getattr(defaults, name))
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Mock LLM provider (OpenAI chat completions + Ark responses)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--seed", type=int, default=None)
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+    uvicorn.run(create_app(config_from_args(args), args.seed), host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,428 @@
+"""
+知识库检索基准
+用固定种子生成中文 / 英文课程语料（以及一组手写的教务问答样例），按文档入库（切分、分词、倒排与向量索引），
+再用带标注的问题跑 retrieve_top_chunks，输出 recall@k、MRR、检索延迟 p50/p95、入库耗时与索引 / 进程内存（JSON），
+修改 split_text_into_chunks、分词规则或检索打分后可与基线报告对比，质量下降或明显变慢时以退出码 1 结束。
+全程离线：内存 SQLite + 临时目录中的向量索引，不读写正式数据。
+
+用法（在 backend/ 目录下）：
+    python -m app.services.retrieval_benchmark --corpora zh en fixture --scales small medium --seeds 1 2 \
+        --output bench.json [--baseline previous.json] [--chunk-size 450 --overlap 80]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from ..database import Base
+from ..models.ai_config import AiKnowledgeBase, AiKnowledgeBaseDocument
+from . import ai_workflow, text_tokenizer as tokenizer_module
+from .ai_workflow import prepare_chunks, retrieve_top_chunks, store_document_chunks
+from .kb_vector_index import KnowledgeBaseVectorIndex
+
+# 语料规模：文档数
+SCALES: Dict[str, int] = {
+    "tiny": 40,
+    "small": 300,
+    "medium": 1200,
+    "large": 2400,
+}
+CORPORA = ("zh", "en", "fixture")
+DEFAULT_SEEDS = (1,)
+RECALL_AT = (1, 3, 5, 10)
+MAX_QUESTIONS = 80
+QUALITY_KEYS = tuple(f"recall@{k}" for k in RECALL_AT) + ("mrr",)
+
+_ZH_SUBJECTS = (
+    "数据结构", "操作系统", "计算机网络", "计算机组成原理", "数据库原理", "编译原理", "软件工程",
+    "高等数学", "线性代数", "概率论", "离散数学", "大学物理", "机器学习", "网络安全",
+)
+_ZH_CONCEPTS = (
+    "哈希表", "二叉树", "图遍历", "进程调度", "虚拟内存", "死锁", "拥塞控制", "路由协议", "缓存一致性", "指令流水线",
+    "事务隔离", "索引优化", "词法分析", "语法分析", "需求分析", "单元测试", "函数极限", "定积分", "矩阵分解", "特征值",
+    "条件概率", "大数定律", "命题逻辑", "最短路径", "电磁感应", "梯度下降", "正则化", "决策树", "对称加密", "访问控制",
+)
+# (文档中的说法, 换一种问法)
+_ZH_ASPECTS = (
+    ("基本定义", "是什么意思"),
+    ("典型应用", "一般用在哪里"),
+    ("复杂度分析", "效率怎么样"),
+    ("常见错误", "容易出什么问题"),
+    ("考试重点", "期末考试会考哪些内容"),
+    ("实验步骤", "上机应该怎么做"),
+)
+_ZH_FILLERS = (
+    "课堂上老师会结合例题逐步推导，建议课前预习教材对应章节。",
+    "这部分内容与后续章节联系紧密，学习时要注意前后知识的衔接。",
+    "课后习题覆盖了主要题型，完成后可以对照参考答案自查。",
+    "实验课安排在第十周前后，需要提前在教务系统中预约机房。",
+    "如果对概念理解有困难，可以在答疑时间向助教请教。",
+    "期中测验会抽查本章的基础题，平时成绩占总评成绩的百分之三十。",
+    "教材之外，推荐阅读课程网站上的拓展资料与往年讲义。",
+    "小组讨论时每人需要准备一个例子，并说明适用条件。",
+)
+
+_EN_SUBJECTS = (
+    "data structures", "operating systems", "computer networks", "database systems", "compilers",
+    "software engineering", "calculus", "linear algebra", "probability", "discrete mathematics",
+    "physics", "machine learning",
+)
+_EN_CONCEPTS = (
+    "hash table", "binary tree", "graph traversal", "process scheduling", "virtual memory", "deadlock",
+    "congestion control", "routing protocol", "cache coherence", "instruction pipeline", "transaction isolation",
+    "query optimizer", "lexical analysis", "parser generator", "requirements elicitation", "unit testing",
+    "limits", "definite integral", "matrix factorization", "eigenvalues", "conditional probability",
+    "law of large numbers", "propositional logic", "shortest path", "electromagnetic induction",
+    "gradient descent", "regularization", "decision tree", "symmetric encryption", "access control",
+)
+_EN_ASPECTS = (
+    ("definition", "what does it mean"),
+    ("typical applications", "where is it used"),
+    ("complexity analysis", "how expensive is it"),
+    ("common mistakes", "what do students get wrong"),
+    ("exam focus", "what will the final exam ask"),
+    ("lab procedure", "how do I run the lab"),
+)
+_EN_FILLERS = (
+    "The lecture walks through worked examples step by step, so read the textbook section beforehand.",
+    "This topic connects closely to later chapters, so keep the earlier material in mind.",
+    "The exercise sheet covers the main problem types and a solution key is posted afterwards.",
+    "Lab sessions run around week ten and must be booked in the academic system in advance.",
+    "Teaching assistants hold office hours twice a week for anyone who gets stuck.",
+    "The midterm quiz samples the basic questions and coursework counts for thirty percent.",
+    "Beyond the textbook, the course site links extra readings and previous lecture notes.",
+    "For group discussion everyone prepares one example and explains when it applies.",
+)
+
+# 手写样例：(标题, 正文)，问题刻意换了说法；中英文各若干
+FIXTURE_DOCS: Tuple[Tuple[str, str], ...] = (
+    ("选课与退课", "每学期第一周为补选与退课阶段，学生登录教务系统在“选课中心”提交申请。退课后学分不计入当学期，"
+     "公选课名额有限，先到先得。超过第二周不再受理退课，确需放弃课程的按缓考或重修办理。"),
+    ("补考安排", "期末考试不及格的学生可在下学期开学第二周参加补考，补考成绩最高按六十分记入成绩单。"
+     "补考无需报名，考试时间与地点在教务系统公布，缺考者需重修该课程。"),
+    ("重修办理", "补考仍未通过或缺考的课程需要重修。重修在选课阶段提交申请并缴纳学分费用，"
+     "重修成绩按实际得分记录，成绩单上标注“重修”。"),
+    ("缓考申请", "因病或不可抗力无法参加期末考试的学生，应在考试前提交缓考申请并附医院证明，"
+     "经学院审批后随下学期补考一同进行，缓考成绩按正常考试记录。"),
+    ("奖学金评定", "奖学金每学年评定一次，依据上一学年的平均绩点与综合测评排名，"
+     "有不及格课程或违纪处分的学生不参与评定，名单在学院网站公示五个工作日。"),
+    ("转专业", "大一学年结束后可以申请转专业，申请人平均绩点需位于本专业前百分之二十，"
+     "并通过转入学院组织的考核，转入后按新专业培养方案补修差额学分。"),
+    ("毕业论文查重", "毕业论文在答辩前统一查重，文字复制比不超过百分之二十方可参加答辩，"
+     "超过的需在指导教师指导下修改后复检，复检仍不合格的推迟答辩。"),
+    ("请假与销假", "学生请假三天以内由辅导员审批，三天以上需学院副书记审批，"
+     "假期结束返校后应在教务系统中销假，未按时销假按旷课处理。"),
+    ("成绩复核", "对期末成绩有异议的学生可在成绩公布后一周内申请复核，"
+     "任课教师核对试卷后由教学秘书答复，复核只核查漏判与计分错误，不重新评分。"),
+    ("英语四六级报名", "英语四级与英语六级考试每年两次，报名在教务处通知的时间段内网上完成，"
+     "报考六级需四级成绩达到四百二十五分，报名费需在截止日前缴纳。"),
+    ("Course withdrawal", "Students may drop a course during the first two weeks of the semester through the "
+     "academic system. Dropped courses do not appear on the transcript and the credits are refunded."),
+    ("Library borrowing", "Undergraduates can borrow up to twenty books for thirty days. Items can be renewed "
+     "online twice unless another reader has placed a hold. Overdue items incur a daily fine."),
+    ("Thesis defense", "The final thesis defense takes place in June. Students submit the manuscript to their "
+     "supervisor three weeks earlier and the committee of three faculty members grades the presentation."),
+    ("Exchange programs", "Exchange applications open each October. Applicants need a GPA of at least 3.0 and "
+     "an English test score; credits earned abroad are transferred after review by the faculty office."),
+)
+FIXTURE_QUESTIONS: Tuple[Tuple[str, str], ...] = (
+    ("开学后还能放弃已经选好的课吗？", "选课与退课"),
+    ("公选课退掉以后学分怎么算？", "选课与退课"),
+    ("期末挂科了什么时候可以补考？", "补考安排"),
+    ("补考考过了成绩单上显示多少分？", "补考安排"),
+    ("补考也没过该怎么办？", "重修办理"),
+    ("生病了没法参加期末考试怎么办？", "缓考申请"),
+    ("奖学金是根据什么评的？", "奖学金评定"),
+    ("想换专业需要满足什么条件？", "转专业"),
+    ("论文重复率多少才能答辩？", "毕业论文查重"),
+    ("请一周假需要谁批准？", "请假与销假"),
+    ("觉得期末分数算错了可以申请查卷吗？", "成绩复核"),
+    ("六级报名有什么要求？", "英语四六级报名"),
+    ("Can I still drop a course in week two?", "Course withdrawal"),
+    ("How many books can I take out from the library?", "Library borrowing"),
+    ("When is the thesis defense held?", "Thesis defense"),
+    ("What GPA do I need to study abroad for a semester?", "Exchange programs"),
+)
+
+
+def generate_corpus(language: str, n_docs: int, seed: int) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+    """合成课程语料：每篇文档对应（课程, 知识点, 方面）的唯一组合；问题一半沿用文档说法、一半换一种问法。
+
+    返回 (文档 [(标题, 正文)], 问题 [(问题, 相关文档标题)])，相同种子输出完全一致。
+    """
+    rng = random.Random(seed)
+    if language == "zh":
+        subjects, concepts, aspects, fillers = _ZH_SUBJECTS, _ZH_CONCEPTS, _ZH_ASPECTS, _ZH_FILLERS
+    else:
+        subjects, concepts, aspects, fillers = _EN_SUBJECTS, _EN_CONCEPTS, _EN_ASPECTS, _EN_FILLERS
+    combos = [(s, c, a) for s in subjects for c in concepts for a in range(len(aspects))]
+    rng.shuffle(combos)
+    combos = combos[:n_docs]
+
+    docs: List[Tuple[str, str]] = []
+    questions: List[Tuple[str, str]] = []
+    for subject, concept, aspect_idx in combos:
+        aspect, paraphrase = aspects[aspect_idx]
+        other = rng.choice([c for c in concepts if c != concept])
+        padding = rng.sample(fillers, rng.randint(1, len(fillers)))
+        if language == "zh":
+            title = f"{subject}·{concept}·{aspect}"
+            body = [f"{subject}课程中，{concept}的{aspect}如下。"]
+            body.append(f"理解{concept}的{aspect}时，可以与{other}对照，二者的适用条件并不相同。")
+            body += padding
+            body.append(f"总结：掌握{concept}的{aspect}是学好{subject}的关键之一。")
+            text = "".join(body)
+            question = f"{subject}里{concept}的{aspect}？" if rng.random() < 0.5 else f"{subject}中的{concept}{paraphrase}？"
+        else:
+            title = f"{subject} / {concept} / {aspect}"
+            body = [f"In {subject}, the {aspect} of {concept} is summarised below."]
+            body.append(f"When studying the {aspect} of {concept}, compare it with {other}; they apply in different settings.")
+            body += padding
+            body.append(f"In short, the {aspect} of {concept} is one of the keys to {subject}.")
+            text = " ".join(body)
+            question = (
+                f"What is the {aspect} of {concept} in {subject}?"
+                if rng.random() < 0.5
+                else f"{concept} in {subject}: {paraphrase}?"
+            )
+        docs.append((title, text))
+        questions.append((question, title))
+
+    rng.shuffle(questions)
+    return docs, questions[:MAX_QUESTIONS]
+
+
+def fixture_corpus() -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+    return list(FIXTURE_DOCS), list(FIXTURE_QUESTIONS)
+
+
+@contextmanager
+def _scratch_vector_index():
+    """向量索引写到临时目录，结束后恢复正式实例；产出该目录"""
+    original = ai_workflow.kb_vector_index
+    with tempfile.TemporaryDirectory(prefix="kb_bench_") as root:
+        ai_workflow.kb_vector_index = KnowledgeBaseVectorIndex(root, original.backend_name)
+        try:
+            yield root
+        finally:
+            ai_workflow.kb_vector_index = original
+
+
+def _dir_size_mb(root: str) -> float:
+    total = sum(os.path.getsize(os.path.join(root, name)) for name in os.listdir(root))
+    return total / (1024 * 1024)
+
+
+def _peak_rss_mb() -> float:
+    # Linux 上 ru_maxrss 单位为 KB（整个进程的历史峰值）
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _percentile(values: Sequence[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def _ranked_titles(hits) -> List[str]:
+    # 同一文档的多个片段只按最靠前的一次计名次
+    return list(dict.fromkeys(chunk.document_title for chunk, _ in hits))
+
+
+async def _run_corpus(
+    docs: Sequence[Tuple[str, str]],
+    questions: Sequence[Tuple[str, str]],
+    chunk_size: int,
+    overlap: int,
+    vector_root: str,
+) -> Dict:
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    try:
+        async with SessionLocal() as db:
+            kb = AiKnowledgeBase(slug="benchmark", name="检索基准")
+            db.add(kb)
+            await db.flush()
+
+            chunk_time = index_time = 0.0
+            chunk_count = 0
+            for title, content in docs:
+                doc = AiKnowledgeBaseDocument(
+                    knowledge_base_id=kb.id,
+                    title=title,
+                    original_filename=f"{title}.txt",
+                    stored_filename="",
+                    url="",
+                    file_ext=".txt",
+                )
+                db.add(doc)
+                await db.flush()
+                start = time.perf_counter()
+                prepared = prepare_chunks(content, chunk_size=chunk_size, overlap=overlap)
+                chunk_time += time.perf_counter() - start
+                start = time.perf_counter()
+                chunk_count += await store_document_chunks(db, doc, prepared)
+                index_time += time.perf_counter() - start
+            await db.commit()
+            page_count = (await db.execute(text("PRAGMA page_count"))).scalar()
+            page_size = (await db.execute(text("PRAGMA page_size"))).scalar()
+
+            # 第一次检索要加载向量文件，单独记录，不计入延迟分位数
+            start = time.perf_counter()
+            await retrieve_top_chunks(db, [kb.id], questions[0][0], limit=max(RECALL_AT))
+            cold_ms = (time.perf_counter() - start) * 1000
+
+            latencies: List[float] = []
+            hits_at = {k: 0 for k in RECALL_AT}
+            reciprocal = 0.0
+            for question, relevant in questions:
+                start = time.perf_counter()
+                hits = await retrieve_top_chunks(db, [kb.id], question, limit=max(RECALL_AT))
+                latencies.append((time.perf_counter() - start) * 1000)
+                ranked = _ranked_titles(hits)
+                if relevant in ranked:
+                    rank = ranked.index(relevant) + 1
+                    reciprocal += 1.0 / rank
+                    for k in RECALL_AT:
+                        if rank <= k:
+                            hits_at[k] += 1
+    finally:
+        await engine.dispose()
+
+    n = len(questions)
+    metrics = {f"recall@{k}": round(hits_at[k] / n, 6) for k in RECALL_AT}
+    metrics.update(
+        {
+            "mrr": round(reciprocal / n, 6),
+            "questions": n,
+            "documents": len(docs),
+            "chunks": chunk_count,
+            "chunk_time_s": round(chunk_time, 4),
+            "index_time_s": round(index_time, 4),
+            "cold_query_ms": round(cold_ms, 3),
+            "latency_p50_ms": round(_percentile(latencies, 50), 3),
+            "latency_p95_ms": round(_percentile(latencies, 95), 3),
+            "index_db_mb": round(page_count * page_size / (1024 * 1024), 3),
+            "index_vector_mb": round(_dir_size_mb(vector_root), 3),
+            "peak_rss_mb": round(_peak_rss_mb(), 1),
+        }
+    )
+    return metrics
+
+
+def run_case(corpus: str, scale: str, seed: int, chunk_size: int, overlap: int) -> Dict:
+    if corpus == "fixture":
+        docs, questions = fixture_corpus()
+    else:
+        docs, questions = generate_corpus(corpus, SCALES[scale], seed)
+    # 问题分词带进程内缓存，每个用例从空缓存开始
+    tokenizer_module._segment_query_cached.cache_clear()
+    with _scratch_vector_index() as vector_root:
+        metrics = asyncio.run(_run_corpus(docs, questions, chunk_size, overlap, vector_root))
+    return {"corpus": corpus, "scale": scale, "seed": seed, **metrics}
+
+
+def summarize(runs: Sequence[Dict]) -> Dict[str, Dict]:
+    """按 语料/规模 对各种子取平均"""
+    summary: Dict[str, Dict] = {}
+    keys = QUALITY_KEYS + (
+        "chunk_time_s", "index_time_s", "latency_p50_ms", "latency_p95_ms", "index_db_mb", "index_vector_mb",
+    )
+    for case in dict.fromkeys(f"{r['corpus']}/{r['scale']}" for r in runs):
+        rows = [r for r in runs if f"{r['corpus']}/{r['scale']}" == case]
+        summary[case] = {k: round(float(np.mean([r[k] for r in rows])), 6) for k in keys}
+        summary[case]["runs"] = len(rows)
+    return summary
+
+
+def run_benchmark(
+    corpora: Sequence[str],
+    scales: Sequence[str],
+    seeds: Sequence[int],
+    chunk_size: int = ai_workflow._DEFAULT_CHUNK_SIZE,
+    overlap: int = ai_workflow._DEFAULT_CHUNK_OVERLAP,
+) -> Dict:
+    cases: List[Tuple[str, str, int]] = []
+    for corpus in corpora:
+        if corpus == "fixture":
+            # 手写样例与种子、规模无关，只跑一次
+            cases.append((corpus, "fixture", 0))
+            continue
+        cases += [(corpus, scale, seed) for scale in scales for seed in seeds]
+    # 分词词典首次加载需要数秒，先加载，不计入第一个用例
+    tokenizer_module.text_tokenizer.warm()
+    runs = [run_case(corpus, scale, seed, chunk_size, overlap) for corpus, scale, seed in cases]
+    return {
+        "benchmark": "kb_retrieval",
+        "python": sys.version.split()[0],
+        "tokenizer": tokenizer_module.TOKENIZER_VERSION,
+        "embedding_backend": ai_workflow.kb_vector_index.backend_name,
+        "chunk_size": chunk_size,
+        "overlap": overlap,
+        "runs": runs,
+        "summary": summarize(runs),
+    }
+
+
+def compare(baseline: Dict, current: Dict, time_tolerance: float = 0.2) -> List[str]:
+    """current 相对 baseline 的退化（按 语料/规模 对应）
+
+    检索质量（recall@k、MRR）是确定的，任何下降都算退化；耗时有噪声，只在超出 time_tolerance（比例）时报告。
+    """
+    regressions: List[str] = []
+    for case, cur in current.get("summary", {}).items():
+        base = baseline.get("summary", {}).get(case)
+        if base is None:
+            continue
+        for key in QUALITY_KEYS:
+            if cur[key] < base[key] - 1e-6:
+                regressions.append(f"{case}: {key} {base[key]} -> {cur[key]}")
+        for key in ("latency_p95_ms", "index_time_s"):
+            if base[key] > 0 and cur[key] > base[key] * (1 + time_tolerance):
+                regressions.append(f"{case}: {key} {base[key]} -> {cur[key]}")
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark knowledge-base retrieval quality and latency")
+    parser.add_argument("--corpora", nargs="+", choices=CORPORA, default=list(CORPORA))
+    parser.add_argument("--scales", nargs="+", choices=sorted(SCALES), default=["tiny", "small"])
+    parser.add_argument("--seeds", nargs="+", type=int, default=list(DEFAULT_SEEDS))
+    parser.add_argument("--chunk-size", type=int, default=ai_workflow._DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--overlap", type=int, default=ai_workflow._DEFAULT_CHUNK_OVERLAP)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="previous JSON report; exit 1 if any case regressed")
+    parser.add_argument("--time-tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.corpora, args.scales, args.seeds, args.chunk_size, args.overlap)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.time_tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
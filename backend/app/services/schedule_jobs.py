@@ -0,0 +1,211 @@
+"""
+排课任务管理器
+在线程池中运行遗传算法，避免阻塞事件循环；按代推送进度，支持查询结果与取消
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set
+
+from ..algorithms.schedule_genetic import GeneticSchedule
+from ..algorithms.schedule_islands import IslandSchedule
+from ..algorithms.schedule_local_search import run_post_optimizers
+from ..schemas.schedule import ScheduleJobStatus, ScheduleRequest, ScheduleResponse
+from .socket_manager import online_users, sio
+
+logger = logging.getLogger(__name__)
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATES = {JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED}
+
+# 已结束任务在内存中保留的时长（秒）
+_JOB_RETENTION_SECONDS = 3600
+
+
+class ScheduleCancelled(Exception):
+    """排课任务被取消（由进度回调在工作线程中抛出）"""
+
+
+def solve_schedule(
+    request: ScheduleRequest,
+    progress_callback: Optional[Callable[[int, dict], None]] = None,
+    warm_start_entries: Optional[List[dict]] = None,
+) -> ScheduleResponse:
+    """同步执行一次排课，供线程池调用"""
+    start_time = time.time()
+
+    ga = GeneticSchedule(request.teachers, request.courses, request.classrooms)
+    ga.progress_callback = progress_callback
+    if warm_start_entries is not None:
+        ga.apply_warm_start(warm_start_entries)
+    if request.island_count > 1:
+        best_schedule, stats = IslandSchedule(ga, request.island_count).evolve()
+    else:
+        best_schedule, stats = ga.evolve()
+
+    if best_schedule is None:
+        raise RuntimeError("Failed to generate schedule")
+
+    # 局部搜索：修复遗传算法残留的教师冲突，避免保存时触发 uq_teacher_time
+    if request.post_optimizers:
+        best_schedule, stats = run_post_optimizers(ga, best_schedule, request.post_optimizers)
+
+    formatted_schedule = ga.format_result(best_schedule)
+    entries = ga.schedule_to_entries(best_schedule)
+
+    logger.info("Scheduling took %.2f seconds", time.time() - start_time)
+
+    return ScheduleResponse(
+        schedule=formatted_schedule,
+        fitness=stats["fitness"],
+        utilization=stats["utilization"],
+        conflict_rate=stats["conflicts"],
+        entries=entries,
+    )
+
+
+class ScheduleJob:
+    def __init__(self, owner_user_id: int):
+        self.id = uuid.uuid4().hex
+        self.owner_user_id = owner_user_id
+        self.status = JOB_PENDING
+        self.generation = 0
+        self.fitness: Optional[float] = None
+        self.conflicts: Optional[int] = None
+        self.error: Optional[str] = None
+        self.result: Optional[ScheduleResponse] = None
+        self.created_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+        self.cancel_event = threading.Event()
+        self.subscribers: List[asyncio.Queue] = []
+        self.task: Optional[asyncio.Task] = None
+
+    def snapshot(self) -> ScheduleJobStatus:
+        return ScheduleJobStatus(
+            job_id=self.id,
+            status=self.status,
+            generation=self.generation,
+            fitness=self.fitness,
+            conflicts=self.conflicts,
+            error=self.error,
+            result=self.result if self.status == JOB_COMPLETED else None,
+        )
+
+    def event(self, kind: str) -> dict:
+        data = self.snapshot().model_dump(exclude={"result"})
+        data["type"] = kind
+        return data
+
+
+class ScheduleJobManager:
+    def __init__(self, max_workers: int = 2):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="schedule-ga")
+        self.jobs: Dict[str, ScheduleJob] = {}
+        # 事件循环只弱引用任务，推送任务需在这里持有直到完成
+        self._emits: Set[asyncio.Task] = set()
+
+    async def solve(self, request: ScheduleRequest, warm_start_entries: Optional[List[dict]] = None) -> ScheduleResponse:
+        """在线程池中同步求解（不登记任务），用于兼容原有 /generate 接口"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, solve_schedule, request, None, warm_start_entries)
+
+    def submit(
+        self,
+        request: ScheduleRequest,
+        owner_user_id: int,
+        warm_start_entries: Optional[List[dict]] = None,
+    ) -> ScheduleJob:
+        self._prune()
+        job = ScheduleJob(owner_user_id)
+        self.jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job, request, warm_start_entries))
+        return job
+
+    def get(self, job_id: str) -> Optional[ScheduleJob]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job: ScheduleJob) -> None:
+        job.cancel_event.set()
+
+    def subscribe(self, job: ScheduleJob) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        job.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, job: ScheduleJob, queue: asyncio.Queue) -> None:
+        if queue in job.subscribers:
+            job.subscribers.remove(queue)
+
+    async def _run(self, job: ScheduleJob, request: ScheduleRequest, warm_start_entries: Optional[List[dict]]) -> None:
+        loop = asyncio.get_running_loop()
+
+        def on_progress(generation: int, best_stats: dict) -> None:
+            # 运行在工作线程：检查取消标记，并把进度投递回事件循环
+            if job.cancel_event.is_set():
+                raise ScheduleCancelled()
+            loop.call_soon_threadsafe(self._on_progress, job, generation, dict(best_stats))
+
+        def run() -> ScheduleResponse:
+            if job.cancel_event.is_set():
+                raise ScheduleCancelled()
+            loop.call_soon_threadsafe(self._set_running, job)
+            return solve_schedule(request, on_progress, warm_start_entries)
+
+        try:
+            job.result = await loop.run_in_executor(self.executor, run)
+            job.fitness = job.result.fitness
+            job.conflicts = int(job.result.conflict_rate)
+            job.status = JOB_COMPLETED
+        except ScheduleCancelled:
+            job.status = JOB_CANCELLED
+        except Exception as exc:
+            logger.exception("Schedule job %s failed", job.id)
+            job.status = JOB_FAILED
+            job.error = str(exc) or type(exc).__name__
+        job.finished_at = datetime.now()
+        self._publish(job, job.event(job.status))
+
+    def _set_running(self, job: ScheduleJob) -> None:
+        if job.status == JOB_PENDING:
+            job.status = JOB_RUNNING
+
+    def _on_progress(self, job: ScheduleJob, generation: int, best_stats: dict) -> None:
+        if job.status in FINISHED_STATES:
+            return
+        job.generation = generation
+        job.fitness = best_stats.get("fitness")
+        job.conflicts = best_stats.get("conflicts")
+        self._publish(job, job.event("progress"))
+
+    def _publish(self, job: ScheduleJob, event: dict) -> None:
+        for queue in list(job.subscribers):
+            queue.put_nowait(event)
+        # Socket.IO 推送给提交任务的管理员
+        if job.owner_user_id in online_users:
+            task = asyncio.create_task(self._emit(online_users[job.owner_user_id], event))
+            self._emits.add(task)
+            task.add_done_callback(self._emits.discard)
+
+    async def _emit(self, sid: str, event: dict) -> None:
+        try:
+            await sio.emit("schedule_job_progress", event, to=sid)
+        except Exception:
+            logger.warning("Failed to push schedule progress for job %s", event.get("job_id"))
+
+    def _prune(self) -> None:
+        now = datetime.now()
+        for job_id, job in list(self.jobs.items()):
+            if job.finished_at and (now - job.finished_at).total_seconds() > _JOB_RETENTION_SECONDS:
+                del self.jobs[job_id]
+
+
+schedule_job_manager = ScheduleJobManager(max_workers=int(os.getenv("SCHEDULE_JOB_WORKERS", 2)))
@@ -0,0 +1,282 @@
+"""
+敏感词过滤
+管理端维护的词表编译为 Aho–Corasick 自动机：问题、模型流式输出、聊天消息与知识库抽取文本都只线性扫描一遍，
+不再逐次分词后查表。流式输出按块送入 StreamMasker，自动机状态跨块保留，跨块的敏感词同样能被替换。
+词表保存在 ai_feature_settings（feature = sensitive_words），管理端修改后立即重建；
+多进程部署时其他进程最迟在 ttl_seconds 后从数据库重新加载，无需重启。
+匹配忽略大小写与全角/半角差异。
+"""
+import json
+import logging
+import os
+import time
+import unicodedata
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.ai_config import AiFeatureSetting
+
+logger = logging.getLogger(__name__)
+
+SENSITIVE_WORDS_FEATURE = "sensitive_words"
+DEFAULT_SENSITIVE_WORDS = ["暴力", "色情", "赌博"]
+MAX_WORD_LENGTH = 50
+MASK_CHAR = "*"
+
+
+@lru_cache(maxsize=8192)
+def _fold(ch: str) -> str:
+    # 逐字符归一化，保证折叠后与原文位置一一对应
+    folded = unicodedata.normalize("NFKC", ch).lower()
+    return folded if len(folded) == 1 else ch
+
+
+def _fold_text(text: str) -> str:
+    return "".join(_fold(ch) for ch in text)
+
+
+def normalize_words(words: Iterable[str]) -> List[str]:
+    """去掉首尾空白、空词与重复词（按折叠后的形式判重），保持原顺序"""
+    result: List[str] = []
+    seen = set()
+    for word in words or []:
+        word = str(word or "").strip()[:MAX_WORD_LENGTH]
+        key = _fold_text(word)
+        if not word or key in seen:
+            continue
+        seen.add(key)
+        result.append(word)
+    return result
+
+
+class AhoCorasick:
+    """多模式匹配自动机；构建 O(词表总长)，扫描 O(文本长度)"""
+
+    def __init__(self, words: Iterable[str]):
+        self.words: Tuple[str, ...] = tuple(normalize_words(words))
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._depth: List[int] = [0]
+        # 在该状态结束的最长敏感词长度（含失败链上的后缀词），0 表示没有
+        self._out: List[int] = [0]
+        for word in self.words:
+            self._insert(_fold_text(word))
+        self._link()
+
+    def _insert(self, word: str) -> None:
+        state = 0
+        for ch in word:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._depth.append(self._depth[state] + 1)
+                self._out.append(0)
+                self._goto[state][ch] = nxt
+            state = nxt
+        self._out[state] = len(word)
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = max(self._out[nxt], self._out[self._fail[nxt]])
+                queue.append(nxt)
+
+    def step(self, state: int, ch: str) -> int:
+        goto = self._goto
+        while True:
+            nxt = goto[state].get(ch)
+            if nxt is not None:
+                return nxt
+            if state == 0:
+                return 0
+            state = self._fail[state]
+
+    def spans(self, text: str) -> List[Tuple[int, int]]:
+        """每个结束位置上最长的命中区间 [start, end)"""
+        result: List[Tuple[int, int]] = []
+        if not self.words or not text:
+            return result
+        state = 0
+        for i, ch in enumerate(text):
+            state = self.step(state, _fold(ch))
+            length = self._out[state]
+            if length:
+                result.append((i + 1 - length, i + 1))
+        return result
+
+    def contains(self, text: str) -> bool:
+        if not self.words or not text:
+            return False
+        state = 0
+        for ch in text:
+            state = self.step(state, _fold(ch))
+            if self._out[state]:
+                return True
+        return False
+
+    def find(self, text: str) -> List[str]:
+        """命中的敏感词原文（去重，按出现顺序）"""
+        return normalize_words(text[start:end] for start, end in self.spans(text))
+
+    def mask(self, text: str, mask_char: str = MASK_CHAR) -> str:
+        if not self.words or not text:
+            return text
+        masker = StreamMasker(self, mask_char)
+        return masker.feed(text) + masker.flush()
+
+
+class StreamMasker:
+    """流式文本逐块脱敏
+
+    自动机状态跨块保留；末尾可能是敏感词前缀的字符（长度即当前状态深度）先扣留，
+    等下一块到来再决定是否替换，因此任何命中都落在“扣留部分 + 新块”之内。
+    """
+
+    def __init__(self, automaton: AhoCorasick, mask_char: str = MASK_CHAR):
+        self.automaton = automaton
+        self.mask_char = mask_char
+        self.state = 0
+        self.pending: List[str] = []
+        self.hits = 0
+
+    def feed(self, chunk: str) -> str:
+        """送入一块文本，返回可以安全输出的部分"""
+        if not chunk:
+            return ""
+        automaton = self.automaton
+        if not automaton.words:
+            return chunk
+        buffer = self.pending + list(chunk)
+        base = len(self.pending)
+        state = self.state
+        for i, ch in enumerate(chunk):
+            state = automaton.step(state, _fold(ch))
+            length = automaton._out[state]
+            if length:
+                end = base + i + 1
+                for j in range(end - length, end):
+                    buffer[j] = self.mask_char
+                self.hits += 1
+        self.state = state
+        cut = len(buffer) - automaton._depth[state]
+        self.pending = buffer[cut:]
+        return "".join(buffer[:cut])
+
+    def flush(self) -> str:
+        """流结束（或插入其他事件）时输出扣留的尾部"""
+        tail = "".join(self.pending)
+        self.pending = []
+        self.state = 0
+        return tail
+
+
+@lru_cache(maxsize=4)
+def compile_words(words: Tuple[str, ...]) -> AhoCorasick:
+    """按词表编译自动机并缓存（知识库入库的工作进程拿不到主进程的实例，传词表后就地编译）"""
+    return AhoCorasick(words)
+
+
+def _parse_words(settings_json: Optional[str]) -> Optional[List[str]]:
+    try:
+        data = json.loads(settings_json or "{}")
+    except Exception:
+        return None
+    words = data.get("words") if isinstance(data, dict) else None
+    return normalize_words(words) if isinstance(words, list) else None
+
+
+class SensitiveFilter:
+    def __init__(self, words: Sequence[str] = DEFAULT_SENSITIVE_WORDS, ttl_seconds: float = 30.0):
+        self.ttl_seconds = ttl_seconds
+        self.version = 0
+        self.reloads = 0
+        self._automaton = AhoCorasick(words)
+        self._checked_at: Optional[float] = None
+        self._bind = None
+
+    @property
+    def words(self) -> Tuple[str, ...]:
+        return self._automaton.words
+
+    @property
+    def automaton(self) -> AhoCorasick:
+        return self._automaton
+
+    def load(self, words: Iterable[str]) -> None:
+        """重建自动机并整体替换；进行中的流继续使用旧自动机直到结束"""
+        automaton = AhoCorasick(words)
+        if automaton.words == self._automaton.words:
+            return
+        self._automaton = automaton
+        self.version += 1
+        self.reloads += 1
+
+    def contains(self, text: str) -> bool:
+        return self._automaton.contains(text)
+
+    def find(self, text: str) -> List[str]:
+        return self._automaton.find(text)
+
+    def mask(self, text: str) -> str:
+        return self._automaton.mask(text)
+
+    def masker(self) -> StreamMasker:
+        return StreamMasker(self._automaton)
+
+    async def refresh(self, db: AsyncSession) -> None:
+        """距上次从数据库读取超过 ttl_seconds（或换了数据库）时重新读取词表；读取失败保留当前词表"""
+        bind = db.get_bind()
+        if self._checked_at is not None and self._bind is bind and time.monotonic() - self._checked_at < self.ttl_seconds:
+            return
+        try:
+            row = (
+                await db.execute(select(AiFeatureSetting).where(AiFeatureSetting.feature == SENSITIVE_WORDS_FEATURE))
+            ).scalars().first()
+        except Exception:
+            logger.warning("Failed to load sensitive words, keeping the current list", exc_info=True)
+            return
+        self._checked_at = time.monotonic()
+        self._bind = bind
+        words = _parse_words(row.settings_json) if row is not None else None
+        self.load(DEFAULT_SENSITIVE_WORDS if words is None else words)
+
+    async def save(self, db: AsyncSession, words: Iterable[str]) -> List[str]:
+        """保存词表并立即生效，返回规范化后的词表"""
+        words = normalize_words(words)
+        row = (
+            await db.execute(select(AiFeatureSetting).where(AiFeatureSetting.feature == SENSITIVE_WORDS_FEATURE))
+        ).scalars().first()
+        settings_json = json.dumps({"words": words}, ensure_ascii=False)
+        if row is None:
+            db.add(AiFeatureSetting(feature=SENSITIVE_WORDS_FEATURE, settings_json=settings_json))
+        else:
+            row.settings_json = settings_json
+        await db.commit()
+        self.load(words)
+        self._checked_at = time.monotonic()
+        self._bind = db.get_bind()
+        return words
+
+    def stats(self) -> dict:
+        return {
+            "words": len(self.words),
+            "states": len(self._automaton._goto),
+            "version": self.version,
+            "reloads": self.reloads,
+        }
+
+
+sensitive_filter = SensitiveFilter(ttl_seconds=float(os.getenv("SENSITIVE_WORDS_TTL", 30)))
@@ -149,6 +149,7 @@ async def send_message(sid, data):
     from ..database import AsyncSessionLocal
     from ..models.message import Message
     from ..models.user import User
+    from .sensitive_filter import sensitive_filter
     
     async with AsyncSessionLocal() as db:
         user_stmt = select(User).where(User.id == from_id)
@@ -158,6 +159,11 @@ async def send_message(sid, data):
         if not from_user or not to_user:
             return {'error': '用户不存在'}
 
+        # 文本消息中的敏感词替换为 *
+        if msg_type == 'text':
+            await sensitive_filter.refresh(db)
+            content = sensitive_filter.mask(str(content))
+
         new_msg = Message(
             from_id=from_id,
             from_role=from_user.role,
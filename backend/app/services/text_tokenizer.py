@@ -0,0 +1,103 @@
+"""
+中文分词服务
+知识库片段与检索问题共用同一套切分规则：jieba 搜索引擎模式 + 教育领域词典 + 停用词。
+片段的分词结果在入库时写入 AiKnowledgeBaseChunk.tokens，检索时只需切分问题本身。
+"""
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+import jieba
+
+# 词典或规则变化时递增，已有索引会在下次启动时按新规则重建
+TOKENIZER_VERSION = "jieba-1"
+
+_MAX_TERM_LENGTH = 64
+_TERM_RE = re.compile(r"^[a-z0-9\u4e00-\u9fff][a-z0-9_.+#\-\u4e00-\u9fff]*$")
+
+# 教育领域词典：避免课程、教务术语被切碎
+EDU_TERMS = (
+    "教务处", "教务系统", "选课", "退课", "补选", "学分", "学分绩点", "绩点", "平均绩点",
+    "补考", "重修", "缓考", "免修", "期中考试", "期末考试", "平时成绩", "总评成绩", "成绩单",
+    "培养方案", "教学大纲", "教学日历", "教学计划", "课程表", "排课", "调课", "停课", "课时", "学时",
+    "必修课", "选修课", "公选课", "通识课", "专业课", "实验课", "实践课", "课程设计", "课程思政",
+    "学籍", "休学", "复学", "退学", "转专业", "辅修", "双学位", "学位证", "毕业证",
+    "毕业设计", "毕业论文", "开题报告", "中期检查", "论文答辩", "查重", "指导教师",
+    "辅导员", "班主任", "任课教师", "助教", "教案", "课件", "作业", "实验报告", "教学评价", "评教",
+    "考勤", "请假", "销假", "奖学金", "助学金", "四六级", "英语四级", "英语六级",
+    "数据结构", "操作系统", "计算机网络", "计算机组成原理", "数据库原理", "编译原理", "软件工程",
+    "高等数学", "线性代数", "概率论", "数理统计", "离散数学", "大学物理", "傅里叶变换", "拉普拉斯变换",
+    "机器学习", "深度学习", "神经网络", "人工智能", "大数据", "云计算", "网络安全",
+)
+
+STOP_WORDS = frozenset(
+    """
+    的 了 和 是 在 就 都 而 及 与 着 或 之 其 中 等 上 下 也 对 为 以 于 把 被 从 到 向 给 让 由
+    这 那 这个 那个 这些 那些 这样 那样 有 没有 还 又 再 很 更 最 已 已经 将 会 能 可 可以 要 应 应该
+    我 你 他 她 它 我们 你们 他们 她们 它们 自己 什么 怎么 怎样 如何 为什么 哪 哪些 哪里 多少 几
+    吗 呢 吧 啊 呀 哦 嗯 请 请问 一下 一个 一些 一种 如果 因为 所以 但是 但 然后 以及 并且 或者
+    a an the of to and or is are was were be been in on at for with by as from this that it its
+    what how why which who do does did can could will would should please
+    """.split()
+)
+
+
+class TextTokenizer:
+    """jieba 分词封装：独立词典实例（不影响全局 jieba），首次使用时加载"""
+
+    def __init__(self, user_dict_path: Optional[str] = None, extra_terms: Sequence[str] = EDU_TERMS):
+        self.user_dict_path = user_dict_path
+        self.extra_terms = tuple(extra_terms)
+        self._jieba: Optional[jieba.Tokenizer] = None
+        self._lock = threading.Lock()
+
+    def _engine(self) -> jieba.Tokenizer:
+        if self._jieba is None:
+            with self._lock:
+                if self._jieba is None:
+                    engine = jieba.Tokenizer()
+                    engine.initialize()
+                    for term in self.extra_terms:
+                        engine.add_word(term, freq=20000)
+                    if self.user_dict_path and os.path.isfile(self.user_dict_path):
+                        engine.load_userdict(self.user_dict_path)
+                    self._jieba = engine
+        return self._jieba
+
+    def warm(self) -> None:
+        """提前加载词典（数秒），避免首个问题或首次入库承担加载耗时"""
+        self._engine()
+
+    def segment(self, text: str) -> List[str]:
+        """切分为检索词项（小写、去停用词与标点，保留重复以便统计词频）"""
+        if not text:
+            return []
+        terms: List[str] = []
+        for word in self._engine().cut_for_search(text.lower()):
+            word = word.strip()
+            if not word or word in STOP_WORDS or not _TERM_RE.match(word):
+                continue
+            terms.append(word[:_MAX_TERM_LENGTH])
+        return terms
+
+    def segment_query(self, text: str) -> List[str]:
+        """问题切分（去重、保序），重复问题命中缓存"""
+        return list(_segment_query_cached(self, (text or "").strip()))
+
+
+@lru_cache(maxsize=2048)
+def _segment_query_cached(tokenizer: TextTokenizer, text: str) -> tuple:
+    return tuple(dict.fromkeys(tokenizer.segment(text)))
+
+
+def join_tokens(terms: Sequence[str]) -> str:
+    return " ".join(terms)
+
+
+def split_tokens(tokens: Optional[str]) -> List[str]:
+    return tokens.split() if tokens else []
+
+
+text_tokenizer = TextTokenizer(user_dict_path=os.getenv("AI_TOKENIZER_USER_DICT"))
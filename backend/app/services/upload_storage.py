@@ -0,0 +1,153 @@
+"""
+上传文件存储服务
+按块流式写入临时文件（在线程中完成，不阻塞事件循环，内存占用与文件大小无关），
+写入过程中累计大小并在超限时立即中止，同时计算 SHA-256；完成后 rename 到最终文件名。
+相同内容的文件通过硬链接共享同一份磁盘数据（<存储目录>/blobs/<sha256>），各自的文件名仍可独立删除。
+去重数据与临时文件都放在 static 之外的存储目录，公开目录里只有各自的文件名。
+请求体超过 max_request_bytes 时由 main 中的中间件按 Content-Length 提前拒绝，不再落盘；
+各类别的精确上限在拷贝时检查（未带 Content-Length 的分块请求仍会先由 Starlette 完整缓存）。
+"""
+import asyncio
+import hashlib
+import os
+import shutil
+import uuid
+from typing import Dict, Optional
+
+from fastapi import HTTPException, UploadFile
+
+from ..config import settings
+
+_MB = 1024 * 1024
+_COPY_CHUNK = _MB
+_BLOB_DIR = "blobs"
+_TMP_DIR = "tmp"
+# multipart 边界与其他表单字段的余量
+_FORM_OVERHEAD = _MB
+# 每保存这么多次清理一次已无引用的去重数据
+_PRUNE_EVERY = 200
+
+# 各类上传的默认大小上限（MB），可用环境变量 UPLOAD_MAX_MB_<类别大写> 覆盖
+DEFAULT_LIMITS_MB: Dict[str, int] = {
+    "kb": 100,
+    "leave": 10,
+    "service": 20,
+}
+
+
+class _TooLarge(Exception):
+    pass
+
+
+class UploadStorage:
+    def __init__(self, root: str, limits_mb: Optional[Dict[str, int]] = None):
+        self.root = root
+        limits = dict(DEFAULT_LIMITS_MB)
+        limits.update(limits_mb or {})
+        for category in list(limits):
+            override = os.getenv(f"UPLOAD_MAX_MB_{category.upper()}")
+            if override:
+                limits[category] = int(override)
+        self.limits_mb = limits
+        self._saves = 0
+
+    def limit_bytes(self, category: str) -> int:
+        return int(self.limits_mb.get(category, max(self.limits_mb.values()))) * _MB
+
+    def max_request_bytes(self) -> int:
+        """任何上传请求体的上限：最大类别上限加表单余量"""
+        return max(self.limits_mb.values()) * _MB + _FORM_OVERHEAD
+
+    async def save(self, file: UploadFile, directory: str, stored_filename: str, *, category: str, dedup: bool = True) -> dict:
+        """保存上传文件到 directory/stored_filename，返回 abs_path / file_size / sha256 / deduplicated"""
+        limit = self.limit_bytes(category)
+        # Starlette 已知大小时提前拒绝，省去一次拷贝
+        if file.size is not None and file.size > limit:
+            raise HTTPException(status_code=413, detail=f"文件过大，最大允许 {limit // _MB} MB")
+        os.makedirs(directory, exist_ok=True)
+        abs_path = os.path.join(directory, os.path.basename(stored_filename))
+        try:
+            meta = await asyncio.to_thread(self._store, file.file, abs_path, limit, dedup)
+        except _TooLarge:
+            raise HTTPException(status_code=413, detail=f"文件过大，最大允许 {limit // _MB} MB")
+        self._saves += 1
+        if dedup and self._saves % _PRUNE_EVERY == 0:
+            await asyncio.to_thread(self.prune_blobs)
+        return meta
+
+    def _store(self, source, abs_path: str, limit: int, dedup: bool) -> dict:
+        tmp_dir = os.path.join(self.root, _TMP_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            source.seek(0)
+            with open(tmp_path, "wb") as out:
+                while True:
+                    chunk = source.read(_COPY_CHUNK)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > limit:
+                        raise _TooLarge()
+                    digest.update(chunk)
+                    out.write(chunk)
+            sha256 = digest.hexdigest()
+            deduplicated = dedup and self._link_existing(sha256, abs_path)
+            if deduplicated:
+                os.remove(tmp_path)
+            else:
+                # 存储目录与上传目录不在同一文件系统时 rename 会失败，退回拷贝
+                shutil.move(tmp_path, abs_path)
+                if dedup:
+                    self._register_blob(sha256, abs_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        return {"abs_path": abs_path, "file_size": size, "sha256": sha256, "deduplicated": deduplicated}
+
+    def _blob_path(self, sha256: str) -> str:
+        return os.path.join(self.root, _BLOB_DIR, sha256)
+
+    def _link_existing(self, sha256: str, abs_path: str) -> bool:
+        blob = self._blob_path(sha256)
+        if not os.path.isfile(blob):
+            return False
+        try:
+            os.link(blob, abs_path)
+            return True
+        except OSError:
+            return False
+
+    def _register_blob(self, sha256: str, abs_path: str) -> None:
+        # 去重只是优化：文件系统不支持硬链接（或跨文件系统）时直接跳过
+        blob = self._blob_path(sha256)
+        try:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.link(abs_path, blob)
+        except OSError:
+            pass
+
+    def prune_blobs(self) -> int:
+        """删除已没有任何文件名引用的去重数据（硬链接数为 1）"""
+        removed = 0
+        blob_dir = os.path.join(self.root, _BLOB_DIR)
+        try:
+            entries = list(os.scandir(blob_dir))
+        except OSError:
+            return 0
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_nlink <= 1:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+upload_storage = UploadStorage(settings.UPLOAD_STORE_DIR)
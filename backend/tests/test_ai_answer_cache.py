@@ -0,0 +1,120 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app.database import Base
+from backend.app.models.ai_config import AiKnowledgeBase, AiKnowledgeBaseDocument, AiModelApi
+from backend.app.routers import ai_qa
+from backend.app.schemas.ai import QARequest
+from backend.app.services import ai_workflow
+from backend.app.services.ai_answer_cache import AnswerCache
+from backend.app.services.ai_workflow import delete_document_chunks, rebuild_document_chunks
+from backend.app.services.kb_vector_index import KnowledgeBaseVectorIndex
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path, monkeypatch):
+    monkeypatch.setattr(ai_workflow, "kb_vector_index", KnowledgeBaseVectorIndex(str(tmp_path / "kb_vectors")))
+    cache = AnswerCache(max_entries=16)
+    monkeypatch.setattr(ai_qa, "answer_cache", cache)
+    return cache
+
+
+class _BrokenRedis:
+    calls = 0
+
+    async def get(self, key):
+        self.calls += 1
+        raise ConnectionError("redis down")
+
+    async def set(self, key, value, ex=None):
+        self.calls += 1
+        raise ConnectionError("redis down")
+
+
+def test_key_normalization_lru_and_redis_fallback():
+    async def run():
+        redis = _BrokenRedis()
+        cache = AnswerCache(max_entries=2, redis_client=redis)
+        key = cache.make_key("请问 选课时间？", "db:1:qwen", [(3, 1)])
+        assert key == cache.make_key("请问 选课时间", "db:1:qwen", [(3, 1)])
+        assert key != cache.make_key("请问 选课时间", "db:1:qwen", [(3, 2)])
+        assert key != cache.make_key("请问 选课时间", "db:2:qwen", [(3, 1)])
+
+        # Redis 故障不影响本地缓存，且之后暂停访问 Redis
+        await cache.set(key, "第三周周一开放选课")
+        assert await cache.get(key) == "第三周周一开放选课"
+        assert await cache.get("missing") is None
+        assert redis.calls == 1
+
+        await cache.set("k2", "a")
+        await cache.set("k3", "b")
+        assert await cache.get(key) is None
+
+    asyncio.run(run())
+
+
+def _answers(body):
+    out = []
+    for block in body.split("\n\n"):
+        if block.startswith("data:"):
+            data = json.loads(block[5:])
+            if data.get("type") == "answer":
+                out.append(data["content"])
+    return "".join(out)
+
+
+async def _consume(response):
+    return "".join([chunk async for chunk in response.body_iterator])
+
+
+def test_stream_qa_replays_cached_answer_until_kb_changes(monkeypatch):
+    calls = []
+
+    async def fake_call_model_api(model, prompt):
+        calls.append(prompt)
+        yield ai_qa._make_sse_payload(f"第{len(calls)}次回答")
+
+    monkeypatch.setattr(ai_qa, "_call_model_api", fake_call_model_api)
+
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        try:
+            async with SessionLocal() as db:
+                db.add(AiModelApi(name="m", provider="dashscope_openai", model_name="qwen", endpoint="http://x", api_key="k"))
+                kb = AiKnowledgeBase(slug="course-9", name="课程知识库", course_id=9)
+                db.add(kb)
+                await db.flush()
+                doc = AiKnowledgeBaseDocument(
+                    knowledge_base_id=kb.id, title="讲义", original_filename="a.txt",
+                    stored_filename="", url="", file_ext=".txt",
+                )
+                db.add(doc)
+                await db.flush()
+                await rebuild_document_chunks(db, doc, "期末考试安排在第十八周。")
+                await db.commit()
+
+                request = QARequest(user_id="1", question="期末考试什么时候？", course_id=9)
+                first = _answers(await _consume(await ai_qa.stream_qa(request, db)))
+                second = _answers(await _consume(await ai_qa.stream_qa(request, db)))
+                assert first == second == "第1次回答"
+                assert len(calls) == 1
+
+                # 其他课程的同一问题不共享答案
+                other = QARequest(user_id="1", question="期末考试什么时候？", course_id=10)
+                assert _answers(await _consume(await ai_qa.stream_qa(other, db))) == "第2次回答"
+
+                # 文档变化后知识库版本递增，旧答案失效
+                await delete_document_chunks(db, doc.id)
+                await db.commit()
+                assert _answers(await _consume(await ai_qa.stream_qa(request, db))) == "第3次回答"
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
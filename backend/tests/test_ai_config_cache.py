@@ -0,0 +1,93 @@
+import asyncio
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app.database import Base
+from backend.app.models.ai_config import AiKnowledgeBase, AiModelApi, AiWorkflowApp
+from backend.app.routers import ai_qa
+from backend.app.services.ai_config_cache import AiConfigCache
+
+
+def _model(name, **kwargs):
+    fields = dict(provider="dashscope_openai", model_name="qwen", endpoint="http://x", api_key="k")
+    fields.update(kwargs)
+    return AiModelApi(name=name, **fields)
+
+
+def test_request_resolution_uses_snapshot_until_invalidated(monkeypatch):
+    cache = AiConfigCache(ttl_seconds=3600)
+    monkeypatch.setattr(ai_qa, "ai_config_cache", cache)
+
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        try:
+            async with SessionLocal() as db:
+                db.add_all([
+                    _model("默认", is_default=True),
+                    _model("课程专用"),
+                    _model("停用", enabled=False),
+                    AiKnowledgeBase(slug="course-5", name="课程5", course_id=5),
+                    AiKnowledgeBase(slug="course-5b", name="课程5补充", course_id=5),
+                    AiKnowledgeBase(slug="cs", name="客服"),
+                ])
+                await db.flush()
+                db.add(AiWorkflowApp(code="ca-5", type="course_assistant", name="课程助手", knowledge_base_id=3, model_api_id=2))
+                await db.commit()
+
+                queries = []
+
+                def count(*_args):
+                    queries.append(1)
+
+                event.listen(engine.sync_engine, "before_cursor_execute", count)
+                app = await ai_qa._load_workflow_app(db, "ca-5")
+                assert app.code == "ca-5"
+                loaded = len(queries)
+                assert (await ai_qa._resolve_model(db, None, app)).name == "课程专用"
+                assert (await ai_qa._resolve_model(db, "db:3", app)).name == "课程专用"
+                assert (await ai_qa._resolve_model(db, "db:1", None)).name == "默认"
+                assert await ai_qa._collect_kb_ids(db, app, 5) == [3, 1, 2]
+                # 首次加载之后的解析不再访问数据库
+                assert len(queries) == loaded
+
+                db.add(AiKnowledgeBase(slug="course-5c", name="课程5新增", course_id=5))
+                await db.commit()
+                assert await ai_qa._collect_kb_ids(db, None, 5) == [1, 2]
+                cache.invalidate()
+                assert await ai_qa._collect_kb_ids(db, None, 5) == [1, 2, 4]
+                assert cache.stats()["loads"] == 2
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_fallback_chain_order_from_snapshot(monkeypatch):
+    monkeypatch.setattr(ai_qa, "ai_config_cache", AiConfigCache())
+
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        try:
+            async with SessionLocal() as db:
+                db.add_all([
+                    _model("主", is_default=True),
+                    _model("低", priority=1),
+                    _model("高", priority=9),
+                    _model("不兜底", priority=-1),
+                    _model("未配置", priority=20, api_key=""),
+                ])
+                await db.commit()
+                primary = await ai_qa._resolve_model(db, None, None)
+                return [m.name for m in await ai_qa._resolve_fallback_models(db, primary)]
+        finally:
+            await engine.dispose()
+
+    assert asyncio.run(run()) == ["高", "低"]
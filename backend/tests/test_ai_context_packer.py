@@ -0,0 +1,70 @@
+from backend.app.models.ai_config import AiKnowledgeBaseChunk
+from backend.app.services.ai_context_packer import (
+    context_budget,
+    estimate_tokens,
+    merge_adjacent,
+    pack_context,
+    select_passages,
+)
+from backend.app.services.ai_workflow import split_text_into_chunks
+from backend.app.services.text_tokenizer import join_tokens, text_tokenizer
+
+_next_id = iter(range(1, 10000))
+
+
+def _chunk(content, document_id=None, seq=0):
+    return AiKnowledgeBaseChunk(
+        id=next(_next_id),
+        knowledge_base_id=1,
+        document_id=document_id,
+        seq=seq,
+        content=content,
+        tokens=join_tokens(text_tokenizer.segment(content)),
+    )
+
+
+def test_adjacent_chunks_merge_without_overlap():
+    text = "".join(f"第{i}条：学生每学期选课不得超过二十八学分，超出部分需要教务处审批。" for i in range(40))
+    pieces = split_text_into_chunks(text)
+    assert len(pieces) > 3
+    chunks = [(_chunk(p, document_id=7, seq=i), 1.0 - i * 0.01) for i, p in enumerate(pieces)]
+
+    passages = merge_adjacent(chunks)
+    assert len(passages) == 1
+    assert passages[0].text == text
+    assert passages[0].chunk_ids == [c.id for c, _ in chunks]
+
+    # 中间缺一块时分成两段
+    gapped = chunks[:2] + chunks[3:]
+    assert len(merge_adjacent(gapped)) == 2
+
+
+def test_near_duplicates_dropped_and_diverse_passage_preferred():
+    exam = "期末考试安排在第十八周，具体考场请在教务系统查询，缺考需要提前办理缓考手续。"
+    grade = "总评成绩由平时成绩百分之四十和期末考试成绩百分之六十组成。"
+    chunks = [
+        (_chunk(exam, document_id=1), 1.0),
+        (_chunk(exam + "请留意通知。", document_id=2), 0.95),
+        (_chunk(grade, document_id=3), 0.6),
+    ]
+    passages = pack_context(chunks, budget_tokens=1000)
+    assert [p.text for p in passages] == [exam, grade]
+
+
+def test_budget_limits_packed_tokens():
+    chunks = [(_chunk(f"第{i}章介绍了{topic}的基本概念与典型例题。" * 6, document_id=i), 1.0 - i * 0.1)
+              for i, topic in enumerate(["数据结构", "操作系统", "计算机网络", "编译原理"])]
+    passages = merge_adjacent(chunks)
+    one = passages[0].tokens
+    packed = select_passages(passages, budget_tokens=one * 2 + 1)
+    assert len(packed) == 2 and sum(p.tokens for p in packed) <= one * 2 + 1
+
+    # 单段超出预算时截断放入
+    truncated = select_passages(merge_adjacent(chunks[:1]), budget_tokens=10)
+    assert len(truncated) == 1 and estimate_tokens(truncated[0].text) <= 10
+
+
+def test_context_budget_respects_window_and_output():
+    assert context_budget(3072, 1024, "问题") == 3072 - 1024 - 64 - 2
+    assert context_budget(128000, 2048, "问题") == 3000
+    assert context_budget(1000, 2048, "问题") == 0
@@ -0,0 +1,61 @@
+import asyncio
+
+import httpx
+
+from backend.app.services.ai_http_clients import ProviderClientRegistry, model_client_key
+
+
+def _registry(**kwargs):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"auth": request.headers.get("authorization")})
+
+    return ProviderClientRegistry(transport_factory=lambda: httpx.MockTransport(handler), **kwargs)
+
+
+def test_client_is_reused_until_config_changes():
+    async def run():
+        registry = _registry(retire_grace_seconds=0)
+        try:
+            key = model_client_key(7)
+            timeout = httpx.Timeout(60)
+            first = registry.client(key, endpoint="https://a.example/v1", timeout=timeout, headers={"Authorization": "Bearer k1"})
+            assert registry.client(key, endpoint="https://a.example/v1", timeout=timeout, headers={"Authorization": "Bearer k1"}) is first
+
+            resp = await first.post("https://a.example/v1/chat/completions", json={})
+            assert resp.json() == {"auth": "Bearer k1"}
+            await first.post("https://a.example/v1/chat/completions", json={})
+            assert registry.stats()["clients"][0]["requests"] == 2
+
+            # 管理端修改了 API Key：换新客户端，旧客户端在宽限期后关闭
+            second = registry.client(key, endpoint="https://a.example/v1", timeout=timeout, headers={"Authorization": "Bearer k2"})
+            assert second is not first
+            assert registry.rebuilds == 1
+            await asyncio.sleep(0.01)
+            assert first.is_closed
+
+            registry.invalidate(key)
+            third = registry.client(key, endpoint="https://a.example/v1", timeout=timeout, headers={"Authorization": "Bearer k2"})
+            assert third is not second
+
+            await registry.aclose()
+            assert third.is_closed
+            assert registry.stats()["clients"] == []
+        finally:
+            await registry.aclose()
+
+    asyncio.run(run())
+
+
+def test_shutdown_closes_clients_still_in_grace_period():
+    async def run():
+        registry = _registry(retire_grace_seconds=300)
+        try:
+            old = registry.client("k", timeout=httpx.Timeout(30))
+            registry.client("k", timeout=httpx.Timeout(60))
+            assert registry.stats()["retiring"] == 1
+            await registry.aclose()
+            assert old.is_closed
+        finally:
+            await registry.aclose()
+
+    asyncio.run(run())
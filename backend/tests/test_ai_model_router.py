@@ -0,0 +1,158 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app.database import Base
+from backend.app.models.ai_config import AiModelApi
+from backend.app.routers import ai_qa
+from backend.app.schemas.ai import QARequest
+from backend.app.services.ai_answer_cache import AnswerCache
+from backend.app.services.ai_model_router import ModelRouter
+from backend.app.services.ai_model_scheduler import ModelSchedulerRegistry
+from backend.app.services.ai_single_flight import SingleFlight
+
+
+def _collect(router, candidates, attempt, can_hedge=lambda _t: True):
+    async def run():
+        return [
+            json.loads(c[5:])
+            async for c in router.stream(candidates, attempt, ai_qa._classify_chunk, can_hedge=can_hedge)
+        ]
+
+    return asyncio.run(run())
+
+
+def test_retryable_error_falls_back_but_client_error_does_not():
+    calls = []
+
+    def attempt(target, started):
+        async def gen():
+            started()
+            calls.append(target)
+            if target == "bad":
+                yield ai_qa._make_error_payload("上游 503", retryable=True)
+            elif target == "denied":
+                yield ai_qa._make_error_payload("上游 400", retryable=False)
+            else:
+                yield ai_qa._make_sse_payload(f"{target}-答案")
+
+        return gen()
+
+    router = ModelRouter()
+    events = _collect(router, [("a", "bad"), ("b", "good")], attempt)
+    assert events == [{"type": "answer", "content": "good-答案"}]
+    assert router.fallbacks == 1
+
+    calls.clear()
+    events = _collect(ModelRouter(), [("a", "denied"), ("b", "good")], attempt)
+    assert calls == ["denied"]
+    assert events == [{"type": "error", "content": "上游 400", "retryable": False}]
+
+
+def test_slow_primary_is_hedged_and_loser_cancelled():
+    cancelled = asyncio.Event()
+
+    def attempt(target, started):
+        async def gen():
+            started()
+            if target == "slow":
+                try:
+                    await asyncio.sleep(5)
+                    yield ai_qa._make_sse_payload("慢")
+                finally:
+                    cancelled.set()
+            else:
+                yield ai_qa._make_sse_payload("快")
+                yield ai_qa._make_sse_payload("答")
+
+        return gen()
+
+    router = ModelRouter(hedge=True, hedge_after_seconds=0.05)
+    events = _collect(router, [("a", "slow"), ("b", "fast")], attempt)
+    assert "".join(e["content"] for e in events) == "快答"
+    assert router.hedges == 1 and router.hedge_wins == 1
+    assert cancelled.is_set()
+
+    # 备用模型没有空闲名额时不发起对冲，继续等主请求
+    router = ModelRouter(hedge=True, hedge_after_seconds=0.01)
+
+    def slow_primary(target, started):
+        async def gen():
+            started()
+            await asyncio.sleep(0.05)
+            yield ai_qa._make_sse_payload(target)
+
+        return gen()
+
+    events = _collect(router, [("a", "primary"), ("b", "backup")], slow_primary, can_hedge=lambda _t: False)
+    assert events == [{"type": "answer", "content": "primary"}]
+    assert router.hedges == 0
+
+
+def test_queue_wait_is_not_counted_as_model_latency():
+    def queued_primary(target, started):
+        async def gen():
+            # 排队等待调度器放行：不触发对冲，也不计入首字延迟
+            yield ai_qa._make_sse_payload("排队中", "thinking")
+            await asyncio.sleep(0.2)
+            started()
+            yield ai_qa._make_sse_payload(target)
+
+        return gen()
+
+    router = ModelRouter(hedge=True, hedge_after_seconds=0.05)
+    events = _collect(router, [("a", "primary"), ("b", "backup")], queued_primary)
+    assert [e["content"] for e in events] == ["排队中", "primary"]
+    assert router.hedges == 0
+    assert router.health("a").latency < 0.1
+
+
+def test_unhealthy_model_is_moved_to_the_back():
+    router = ModelRouter()
+    for _ in range(4):
+        router.health("a").record_failure()
+    router.health("b").record_success(0.5)
+    assert [key for key, _ in router.order([("a", 1), ("b", 2)])] == ["b", "a"]
+    assert router.stats()["models"]["a"]["healthy"] is False
+
+
+def test_stream_qa_falls_back_to_next_priority_model(monkeypatch):
+    calls = []
+
+    async def fake_call_model_api(model, prompt):
+        calls.append(model.name)
+        if model.name == "primary":
+            yield ai_qa._make_error_payload("AI 请求异常: 连接超时", retryable=True)
+        else:
+            yield ai_qa._make_sse_payload(f"{model.name} 的答案")
+
+    monkeypatch.setattr(ai_qa, "_call_model_api", fake_call_model_api)
+    monkeypatch.setattr(ai_qa, "answer_cache", AnswerCache(max_entries=16))
+    monkeypatch.setattr(ai_qa, "answer_flights", SingleFlight())
+    monkeypatch.setattr(ai_qa, "model_schedulers", ModelSchedulerRegistry())
+    monkeypatch.setattr(ai_qa, "model_router", ModelRouter())
+
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        try:
+            async with SessionLocal() as db:
+                common = dict(provider="dashscope_openai", model_name="qwen", endpoint="http://x", api_key="k")
+                db.add(AiModelApi(name="primary", is_default=True, **common))
+                db.add(AiModelApi(name="backup", priority=5, **common))
+                db.add(AiModelApi(name="excluded", priority=-1, **common))
+                db.add(AiModelApi(name="disabled", priority=10, enabled=False, **common))
+                await db.commit()
+                response = await ai_qa.stream_qa(QARequest(user_id="s1", question="问题"), db)
+                return [json.loads(c[5:]) async for c in response.body_iterator]
+        finally:
+            await engine.dispose()
+
+    events = asyncio.run(run())
+    assert calls == ["primary", "backup"]
+    assert [e for e in events if e["type"] != "thinking"] == [{"type": "answer", "content": "backup 的答案"}]
@@ -0,0 +1,116 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app.database import Base
+from backend.app.models.ai_config import AiModelApi
+from backend.app.routers import ai_qa
+from backend.app.schemas.ai import QARequest
+from backend.app.services.ai_answer_cache import AnswerCache
+from backend.app.services.ai_http_clients import model_client_key
+from backend.app.services.ai_model_scheduler import ModelOverloaded, ModelScheduler, ModelSchedulerRegistry, TokenBucket
+
+
+def test_round_robin_across_features_then_users():
+    async def run():
+        scheduler = ModelScheduler(max_concurrency=1, max_queue=10)
+        running = scheduler.enqueue("t1", "lesson_plan")
+        assert running.granted
+
+        class_burst = [scheduler.enqueue("s1", "course_assistant") for _ in range(3)]
+        other_student = scheduler.enqueue("s2", "course_assistant")
+        teacher = scheduler.enqueue("t1", "lesson_plan")
+        assert scheduler.position(teacher) == 1
+        assert scheduler.position(other_student) == 2
+
+        granted = []
+        current = running
+        for _ in range(5):
+            current.release()
+            current = next(t for t in class_burst + [other_student, teacher] if t.granted and not t.released)
+            granted.append(current)
+        assert granted == [class_burst[0], teacher, other_student, class_burst[1], class_burst[2]]
+        current.release()
+        assert scheduler.in_flight == 0 and scheduler.waiting == 0
+
+    asyncio.run(run())
+
+
+def test_full_queue_is_rejected_and_cancelled_waiters_leave():
+    async def run():
+        scheduler = ModelScheduler(max_concurrency=1, max_queue=1)
+        running = scheduler.enqueue("a", "customer_service")
+        waiter = scheduler.enqueue("b", "customer_service")
+        with pytest.raises(ModelOverloaded) as exc:
+            scheduler.enqueue("c", "customer_service")
+        assert exc.value.retry_after >= 1
+
+        waiter.release()
+        assert scheduler.waiting == 0
+        running.release()
+        assert scheduler.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate_per_minute=6)
+    assert bucket.try_take()
+    assert not bucket.try_take()
+    assert 0 < bucket.seconds_until_token() <= 10
+
+
+@pytest.fixture
+def model_db():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with SessionLocal() as db:
+            db.add(AiModelApi(name="m", provider="dashscope_openai", model_name="qwen", endpoint="http://x", api_key="k", max_concurrency=1))
+            await db.commit()
+
+    asyncio.run(setup())
+    yield SessionLocal
+    asyncio.run(engine.dispose())
+
+
+def test_stream_qa_reports_queue_position_and_429(monkeypatch, model_db):
+    async def fake_call_model_api(model, prompt):
+        yield ai_qa._make_sse_payload("答案")
+
+    monkeypatch.setattr(ai_qa, "_call_model_api", fake_call_model_api)
+    monkeypatch.setattr(ai_qa, "answer_cache", AnswerCache(max_entries=16))
+    registry = ModelSchedulerRegistry(max_queue=1)
+    monkeypatch.setattr(ai_qa, "model_schedulers", registry)
+
+    async def run():
+        async with model_db() as db:
+            model = (await db.get(AiModelApi, 1))
+            scheduler = registry.get(model_client_key(model.id), 1, 0)
+            busy = scheduler.enqueue("teacher", "lesson_plan")
+
+            response = await ai_qa.stream_qa(QARequest(user_id="s1", question="问题一"), db)
+            body = response.body_iterator
+            events = []
+            while not any(e["type"] == "thinking" and "排队" in e["content"] for e in events):
+                events.append(json.loads((await body.__anext__())[5:]))
+
+            # 队列已满（1 个等待中）：新问题直接 429
+            with pytest.raises(HTTPException) as exc:
+                await ai_qa.stream_qa(QARequest(user_id="s2", question="问题二"), db)
+            assert exc.value.status_code == 429
+            assert int(exc.value.headers["Retry-After"]) >= 1
+
+            busy.release()
+            events.extend([json.loads(c[5:]) async for c in body])
+            assert events[-1] == {"type": "answer", "content": "答案"}
+            assert scheduler.in_flight == 0
+
+    asyncio.run(run())
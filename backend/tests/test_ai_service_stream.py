@@ -0,0 +1,93 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from backend.app.services import ai_service
+from backend.app.services.ai_service import QwenClient, iterate_in_thread
+
+
+def _response(text):
+    return SimpleNamespace(status_code=200, output=SimpleNamespace(choices=[{"message": {"content": text}}]))
+
+
+def test_slow_dashscope_stream_does_not_block_event_loop(monkeypatch):
+    def slow_call(**kwargs):
+        for piece in ("选课", "在第三周"):
+            time.sleep(0.2)
+            yield _response(piece)
+
+    monkeypatch.setattr(ai_service.dashscope.Generation, "call", slow_call)
+    client = QwenClient()
+    client.redis = None
+
+    async def run():
+        ticks = 0
+
+        async def heartbeat():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        beat = asyncio.create_task(heartbeat())
+        chunks = [c async for c in client.call_stream_api("1", "什么时候选课", history_flag=False)]
+        beat.cancel()
+        return chunks, ticks
+
+    chunks, ticks = asyncio.run(run())
+    assert [json.loads(c[5:])["content"] for c in chunks] == ["选课", "在第三周"]
+    # 0.4s of upstream latency; the loop kept running the whole time
+    assert ticks >= 20
+
+
+def test_bridge_stops_worker_when_consumer_leaves():
+    produced = []
+    finished = threading.Event()
+
+    def numbers():
+        try:
+            for i in range(1000):
+                produced.append(i)
+                yield i
+        finally:
+            finished.set()
+
+    async def run():
+        executor = ThreadPoolExecutor(max_workers=1)
+        stream = iterate_in_thread(numbers, executor=executor, queue_size=2)
+        async for item in stream:
+            if item == 3:
+                break
+        await stream.aclose()
+        await asyncio.to_thread(finished.wait, 2)
+        executor.shutdown(wait=True)
+
+    asyncio.run(run())
+    assert finished.is_set()
+    # bounded queue: the worker never ran far ahead of the consumer
+    assert len(produced) < 10
+
+
+def test_failure_before_first_response_is_retried_once(monkeypatch):
+    calls = []
+
+    def flaky_call(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise ConnectionError("reset by peer")
+        yield _response("补考")
+        yield _response("在第二周")
+
+    monkeypatch.setattr(ai_service.dashscope.Generation, "call", flaky_call)
+    client = QwenClient()
+    client.redis = None
+
+    async def run():
+        return [c async for c in client.call_stream_api("1", "补考时间", history_flag=False)]
+
+    chunks = asyncio.run(run())
+    assert len(calls) == 2
+    assert [json.loads(c[5:])["content"] for c in chunks] == ["补考", "在第二周"]
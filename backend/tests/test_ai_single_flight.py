@@ -0,0 +1,147 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app.database import Base
+from backend.app.models.ai_config import AiModelApi
+from backend.app.routers import ai_qa
+from backend.app.schemas.ai import QARequest
+from backend.app.services.ai_answer_cache import AnswerCache
+from backend.app.services.ai_single_flight import SingleFlight
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(monkeypatch):
+    monkeypatch.setattr(ai_qa, "answer_cache", AnswerCache(max_entries=16))
+    flights = SingleFlight()
+    monkeypatch.setattr(ai_qa, "answer_flights", flights)
+    return flights
+
+
+def test_late_subscriber_replays_from_start_and_abandoned_flight_is_cancelled():
+    async def run():
+        flights = SingleFlight()
+        release = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def source():
+            yield "a"
+            await release.wait()
+            yield "b"
+
+        first = flights.stream("k", source)
+        assert await first.__anext__() == "a"
+        second = flights.stream("k", source)
+        release.set()
+        assert [c async for c in first] == ["b"]
+        assert [c async for c in second] == ["a", "b"]
+        assert flights.stats()["started"] == 1 and flights.stats()["coalesced"] == 1
+        assert not flights.in_flight("k")
+
+        async def endless():
+            try:
+                while True:
+                    yield "x"
+                    await asyncio.sleep(0.01)
+            finally:
+                cancelled.set()
+
+        only = flights.stream("e", endless)
+        assert await only.__anext__() == "x"
+        await only.aclose()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        assert not flights.in_flight("e")
+
+    asyncio.run(run())
+
+
+def test_identical_concurrent_questions_share_one_upstream_call(monkeypatch, isolated_state):
+    calls = []
+
+    async def fake_call_model_api(model, prompt):
+        calls.append(prompt)
+        await asyncio.sleep(0.05)
+        for piece in ("第十八周", "考试"):
+            yield ai_qa._make_sse_payload(piece)
+
+    monkeypatch.setattr(ai_qa, "_call_model_api", fake_call_model_api)
+
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        try:
+            async with SessionLocal() as db:
+                db.add(AiModelApi(name="m", provider="dashscope_openai", model_name="qwen", endpoint="http://x", api_key="k"))
+                await db.commit()
+                responses = [
+                    await ai_qa.stream_qa(QARequest(user_id=str(i), question="期末考试什么时候？"), db)
+                    for i in range(5)
+                ]
+
+                async def consume(response):
+                    return [json.loads(c[5:]) async for c in response.body_iterator]
+
+                return await asyncio.gather(*(consume(r) for r in responses))
+        finally:
+            await engine.dispose()
+
+    bodies = asyncio.run(run())
+    assert len(calls) == 1
+    assert isolated_state.stats()["coalesced"] == 4
+    for events in bodies:
+        assert events == bodies[0]
+        assert events[0]["type"] == "thinking"
+        assert "".join(e["content"] for e in events if e["type"] == "answer") == "第十八周考试"
+
+
+def test_shared_flight_does_not_use_the_leaders_session(monkeypatch, isolated_state):
+    sessions = []
+
+    async def fake_build_prompt(db, question, kb_ids, budget_tokens=None):
+        sessions.append(db)
+        return question
+
+    async def fake_call_model_api(model, prompt):
+        await asyncio.sleep(0.05)
+        yield ai_qa._make_sse_payload("答案")
+
+    monkeypatch.setattr(ai_qa, "_build_prompt", fake_build_prompt)
+    monkeypatch.setattr(ai_qa, "_call_model_api", fake_call_model_api)
+
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        monkeypatch.setattr(ai_qa, "AsyncSessionLocal", SessionLocal)
+        try:
+            async with SessionLocal() as db:
+                db.add(AiModelApi(name="m", provider="dashscope_openai", model_name="qwen", endpoint="http://x", api_key="k"))
+                await db.commit()
+            # The leader skipped retrieval (it saw a flight that finished right after) and its session closes
+            # while the shared generation is still running; the flight must open its own session
+            in_flight = isolated_state.in_flight
+            monkeypatch.setattr(isolated_state, "in_flight", lambda key: True)
+            async with SessionLocal() as leader_db:
+                leader = await ai_qa.stream_qa(QARequest(user_id="1", question="补考安排？"), leader_db)
+            monkeypatch.setattr(isolated_state, "in_flight", in_flight)
+            async with SessionLocal() as follower_db:
+                follower = await ai_qa.stream_qa(QARequest(user_id="2", question="补考安排？"), follower_db)
+
+                async def consume(response):
+                    return [json.loads(c[5:]) async for c in response.body_iterator]
+
+                bodies = await asyncio.gather(consume(leader), consume(follower))
+            return bodies, leader_db, follower_db
+        finally:
+            await engine.dispose()
+
+    bodies, leader_db, follower_db = asyncio.run(run())
+    assert len(sessions) == 1 and sessions[0] is not leader_db and sessions[0] is not follower_db
+    assert bodies[0] == bodies[1]
+    assert "".join(e["content"] for e in bodies[0] if e["type"] == "answer") == "答案"
@@ -0,0 +1,238 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app.database import Base
+from backend.app.models.ai_config import (
+    AiKnowledgeBase,
+    AiKnowledgeBaseChunk,
+    AiKnowledgeBaseDocument,
+    AiKnowledgeBaseIndexStat,
+    AiKnowledgeBasePosting,
+)
+from backend.app.services import ai_workflow
+from backend.app.services.ai_workflow import (
+    delete_document_chunks,
+    ensure_knowledge_base_index,
+    rebuild_document_chunks,
+    repair_knowledge_base_indexes,
+    retrieve_top_chunks,
+)
+from backend.app.services.kb_vector_index import KnowledgeBaseVectorIndex
+from backend.app.services.text_tokenizer import text_tokenizer
+
+
+@pytest.fixture(autouse=True)
+def vector_index(tmp_path, monkeypatch):
+    index = KnowledgeBaseVectorIndex(str(tmp_path / "kb_vectors"))
+    monkeypatch.setattr(ai_workflow, "kb_vector_index", index)
+    return index
+
+
+def _document(kb_id, title):
+    return AiKnowledgeBaseDocument(
+        knowledge_base_id=kb_id,
+        title=title,
+        original_filename=f"{title}.txt",
+        stored_filename="",
+        url="",
+        file_ext=".txt",
+    )
+
+
+def test_inverted_index_covers_whole_kb_and_tracks_deletes():
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        try:
+            async with SessionLocal() as db:
+                kb = AiKnowledgeBase(slug="course-1", name="课程知识库")
+                db.add(kb)
+                await db.flush()
+                old_doc, new_doc = _document(kb.id, "旧讲义"), _document(kb.id, "新讲义")
+                db.add_all([old_doc, new_doc])
+                await db.flush()
+                await rebuild_document_chunks(db, old_doc, "傅里叶变换把时域信号分解为不同频率的正弦分量。")
+                # Many newer chunks: the old one would fall outside a recency window
+                filler = "\n".join(f"第{i}章 课程安排与考核说明，平时成绩占百分之三十。" * 8 for i in range(60))
+                await rebuild_document_chunks(db, new_doc, filler, chunk_size=60, overlap=10)
+                await db.commit()
+
+                results = await retrieve_top_chunks(db, [kb.id], "什么是傅里叶变换？", limit=3)
+                assert results[0][0].document_id == old_doc.id
+                assert results[0][1] > 0
+
+                chunk_total = (await db.execute(select(func.count()).select_from(AiKnowledgeBaseChunk))).scalar()
+                stat = await db.get(AiKnowledgeBaseIndexStat, kb.id)
+                assert stat.chunk_count == chunk_total
+
+                await delete_document_chunks(db, old_doc.id)
+                await db.commit()
+                await db.refresh(stat)
+                assert stat.chunk_count == chunk_total - 1
+                orphan = await db.execute(
+                    select(func.count()).select_from(AiKnowledgeBasePosting).where(
+                        AiKnowledgeBasePosting.chunk_id.not_in(select(AiKnowledgeBaseChunk.id))
+                    )
+                )
+                assert orphan.scalar() == 0
+                results = await retrieve_top_chunks(db, [kb.id], "傅里叶变换", limit=3)
+                assert all(chunk.document_id != old_doc.id for chunk, _ in results)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_tokenizer_keeps_domain_terms_and_drops_stop_words():
+    terms = text_tokenizer.segment("请问期末考试的平时成绩占多少？")
+    assert "期末考试" in terms and "平时成绩" in terms
+    assert "的" not in terms and "请问" not in terms
+    assert text_tokenizer.segment_query("补考和重修") == ["补考", "重修"]
+
+
+def test_chunk_tokens_are_cached_and_stale_index_is_resegmented():
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        try:
+            async with SessionLocal() as db:
+                kb = AiKnowledgeBase(slug="course-2", name="课程知识库")
+                db.add(kb)
+                await db.flush()
+                doc = _document(kb.id, "讲义")
+                db.add(doc)
+                await db.flush()
+                await rebuild_document_chunks(db, doc, "重修课程需要在选课阶段提交申请。")
+                chunk = (await db.execute(select(AiKnowledgeBaseChunk))).scalars().one()
+                assert "重修" in chunk.tokens.split()
+
+                # Index built with an older tokenizer is rebuilt from content on next use
+                stat = await db.get(AiKnowledgeBaseIndexStat, kb.id)
+                stat.tokenizer = "legacy"
+                chunk.tokens = "stale"
+                await db.flush()
+                await ensure_knowledge_base_index(db, kb.id)
+                await db.commit()
+                results = await retrieve_top_chunks(db, [kb.id], "怎么申请重修", limit=1)
+                assert results and results[0][1] > 0
+                assert "stale" not in results[0][0].tokens
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_retrieval_only_reads_index_and_startup_repair_builds_it(vector_index):
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        try:
+            async with SessionLocal() as db:
+                kb = AiKnowledgeBase(slug="course-legacy", name="课程知识库")
+                db.add(kb)
+                await db.flush()
+                doc = _document(kb.id, "旧讲义")
+                db.add(doc)
+                await db.flush()
+                # Chunks from before the index existed: no postings, no stats, no vectors
+                db.add_all(
+                    AiKnowledgeBaseChunk(knowledge_base_id=kb.id, document_id=doc.id, seq=i, content=text)
+                    for i, text in enumerate(["补考安排在开学第二周。", "选课在教务系统进行。", "毕业论文需要查重。"])
+                )
+                await db.commit()
+
+            async def ask():
+                async with SessionLocal() as db:
+                    return await retrieve_top_chunks(db, [kb.id], "补考什么时候", limit=2)
+
+            # Concurrent questions neither build nor fail; they fall back to recent chunks
+            for results in await asyncio.gather(ask(), ask()):
+                assert len(results) == 2 and all(score == 0.0 for _, score in results)
+            async with SessionLocal() as db:
+                assert await db.get(AiKnowledgeBaseIndexStat, kb.id) is None
+            assert not vector_index.exists(kb.id)
+
+            async with SessionLocal() as db:
+                assert await repair_knowledge_base_indexes(db) == [kb.id]
+                await db.commit()
+                assert await repair_knowledge_base_indexes(db) == []
+            results = await ask()
+            assert "补考" in results[0][0].content and results[0][1] > 0
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_hybrid_retrieval_uses_dense_index(vector_index):
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        try:
+            async with SessionLocal() as db:
+                kb = AiKnowledgeBase(slug="course-3", name="课程知识库")
+                db.add(kb)
+                await db.flush()
+                docs = [_document(kb.id, f"讲义{i}") for i in range(3)]
+                db.add_all(docs)
+                await db.flush()
+                texts = [
+                    "期末考试不及格的同学可以申请补考，补考仍不及格需要重修。补考成绩单独记录。",
+                    "选课分为预选和补选两个阶段，选修课名额有限，先到先得。选课结果在教务系统查询。",
+                    "毕业论文需完成开题报告、中期检查和论文答辩，指导教师全程跟进。答辩前需查重。",
+                ]
+                for doc, text in zip(docs, texts):
+                    await rebuild_document_chunks(db, doc, text, chunk_size=40, overlap=0)
+                await db.commit()
+                assert vector_index.exists(kb.id)
+
+                chunk_total = (await db.execute(select(func.count()).select_from(AiKnowledgeBaseChunk))).scalar()
+                hits = vector_index.search([kb.id], text_tokenizer.segment_query("补考"), chunk_total)
+                assert len(hits) == chunk_total
+                results = await retrieve_top_chunks(db, [kb.id], "挂科了要补考吗", limit=2)
+                assert results[0][0].document_id == docs[0].id
+
+                # Vector files lost on a new deployment are rebuilt at startup, not by the next question
+                vector_index.drop(kb.id)
+                await retrieve_top_chunks(db, [kb.id], "选课", limit=1)
+                assert not vector_index.exists(kb.id)
+                assert await repair_knowledge_base_indexes(db) == [kb.id]
+                assert vector_index.exists(kb.id)
+
+                await delete_document_chunks(db, docs[0].id)
+                await db.commit()
+                remaining = vector_index.search([kb.id], text_tokenizer.segment_query("补考"), chunk_total)
+                assert len(remaining) < chunk_total
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_concurrent_vector_adds_keep_every_chunk(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    index = KnowledgeBaseVectorIndex(str(tmp_path / "vectors"))
+    words = ["补考", "重修", "选课", "学分", "绩点", "论文", "答辩", "考勤", "请假", "奖学金"]
+    base = [(i, [words[i % 10], words[(i * 3) % 10], f"词{i}"]) for i in range(50)]
+    assert index.rebuild(1, base)
+
+    def add(batch):
+        index.add(1, [(1000 + batch * 10 + j, [words[j], words[(j + batch) % 10]]) for j in range(10)])
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(add, range(8)))
+    hits = index.search([1], ["补考"], 1000)
+    assert len(hits) == 130
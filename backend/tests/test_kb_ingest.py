@@ -0,0 +1,66 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app.database import Base
+from backend.app.models.ai_config import AiKnowledgeBase, AiKnowledgeBaseChunk, AiKnowledgeBaseDocument
+from backend.app.services import ai_workflow
+from backend.app.services.kb_ingest import INGEST_PROCESSING, INGEST_READY, KbIngestPipeline
+from backend.app.services.kb_vector_index import KnowledgeBaseVectorIndex
+
+
+@pytest.fixture(autouse=True)
+def vector_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(ai_workflow, "kb_vector_index", KnowledgeBaseVectorIndex(str(tmp_path / "kb_vectors")))
+
+
+def test_upload_is_ingested_in_background(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("线性代数研究向量空间与线性映射。\n矩阵的秩等于其列空间的维数。\n" * 20, encoding="utf-8")
+
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        pipeline = KbIngestPipeline(session_factory=SessionLocal, executor=ThreadPoolExecutor(max_workers=1))
+        try:
+            async with SessionLocal() as db:
+                kb = AiKnowledgeBase(slug="course-ingest", name="课程知识库")
+                db.add(kb)
+                await db.flush()
+                doc = AiKnowledgeBaseDocument(
+                    knowledge_base_id=kb.id,
+                    title="讲义",
+                    original_filename="notes.txt",
+                    stored_filename="notes.txt",
+                    url="",
+                    file_ext=".txt",
+                    ingest_status=INGEST_PROCESSING,
+                )
+                db.add(doc)
+                await db.commit()
+
+            pipeline.submit(doc.id, str(path), ".txt")
+            assert pipeline.is_pending(doc.id)
+            await pipeline.drain()
+
+            async with SessionLocal() as db:
+                stored = await db.get(AiKnowledgeBaseDocument, doc.id)
+                assert stored.ingest_status == INGEST_READY
+                count = (
+                    await db.execute(
+                        select(func.count()).select_from(AiKnowledgeBaseChunk).where(AiKnowledgeBaseChunk.document_id == doc.id)
+                    )
+                ).scalar()
+                assert count > 0
+                results = await ai_workflow.retrieve_top_chunks(db, [kb.id], "矩阵的秩", limit=1)
+                assert results and results[0][0].document_id == doc.id
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
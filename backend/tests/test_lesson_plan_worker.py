@@ -0,0 +1,221 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app.database import Base
+from backend.app.models.ai_config import AiLessonPlanTask
+from backend.app.services.lesson_plan_worker import LessonPlanTaskWorker
+
+
+async def _setup(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'tasks.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return engine, sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def _add_task(SessionLocal, **kwargs) -> int:
+    async with SessionLocal() as db:
+        task = AiLessonPlanTask(teacher_user_id=7, title="数据结构：栈与队列", outline="栈的定义", **kwargs)
+        db.add(task)
+        await db.commit()
+        return task.id
+
+
+async def _load(SessionLocal, task_id) -> AiLessonPlanTask:
+    async with SessionLocal() as db:
+        return await db.get(AiLessonPlanTask, task_id)
+
+
+def test_task_checkpoints_partial_result_and_completes(tmp_path):
+    async def run():
+        engine, SessionLocal = await _setup(tmp_path)
+        seen_partial = []
+
+        async def generate(db, task, prompt):
+            assert "数据结构：栈与队列" in prompt and "栈的定义" in prompt
+            yield {"type": "thinking", "content": "排队中，即将开始生成"}
+            yield {"type": "answer", "content": "一、教学目标"}
+            yield {"type": "answer", "content": "\n二、教学过程"}
+            seen_partial.append((await _load(SessionLocal, task.id)).result)
+            yield {"type": "answer", "content": "\n三、作业"}
+
+        worker = LessonPlanTaskWorker(SessionLocal, generate, checkpoint_seconds=0)
+        try:
+            task_id = await _add_task(SessionLocal)
+            assert await worker.claim() == task_id
+            assert await worker.claim() is None
+            await worker.run_task(task_id)
+            task = await _load(SessionLocal, task_id)
+            assert task.status == "completed" and task.completed_at is not None
+            assert task.result == "一、教学目标\n二、教学过程\n三、作业"
+            assert task.attempts == 1 and task.error_message is None
+            assert seen_partial == ["一、教学目标\n二、教学过程"]
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_retryable_failure_resumes_from_checkpoint_and_permanent_failure_stops(tmp_path):
+    async def run():
+        engine, SessionLocal = await _setup(tmp_path)
+        prompts = []
+
+        async def generate(db, task, prompt):
+            prompts.append(prompt)
+            if task.title == "拒绝":
+                yield {"type": "error", "content": "上游 400", "retryable": False}
+                return
+            if len(prompts) == 1:
+                yield {"type": "answer", "content": "前半部分"}
+                yield {"type": "error", "content": "AI 请求异常: 连接中断", "retryable": True}
+            else:
+                yield {"type": "answer", "content": "后半部分"}
+
+        worker = LessonPlanTaskWorker(SessionLocal, generate, checkpoint_seconds=60, retry_backoff_seconds=0)
+        try:
+            task_id = await _add_task(SessionLocal)
+            await worker.claim()
+            await worker.run_task(task_id)
+            task = await _load(SessionLocal, task_id)
+            assert task.status == "pending" and task.result == "前半部分"
+            assert "连接中断" in task.error_message
+
+            assert await worker.claim() == task_id
+            await worker.run_task(task_id)
+            task = await _load(SessionLocal, task_id)
+            assert "前半部分" in prompts[1] and "继续" in prompts[1]
+            assert task.status == "completed" and task.result == "前半部分后半部分" and task.attempts == 2
+
+            async with SessionLocal() as db:
+                db.add(AiLessonPlanTask(teacher_user_id=7, title="拒绝"))
+                await db.commit()
+            denied_id = await worker.claim()
+            await worker.run_task(denied_id)
+            denied = await _load(SessionLocal, denied_id)
+            assert denied.status == "failed" and denied.error_message == "上游 400"
+            assert worker.stats()["failed"] == 1 and worker.stats()["retried"] == 1
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_timeout_and_expired_lease_requeue(tmp_path):
+    async def run():
+        engine, SessionLocal = await _setup(tmp_path)
+
+        async def generate(db, task, prompt):
+            yield {"type": "answer", "content": "开头"}
+            await asyncio.sleep(5)
+
+        worker = LessonPlanTaskWorker(SessionLocal, generate, timeout_seconds=0.05, max_attempts=1)
+        try:
+            task_id = await _add_task(SessionLocal)
+            await worker.claim()
+            await worker.run_task(task_id)
+            task = await _load(SessionLocal, task_id)
+            assert task.status == "failed" and task.error_message == "生成超时" and task.result == "开头"
+
+            # 进程退出后遗留的 streaming 任务：租约过期才重新排队
+            orphan = await _add_task(SessionLocal, status="streaming", lease_until=datetime.utcnow() - timedelta(seconds=1))
+            alive = await _add_task(SessionLocal, status="streaming", lease_until=datetime.utcnow() + timedelta(minutes=1))
+            assert await worker.recover_expired() == 1
+            assert (await _load(SessionLocal, orphan)).status == "pending"
+            assert (await _load(SessionLocal, alive)).status == "streaming"
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_worker_loop_picks_up_new_tasks(tmp_path):
+    async def run():
+        engine, SessionLocal = await _setup(tmp_path)
+
+        async def generate(db, task, prompt):
+            yield {"type": "answer", "content": f"教案{task.id}"}
+
+        worker = LessonPlanTaskWorker(SessionLocal, generate, poll_seconds=30)
+        try:
+            worker.start()
+            ids = [await _add_task(SessionLocal) for _ in range(3)]
+            worker.notify()
+            for _ in range(200):
+                tasks = [await _load(SessionLocal, i) for i in ids]
+                if all(t.status == "completed" for t in tasks):
+                    break
+                await asyncio.sleep(0.02)
+            assert [t.result for t in tasks] == [f"教案{i}" for i in ids]
+        finally:
+            await worker.stop()
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_app_startup_starts_worker_without_demo_seed(tmp_path, monkeypatch):
+    from backend.app import main
+    from backend.app.services import ai_workflow, lesson_plan_worker as worker_module
+    from backend.app.services.kb_vector_index import KnowledgeBaseVectorIndex
+
+    monkeypatch.delenv("ENABLE_DEMO_SEED", raising=False)
+    monkeypatch.setattr(ai_workflow, "kb_vector_index", KnowledgeBaseVectorIndex(str(tmp_path / "vectors"), "lsa"))
+
+    async def run():
+        engine, SessionLocal = await _setup(tmp_path)
+        monkeypatch.setattr(main, "engine", engine)
+        monkeypatch.setattr(main, "AsyncSessionLocal", SessionLocal)
+
+        async def generate(db, task, prompt):
+            yield {"type": "answer", "content": "教案"}
+
+        worker = LessonPlanTaskWorker(SessionLocal, generate, poll_seconds=30)
+        monkeypatch.setattr(worker_module, "lesson_plan_worker", worker)
+        try:
+            await main.app.router.startup()
+            task_id = await _add_task(SessionLocal)
+            worker.notify()
+            for _ in range(200):
+                task = await _load(SessionLocal, task_id)
+                if task.status == "completed":
+                    break
+                await asyncio.sleep(0.02)
+            assert task.status == "completed" and task.result == "教案"
+        finally:
+            await worker.stop()
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_lease_is_renewed_while_waiting_for_first_token(tmp_path):
+    async def run():
+        engine, SessionLocal = await _setup(tmp_path)
+        recovered = []
+
+        async def generate(db, task, prompt):
+            # 长时间排队：只有过程提示，没有答案文本，不触发检查点
+            for _ in range(6):
+                yield {"type": "thinking", "content": "排队中"}
+                await asyncio.sleep(0.1)
+                recovered.append(await other.recover_expired())
+            yield {"type": "answer", "content": "教案"}
+
+        worker = LessonPlanTaskWorker(SessionLocal, generate, lease_seconds=0.3, checkpoint_seconds=60)
+        # 另一个进程中的工作协程：只会接手租约已过期的任务
+        other = LessonPlanTaskWorker(SessionLocal, generate)
+        try:
+            task_id = await _add_task(SessionLocal)
+            await worker.claim()
+            await worker.run_task(task_id)
+            task = await _load(SessionLocal, task_id)
+            assert recovered == [0] * 6
+            assert task.status == "completed" and task.attempts == 1 and task.result == "教案"
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
@@ -0,0 +1,87 @@
+import asyncio
+import socket
+
+import httpx
+import uvicorn
+
+from backend.app.routers import ai_qa
+from backend.app.services import ai_load_test
+from backend.app.services.ai_http_clients import ProviderClientRegistry
+from backend.app.services.ai_load_test import run_load
+from backend.app.services.mock_llm_provider import MockConfig, create_app
+
+
+async def _parsed_stream(app, path, payload, headers=None):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://mock") as client:
+        async with client.stream("POST", path, json=payload, headers=headers) as resp:
+            if resp.status_code != 200:
+                return resp.status_code, resp.headers, []
+            pieces = [ai_qa._extract_stream_text(raw) async for raw in ai_qa._iter_sse_events(resp) if raw != "[DONE]"]
+            return resp.status_code, resp.headers, [p for p in pieces if p]
+
+
+def test_mock_speaks_both_provider_formats():
+    config = MockConfig(first_token_ms=0, tokens_per_second=0, tokens=30, chunk_tokens=4, pad_bytes=64)
+
+    async def run():
+        app = create_app(config)
+        chat = await _parsed_stream(app, "/v1/chat/completions", {"model": "m", "stream": True, "max_tokens": 10})
+        ark = await _parsed_stream(app, "/api/v3/responses", {"model": "m", "stream": True})
+        return app, chat, ark
+
+    app, (chat_status, _, chat_pieces), (ark_status, _, ark_pieces) = asyncio.run(run())
+    assert chat_status == 200 and ark_status == 200
+    # max_tokens 截断回答，每个事件 chunk_tokens 个字
+    assert len("".join(chat_pieces)) == 10 and len(chat_pieces) == 3
+    # ark 的 delta 事件不被解析，全文只从 output_text.done 取到一次
+    assert len(ark_pieces) == 1 and len(ark_pieces[0]) == 30
+    assert app.state.provider.stats()["completed_streams"] == 2
+
+
+def test_mock_error_injection_and_header_overrides():
+    async def run():
+        app = create_app(MockConfig(first_token_ms=0, tokens_per_second=0, tokens=5), seed=1)
+        failed = await _parsed_stream(
+            app,
+            "/chat/completions",
+            {"stream": True},
+            headers={"X-Mock-Error-Rate": "1", "X-Mock-Error-Status": "429"},
+        )
+        ok = await _parsed_stream(app, "/chat/completions", {"stream": True}, headers={"X-Mock-Tokens": "not-a-number"})
+        return failed, ok
+
+    (status, headers, _), (ok_status, _, pieces) = asyncio.run(run())
+    assert status == 429 and headers["retry-after"] == "1"
+    assert ok_status == 200 and len("".join(pieces)) == 5
+
+
+def test_load_run_reports_ttft_throughput_and_loop_lag(monkeypatch):
+    # 独立的连接池，测试结束前在同一事件循环内关闭，不把连接留给其他测试
+    clients = ProviderClientRegistry()
+    monkeypatch.setattr(ai_qa, "provider_clients", clients)
+    monkeypatch.setattr(ai_load_test, "provider_clients", clients)
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    app = create_app(MockConfig(first_token_ms=20, tokens_per_second=0, tokens=40, chunk_tokens=8))
+
+    async def run():
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+        try:
+            return await run_load(f"http://127.0.0.1:{port}", concurrency=3, requests=6)
+        finally:
+            await clients.aclose()
+            server.should_exit = True
+            await serving
+
+    report = asyncio.run(run())
+    assert report["completed"] == 6 and report["errors"] == 0
+    assert report["ttft_ms"]["p50"] >= 20
+    assert report["throughput"]["answer_chars_per_s"] > 0
+    assert report["event_loop_lag_ms"] is not None
+    assert report["provider_clients"]["clients"] and clients.stats()["clients"] == []
+    assert app.state.provider.stats()["requests"] == 6
@@ -0,0 +1,27 @@
+from backend.app.services import ai_workflow
+from backend.app.services.retrieval_benchmark import compare, generate_corpus, run_benchmark
+
+
+def test_generate_corpus_is_deterministic_and_labelled():
+    docs, questions = generate_corpus("zh", 30, seed=4)
+    assert (docs, questions) == generate_corpus("zh", 30, seed=4)
+    titles = {title for title, _ in docs}
+    assert len(titles) == 30
+    assert all(relevant in titles for _, relevant in questions)
+
+
+def test_benchmark_is_reproducible_and_flags_regressions():
+    original_index = ai_workflow.kb_vector_index
+    first = run_benchmark(["fixture", "en"], ["tiny"], [1])
+    second = run_benchmark(["fixture", "en"], ["tiny"], [1])
+    # 基准使用临时向量索引，结束后恢复正式实例
+    assert ai_workflow.kb_vector_index is original_index
+
+    keys = ("recall@1", "recall@5", "mrr", "chunks")
+    assert [[run[k] for k in keys] for run in first["runs"]] == [[run[k] for k in keys] for run in second["runs"]]
+    assert compare(first, second, time_tolerance=10.0) == []
+    assert first["summary"]["en/tiny"]["recall@10"] > 0
+
+    fixture = first["summary"]["fixture/fixture"]
+    worse = {"summary": {"fixture/fixture": dict(fixture, mrr=fixture["mrr"] - 0.1)}}
+    assert any("mrr" in line for line in compare(first, worse, time_tolerance=10.0))
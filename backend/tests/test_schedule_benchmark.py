@@ -0,0 +1,16 @@
+from backend.app.algorithms.schedule_benchmark import compare, generate_faculty, run_benchmark
+
+
+def test_generate_faculty_is_deterministic():
+    assert generate_faculty(5, 20, 3, seed=4) == generate_faculty(5, 20, 3, seed=4)
+
+
+def test_benchmark_is_reproducible_and_flags_regressions():
+    first = run_benchmark(["department"], [1])
+    second = run_benchmark(["department"], [1])
+    keys = ("generations_to_converge", "fitness", "conflicts", "utilization")
+    assert [first["runs"][0][k] for k in keys] == [second["runs"][0][k] for k in keys]
+    assert compare(first, second, time_tolerance=10.0) == []
+
+    worse = {"summary": {"department": dict(first["summary"]["department"], conflicts=first["summary"]["department"]["conflicts"] + 1)}}
+    assert any("conflicts" in line for line in compare(first, worse, time_tolerance=10.0))
@@ -0,0 +1,180 @@
+import random
+
+import numpy as np
+import pytest
+
+from backend.app.algorithms.schedule_genetic import GeneticSchedule
+from backend.app.schemas.schedule import ClassroomItem, CourseItem, TeacherItem
+
+
+def _build_ga(n_teachers=6, n_courses=40, n_rooms=5, seed=7):
+    rng = random.Random(seed)
+    teachers = [TeacherItem(id=f"T{i}", name=f"教师{i}") for i in range(n_teachers)]
+    courses = [
+        CourseItem(
+            id=i + 1,
+            name=f"课程{i + 1}",
+            teacher_id=f"T{rng.randrange(n_teachers)}",
+            is_required=rng.random() < 0.5,
+        )
+        for i in range(n_courses)
+    ]
+    classrooms = [
+        ClassroomItem(id=100 + i, name=f"教室{i}", capacity=60, is_multimedia=i % 2 == 0)
+        for i in range(n_rooms)
+    ]
+    return GeneticSchedule(teachers, courses, classrooms)
+
+
+def _reference_fitness(ga, individual):
+    """Cell-by-cell scoring, kept as the behavioural spec for the vectorized engine."""
+    conflicts = 0
+    multimedia_score = 0
+    teacher_spread_score = 0
+    teacher_daily_counts = {tid: np.zeros(ga.DAYS) for tid in ga.teacher_ids}
+    teacher_schedule = {tid: set() for tid in ga.teacher_ids}
+    total_slots = ga.DAYS * ga.PERIODS * len(ga.classrooms)
+    used_slots = 0
+    for d in range(ga.DAYS):
+        for p in range(ga.PERIODS):
+            for c_idx in range(len(ga.classrooms)):
+                course_id = individual[d, p, c_idx]
+                if course_id == 0:
+                    continue
+                used_slots += 1
+                course = ga.courses[course_id]
+                tid = course.teacher_id
+                if (d, p) in teacher_schedule[tid]:
+                    conflicts += 1
+                else:
+                    teacher_schedule[tid].add((d, p))
+                teacher_daily_counts[tid][d] += 1
+                if course.is_required and ga.classrooms[ga.idx_to_c_id[c_idx]].is_multimedia:
+                    multimedia_score += 1
+    for counts in teacher_daily_counts.values():
+        for d in range(ga.DAYS):
+            if counts[d] > 3:
+                conflicts += counts[d] - 3
+            elif counts[d] <= 2:
+                teacher_spread_score += 1
+    utilization = used_slots / total_slots
+    required = sum(1 for c in ga.courses.values() if c.is_required)
+    multimedia_rate = multimedia_score / required if required > 0 else 1.0
+    fitness = 1.0 / (conflicts + 1.0) + utilization * 0.3 + multimedia_rate * 0.2 + teacher_spread_score * 0.05
+    return fitness, conflicts, utilization
+
+
+def test_population_fitness_matches_reference():
+    ga = _build_ga()
+    random.seed(3)
+    population = np.stack([ga.create_individual() for _ in range(8)])
+    # Force some double-bookings and overloads so every penalty path is exercised
+    for ind in population[:4]:
+        for _ in range(30):
+            d, p, c = random.randrange(ga.DAYS), random.randrange(ga.PERIODS), random.randrange(len(ga.classrooms))
+            ind[d, p, c] = random.choice(ga.course_ids)
+
+    fitness, conflicts, utilization = ga.calc_population_fitness(population)
+    for i, ind in enumerate(population):
+        ref = _reference_fitness(ga, ind)
+        assert fitness[i] == pytest.approx(ref[0])
+        assert conflicts[i] == ref[1]
+        assert utilization[i] == pytest.approx(ref[2])
+        assert ga.calc_fitness(ind) == pytest.approx(ref)
+
+
+def test_evolve_returns_plain_stats():
+    ga = _build_ga(n_courses=20)
+    ga.MAX_GENERATIONS = 5
+    random.seed(1)
+    np.random.seed(1)
+    best, stats = ga.evolve()
+    assert best.shape == (ga.DAYS, ga.PERIODS, len(ga.classrooms))
+    assert isinstance(stats["conflicts"], int)
+    assert isinstance(stats["fitness"], float)
+
+
+def test_island_model_returns_global_best():
+    from backend.app.algorithms.schedule_islands import IslandSchedule
+
+    ga = _build_ga(n_courses=20)
+    ga.MAX_GENERATIONS = 12
+    ga.POPULATION_SIZE = 10
+    best, stats = IslandSchedule(ga, island_count=3, max_workers=2, seed=5).evolve()
+    assert best.shape == (ga.DAYS, ga.PERIODS, len(ga.classrooms))
+    assert stats["fitness"] == pytest.approx(ga.calc_fitness(best)[0])
+
+
+def test_warm_start_keeps_pinned_cells_and_places_delta():
+    ga = _build_ga(n_courses=12, n_rooms=3)
+    ga.MAX_GENERATIONS = 10
+    ga.MUTATION_RATE = 1.0
+    random.seed(2)
+    np.random.seed(2)
+    seed = ga.create_individual()
+    entries = [
+        {"course_id": int(seed[d, p, c]), "classroom_id": ga.idx_to_c_id[c], "day": int(d), "period": int(p), "pinned": True}
+        for d, p, c in np.argwhere(seed > 0)
+    ]
+    # Course 1 was dropped from the saved timetable and must be re-placed
+    entries = [e for e in entries if e["course_id"] != 1]
+    ga.apply_warm_start(entries)
+    assert ga.delta_course_ids == [1]
+    assert (ga.create_individual() == 1).sum() == 1
+
+    best, _ = ga.evolve()
+    assert np.array_equal(best[ga.pinned_mask], ga.warm_base[ga.pinned_mask])
+
+
+def test_incremental_fitness_tracks_full_evaluation():
+    from backend.app.algorithms.schedule_fitness import IncrementalFitness
+
+    ga = _build_ga()
+    random.seed(4)
+    individual = ga.create_individual()
+    state = IncrementalFitness(ga.fitness_engine, individual.copy())
+    cells = [tuple(c) for c in np.argwhere(np.ones(individual.shape, dtype=bool))]
+    for _ in range(200):
+        a, b = random.choice(cells), random.choice(cells)
+        delta = state.swap_delta(a, b)
+        before = state.cost()
+        state.swap(a, b)
+        assert state.cost() - before == pytest.approx(delta)
+        if random.random() < 0.2:
+            state.place(random.choice(cells), random.choice(ga.course_ids))
+    assert state.fitness() == pytest.approx(ga.calc_fitness(state.grid))
+
+
+def test_post_optimizers_remove_teacher_conflicts():
+    from backend.app.algorithms.schedule_local_search import run_post_optimizers
+
+    ga = _build_ga(n_teachers=8, n_courses=30, n_rooms=4)
+    random.seed(5)
+    np.random.seed(5)
+    individual = ga.create_individual()
+    # Stack a teacher's classes into one period to create double-bookings
+    teacher = ga.courses[ga.course_ids[0]].teacher_id
+    same_teacher = [cid for cid in ga.course_ids if ga.courses[cid].teacher_id == teacher][:3]
+    for c_idx, course_id in enumerate(same_teacher):
+        individual[individual == course_id] = 0
+        individual[0, 0, c_idx] = course_id
+    assert ga.calc_fitness(individual)[1] > 0
+
+    best, stats = run_post_optimizers(ga, individual, ["repair", "tabu"])
+    assert stats["conflicts"] == 0
+    assert stats == pytest.approx(dict(zip(("fitness", "conflicts", "utilization"), ga.calc_fitness(best))))
+
+
+def test_delta_fitness_matches_full_rescoring():
+    results = []
+    for delta in (True, False):
+        ga = _build_ga(n_courses=30)
+        ga.MAX_GENERATIONS = 15
+        ga.MUTATION_RATE = 0.5
+        ga.DELTA_FITNESS = delta
+        random.seed(9)
+        np.random.seed(9)
+        results.append(ga.evolve())
+    (best_delta, stats_delta), (best_full, stats_full) = results
+    assert np.array_equal(best_delta, best_full)
+    assert stats_delta == pytest.approx(stats_full)
@@ -0,0 +1,55 @@
+import asyncio
+
+from backend.app.schemas.schedule import ClassroomItem, CourseItem, ScheduleRequest, TeacherItem
+from backend.app.services.schedule_jobs import (
+    JOB_CANCELLED,
+    JOB_COMPLETED,
+    ScheduleJobManager,
+)
+
+
+def _request(n_courses=12):
+    return ScheduleRequest(
+        teachers=[TeacherItem(id="T1", name="张老师"), TeacherItem(id="T2", name="李老师")],
+        courses=[
+            CourseItem(id=i + 1, name=f"课程{i + 1}", teacher_id="T1" if i % 2 else "T2", is_required=i % 3 == 0)
+            for i in range(n_courses)
+        ],
+        classrooms=[ClassroomItem(id=1, name="A101", capacity=50, is_multimedia=True), ClassroomItem(id=2, name="A102", capacity=50)],
+    )
+
+
+async def _drain(manager, job):
+    queue = manager.subscribe(job)
+    events = []
+    while True:
+        event = await asyncio.wait_for(queue.get(), timeout=30)
+        events.append(event)
+        if event["type"] in {"completed", "failed", "cancelled"}:
+            return events
+
+
+def test_job_streams_progress_and_completes():
+    async def run():
+        manager = ScheduleJobManager(max_workers=1)
+        job = manager.submit(_request(), owner_user_id=1)
+        events = await _drain(manager, job)
+        assert events[-1]["type"] == JOB_COMPLETED
+        assert any(e["type"] == "progress" and e["generation"] > 0 for e in events)
+        snapshot = manager.get(job.id).snapshot()
+        assert snapshot.status == JOB_COMPLETED
+        assert snapshot.result is not None and snapshot.result.entries
+
+    asyncio.run(run())
+
+
+def test_job_can_be_cancelled():
+    async def run():
+        manager = ScheduleJobManager(max_workers=1)
+        job = manager.submit(_request(), owner_user_id=1)
+        manager.cancel(job)
+        events = await _drain(manager, job)
+        assert events[-1]["type"] == JOB_CANCELLED
+        assert manager.get(job.id).snapshot().result is None
+
+    asyncio.run(run())
@@ -0,0 +1,113 @@
+import asyncio
+from datetime import datetime
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app.main import app
+from backend.app.database import Base, get_db
+from backend.app.dependencies.auth import get_current_admin
+from backend.app.models.course import Course, Teacher
+from backend.app.models.schedule import Classroom, Schedule
+from backend.app.models.teaching import AdjustStatus, ClassAdjust, WorkSchedule
+from backend.app.routers.schedule import _prepare_warm_start
+from backend.app.schemas.schedule import ScheduleRequest
+from backend.app.models.user import User
+
+
+def _entry(course_id, classroom_id, day, period, teacher_id="100001"):
+    return {"course_id": course_id, "teacher_id": teacher_id, "classroom_id": classroom_id, "day": day, "period": period}
+
+
+def test_save_schedule_diffs_against_existing_rows():
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+        async def override_get_db():
+            async with SessionLocal() as session:
+                yield session
+
+        app.dependency_overrides[get_db] = override_get_db
+        app.dependency_overrides[get_current_admin] = lambda: None
+        try:
+            async with SessionLocal() as session:
+                session.add_all([
+                    User(username="100001", password="x", role="teacher"),
+                    Teacher(id="100001", name="张老师"),
+                    Course(id=1, name="高等数学", credit=4, teacher_id="100001", capacity=60, course_type="必修"),
+                    Course(id=2, name="线性代数", credit=3, teacher_id="100001", capacity=60, course_type="必修"),
+                    Classroom(id=1, name="A101", capacity=60),
+                ])
+                await session.commit()
+
+            transport = ASGITransport(app=app)
+            async with AsyncClient(transport=transport, base_url="http://test") as client:
+                resp = await client.post("/schedule/save", json={"entries": [_entry(1, 1, 0, 0), _entry(2, 1, 1, 0)]})
+                assert resp.status_code == 200
+                async with SessionLocal() as session:
+                    kept_id = (await session.execute(select(Schedule.id).where(Schedule.course_id == 1))).scalar_one()
+
+                resp = await client.post("/schedule/save", json={"entries": [_entry(1, 1, 0, 0), _entry(2, 1, 2, 3)]})
+                assert resp.status_code == 200
+
+            async with SessionLocal() as session:
+                rows = (await session.execute(select(Schedule).order_by(Schedule.course_id))).scalars().all()
+                assert [(r.course_id, r.day, r.period) for r in rows] == [(1, 0, 0), (2, 2, 3)]
+                # Unchanged assignments are left in place rather than deleted and re-inserted
+                assert rows[0].id == kept_id
+                works = (await session.execute(select(WorkSchedule))).scalars().all()
+                assert len(works) == 2
+                assert {w.content for w in works} == {"高等数学（A101）", "线性代数（A101）"}
+        finally:
+            app.dependency_overrides.clear()
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_warm_start_unpins_adjusted_entry_whose_teacher_changed():
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        try:
+            async with SessionLocal() as session:
+                session.add_all([
+                    Schedule(course_id=1, classroom_id=1, teacher_id="100001", day=0, period=0),
+                    Schedule(course_id=2, classroom_id=1, teacher_id="100001", day=1, period=0),
+                    # Approved move of course 1 from Monday 08:00 to Wednesday 14:00
+                    ClassAdjust(
+                        teacher_id=100001,
+                        course_id=1,
+                        old_time=datetime(2024, 9, 2, 8, 0),
+                        new_time=datetime(2024, 9, 4, 14, 0),
+                        reason="出差",
+                        status=AdjustStatus.APPROVED.value,
+                    ),
+                ])
+                await session.commit()
+                request = ScheduleRequest(
+                    teachers=[{"id": "100001", "name": "张老师"}, {"id": "100002", "name": "李老师"}],
+                    # Course 1 has been handed to another teacher since it was scheduled
+                    courses=[
+                        {"id": 1, "name": "高等数学", "teacher_id": "100002"},
+                        {"id": 2, "name": "线性代数", "teacher_id": "100001"},
+                    ],
+                    classrooms=[{"id": 1, "name": "A101", "capacity": 60}],
+                    warm_start=True,
+                )
+                _, entries = await _prepare_warm_start(session, request)
+        finally:
+            await engine.dispose()
+        return {e["course_id"]: e for e in entries}
+
+    entries = asyncio.run(run())
+    assert (entries[1]["day"], entries[1]["period"]) == (2, 2)
+    assert entries[1]["pinned"] is False
+    assert entries[2]["pinned"] is True
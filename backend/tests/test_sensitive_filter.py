@@ -0,0 +1,103 @@
+import asyncio
+import random
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app.database import Base
+from backend.app.routers import ai_qa
+from backend.app.services.sensitive_filter import AhoCorasick, SensitiveFilter, StreamMasker
+
+
+def _naive_mask(text, words):
+    masked = list(text)
+    lower = text.lower()
+    for word in words:
+        start = lower.find(word.lower())
+        while start != -1:
+            for i in range(start, start + len(word)):
+                masked[i] = "*"
+            start = lower.find(word.lower(), start + 1)
+    return "".join(masked)
+
+
+def test_automaton_matches_overlapping_and_suffix_words():
+    ac = AhoCorasick(["he", "she", "his", "hers", "赌博", "网络赌博"])
+    assert ac.contains("ushers")
+    assert ac.find("ushers") == ["she", "hers"]
+    assert ac.mask("他参与网络赌博") == "他参与****"
+    # 全角与大小写折叠
+    assert ac.contains("ＳＨＥ said")
+    assert not ac.contains("hi tom")
+    assert AhoCorasick([]).mask("任意文本") == "任意文本"
+
+
+def test_mask_agrees_with_naive_search():
+    rng = random.Random(7)
+    words = ["ab", "bab", "abc", "ca", "aaa"]
+    ac = AhoCorasick(words)
+    for _ in range(200):
+        text = "".join(rng.choice("abcx") for _ in range(rng.randint(0, 30)))
+        assert ac.mask(text) == _naive_mask(text, words)
+        assert ac.contains(text) == any(w in text for w in words)
+
+
+def test_stream_masker_catches_words_split_across_chunks():
+    ac = AhoCorasick(["色情", "暴力内容"])
+    text = "这里没有暴力，也没有暴力内容和色情。"
+    rng = random.Random(3)
+    for _ in range(50):
+        cuts = sorted(rng.sample(range(1, len(text)), rng.randint(1, 6)))
+        pieces = [text[i:j] for i, j in zip([0, *cuts], [*cuts, len(text)])]
+        masker = StreamMasker(ac)
+        out = "".join(masker.feed(p) for p in pieces) + masker.flush()
+        assert out == "这里没有暴力，也没有****和**。"
+
+    masker = StreamMasker(ac)
+    # 可能是敏感词前缀的尾部先扣留
+    assert masker.feed("先说暴") == "先说"
+    assert masker.feed("雨") == "暴雨"
+    assert masker.flush() == ""
+
+
+def test_filter_hot_reloads_word_list_from_settings():
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        try:
+            admin = SensitiveFilter(ttl_seconds=0)
+            other = SensitiveFilter(ttl_seconds=0)
+            async with SessionLocal() as db:
+                await other.refresh(db)
+                assert other.contains("赌博") and not other.contains("作弊")
+                saved = await admin.save(db, [" 作弊 ", "作弊", "", "代考"])
+                assert saved == ["作弊", "代考"]
+                assert admin.contains("考试作弊") and not admin.contains("赌博")
+                # 另一个进程在下次刷新时换用新词表
+                await other.refresh(db)
+                assert other.words == ("作弊", "代考")
+                assert other.version == 1
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_moderated_stream_masks_answer_and_keeps_events(monkeypatch):
+    monkeypatch.setattr(ai_qa, "sensitive_filter", SensitiveFilter(["赌博"]))
+
+    async def upstream():
+        yield ai_qa._make_sse_payload("检索中", "thinking")
+        yield ai_qa._make_sse_payload("不要参与赌")
+        yield ai_qa._make_sse_payload("博活动")
+        yield ai_qa._make_sse_payload("结尾赌")
+        yield ai_qa._make_error_payload("中断")
+
+    async def run():
+        return [ai_qa._parse_sse_payload(c) async for c in ai_qa._moderated(upstream())]
+
+    events = asyncio.run(run())
+    assert [e["type"] for e in events] == ["thinking", "answer", "answer", "answer", "answer", "error"]
+    assert "".join(e["content"] for e in events if e["type"] == "answer") == "不要参与**活动结尾赌"
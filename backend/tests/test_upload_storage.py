@@ -0,0 +1,68 @@
+import asyncio
+import io
+import os
+
+import httpx
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from backend.app.services.upload_storage import UploadStorage
+
+
+def _upload(data: bytes, name="notes.pdf", size=None):
+    return UploadFile(file=io.BytesIO(data), filename=name, size=size)
+
+
+def test_save_streams_hashes_and_deduplicates(tmp_path):
+    public, store = tmp_path / "uploads", tmp_path / "store"
+    storage = UploadStorage(str(store), {"kb": 1})
+    payload = b"%PDF-1.4 " + b"x" * 300_000
+
+    async def run():
+        first = await storage.save(_upload(payload), str(public), "a.pdf", category="kb")
+        second = await storage.save(_upload(payload), str(public), "b.pdf", category="kb")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first["file_size"] == len(payload) and not first["deduplicated"]
+    assert second["deduplicated"] and second["sha256"] == first["sha256"]
+    assert (public / "b.pdf").read_bytes() == payload
+    # The public directory only holds the stored names; blobs and temp files live in the private store
+    assert sorted(os.listdir(public)) == ["a.pdf", "b.pdf"]
+    assert os.listdir(store / "blobs") == [first["sha256"]]
+    assert os.listdir(store / "tmp") == []
+    # Deleting one name leaves the other intact; the blob is pruned once nothing references it
+    os.remove(public / "a.pdf")
+    assert (public / "b.pdf").read_bytes() == payload
+    assert storage.prune_blobs() == 0
+    os.remove(public / "b.pdf")
+    assert storage.prune_blobs() == 1
+
+
+def test_save_rejects_oversized_upload_without_leaving_files(tmp_path):
+    storage = UploadStorage(str(tmp_path / "store"), {"leave": 1})
+    public = tmp_path / "uploads"
+    payload = b"y" * (1024 * 1024 + 1)
+
+    with pytest.raises(HTTPException) as exc:
+        # Size unknown up front: the limit is enforced while copying
+        asyncio.run(storage.save(_upload(payload), str(public), "big.pdf", category="leave"))
+    assert exc.value.status_code == 413
+    assert os.listdir(public) == [] and os.listdir(tmp_path / "store" / "tmp") == []
+
+    with pytest.raises(HTTPException):
+        asyncio.run(storage.save(_upload(payload, size=len(payload)), str(public), "big.pdf", category="leave"))
+
+
+def test_oversized_request_body_is_rejected_before_it_is_read(monkeypatch):
+    from backend.app import main
+
+    monkeypatch.setattr(main.upload_storage, "limits_mb", {"kb": 1, "leave": 1, "service": 1})
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/leave/upload", content=b"z" * (3 * 1024 * 1024))
+
+    resp = asyncio.run(run())
+    assert resp.status_code == 413 and "1 MB" in resp.json()["detail"]
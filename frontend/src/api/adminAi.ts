@@ -15,8 +15,12 @@ export interface AiModelApiItem {
   api_version?: string | null
   timeout_seconds: number
   quota_per_hour: number
+  max_concurrency?: number
+  rate_limit_per_minute?: number
+  priority?: number
   temperature?: number | null
   max_output_tokens?: number | null
+  context_window?: number
   enabled: boolean
   is_default: boolean
   created_at: string
@@ -34,8 +38,12 @@ export interface AiModelApiCreate {
   api_version?: string | null
   timeout_seconds: number
   quota_per_hour: number
+  max_concurrency?: number
+  rate_limit_per_minute?: number
+  priority?: number
   temperature?: number | null
   max_output_tokens?: number | null
+  context_window?: number
   enabled: boolean
   is_default: boolean
 }
@@ -79,6 +87,8 @@ export interface AiKbDocument {
   created_at: string
   updated_at?: string
   chunk_count?: number
+  ingest_status?: 'processing' | 'ready' | 'failed'
+  ingest_error?: string | null
 }
 
 export interface AiKbDocumentPreview {
@@ -127,6 +137,10 @@ export interface AiCustomerServiceSettings {
   system_prompt_template?: string | null
 }
 
+export interface AiSensitiveWords {
+  words: string[]
+}
+
 export interface AiKnowledgeBaseItem {
   id: number
   slug: string
@@ -271,6 +285,16 @@ export const adminAiApi = {
     return res.data
   },
 
+  // --------- 敏感词 ---------
+  async getSensitiveWords() {
+    const res = await axios.get<AiSensitiveWords>(`${BASE_URL}/sensitive-words`, { headers: authHeaders() })
+    return res.data
+  },
+  async updateSensitiveWords(words: string[]) {
+    const res = await axios.put<AiSensitiveWords>(`${BASE_URL}/sensitive-words`, { words }, { headers: authHeaders() })
+    return res.data
+  },
+
   // --------- AI 工作流：知识库 ---------
   async listWorkflowKnowledgeBases(feature?: string) {
     const res = await axios.get<AiKnowledgeBaseItem[]>(`${BASE_URL}/workflows/knowledge-bases`, {
@@ -54,6 +54,7 @@ export interface LessonPlanTask {
   status: string
   result?: string | null
   error_message?: string | null
+  attempts?: number
   knowledge_base_id?: number | null
   model_api_id?: number | null
   created_at: string
@@ -65,6 +66,18 @@ export interface LessonPlanTaskCreatePayload {
   title: string
   outline?: string
   course_id?: number
+  prompt?: string
+  model_api_id?: number
+}
+
+export interface LessonPlanTaskProgressEvent {
+  type: string
+  task_id: number
+  status: string
+  delta?: string
+  length?: number
+  message?: string
+  error_message?: string
 }
 
 export interface LessonPlanTaskResultPayload {
@@ -193,6 +206,14 @@ export const aiPortalApi = {
     const res = await axios.post<LessonPlanTask>('/ai/teacher/lesson-plan/tasks', payload, { headers: authHeaders() })
     return res.data
   },
+  async getLessonPlanTask(taskId: number) {
+    const res = await axios.get<LessonPlanTask>(`/ai/teacher/lesson-plan/tasks/${taskId}`, { headers: authHeaders() })
+    return res.data
+  },
+  async retryLessonPlanTask(taskId: number) {
+    const res = await axios.post<LessonPlanTask>(`/ai/teacher/lesson-plan/tasks/${taskId}/retry`, {}, { headers: authHeaders() })
+    return res.data
+  },
   async updateLessonPlanTaskResult(taskId: number, payload: LessonPlanTaskResultPayload) {
     const res = await axios.put<LessonPlanTask>(`/ai/teacher/lesson-plan/tasks/${taskId}/result`, payload, { headers: authHeaders() })
     return res.data